@@ -1,11 +1,19 @@
-from typing import List, Optional
+import functools
+from typing import List, Optional, Dict, Tuple, Set, Type, TypeVar
 
+from django.db import transaction
+from django.db.models import Model
 from django.utils import timezone
 
+from GuideToExile import build_snapshots
 from GuideToExile.data_classes import PobDetails
 from GuideToExile.models import BuildGuide, UniqueItem, Keystone, AscendancyClass, ActiveSkill, UserProfile
 from GuideToExile.skill_tree import SkillTreeService
 
+M = TypeVar('M', bound=Model)
+
+GUIDE_M2M_FIELDS = ('primary_skills', 'keystones', 'unique_items')
+
 
 def create_build_guide(author: UserProfile, pob_details: PobDetails, pob_string: str,
                        skill_tree_service: SkillTreeService, text: Optional[str] = None,
@@ -23,98 +31,102 @@ def create_build_guide(author: UserProfile, pob_details: PobDetails, pob_string:
 
 def assign_pob_details_to_guide(guide: BuildGuide, pob_details: PobDetails, pob_string: str,
                                 skill_tree_service: SkillTreeService) -> None:
-    asc_class = _get_asc_class(pob_details)
-    keystones = _get_or_create_keystones(pob_details, skill_tree_service)
-    unique_items = _get_or_create_unique_items(pob_details)
-    primary_active_skill = ActiveSkill.objects.get(name=pob_details.imported_primary_skill)
-    guide.primary_skills.add(primary_active_skill)
-    guide.ascendancy_class = asc_class
-    guide.keystones.set(keystones)
-    guide.unique_items.set(unique_items)
-    guide.pob_string = pob_string
-    guide.pob_details = pob_details
-    guide.save()
-
-
-def _get_asc_class(pob_details: PobDetails) -> AscendancyClass:
-    asc_name = pob_details.ascendancy_name
-    asc_name_id = AscendancyClass.AscClassName[asc_name.upper()]
-    base_class_name = pob_details.class_name
-    base_class_name_id = AscendancyClass.BaseClassName[base_class_name.upper()]
-    asc_class = AscendancyClass.objects.get(name=asc_name_id, base_class_name=base_class_name_id)
-
-    return asc_class
-
-
-def _get_or_create_unique_items(pob_details: PobDetails) -> List[UniqueItem]:
-    unique_items_names = [item.name for item in pob_details.items if item.rarity == 'UNIQUE']
-    unique_items = [UniqueItem.objects.get_or_create(name=name)[0] for name in unique_items_names]
-    for item in unique_items:
-        item.save()
-    return unique_items
-
-
-def _get_or_create_keystones(pob_details: PobDetails, skill_tree_service: SkillTreeService) -> List[Keystone]:
-    keystone_names = []
+    with transaction.atomic():
+        keystones = _get_or_create_by_names(Keystone, _get_keystone_names(pob_details, skill_tree_service))
+        unique_items = _get_or_create_by_names(UniqueItem, _get_unique_item_names(pob_details))
+        primary_active_skill = ActiveSkill.objects.get(name=pob_details.imported_primary_skill)
+        guide.primary_skills.add(primary_active_skill)
+        guide.ascendancy_class_id = _get_asc_class_id(pob_details)
+        guide.keystones.set(keystones)
+        guide.unique_items.set(unique_items)
+        guide.snapshot = build_snapshots.snapshot_for(pob_string, pob_details)
+        guide.save()
+
+
+def _get_asc_class_id(pob_details: PobDetails) -> int:
+    asc_name_id = AscendancyClass.AscClassName[pob_details.ascendancy_name.upper()]
+    base_class_name_id = AscendancyClass.BaseClassName[pob_details.class_name.upper()]
+    return _get_asc_class_ids()[(asc_name_id, base_class_name_id)]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_asc_class_ids() -> Dict[Tuple[int, int], int]:
+    """Ascendancy classes are fixed, loaded by a migration, so they are read once per process."""
+    return {(name, base_class_name): asc_class_id for asc_class_id, name, base_class_name in
+            AscendancyClass.objects.values_list('id', 'name', 'base_class_name')}
+
+
+def _get_unique_item_names(pob_details: PobDetails) -> Set[str]:
+    return {item.name for item in pob_details.items if item.rarity == 'UNIQUE'}
+
+
+def _get_keystone_names(pob_details: PobDetails, skill_tree_service: SkillTreeService) -> Set[str]:
+    keystone_names = set()
     for tree_spec in pob_details.tree_specs:
         all_nodes = skill_tree_service.skill_trees[tree_spec.tree_version].nodes
-        keystone_names.extend(all_nodes[node_id].name for node_id in tree_spec.nodes if
+        keystone_names.update(all_nodes[node_id].name for node_id in tree_spec.nodes if
                               node_id in all_nodes and all_nodes[node_id].is_keystone)
+    return keystone_names
 
-    keystones = [Keystone.objects.get_or_create(name=name)[0] for name in set(keystone_names)]
-    for keystone in keystones:
-        keystone.save()
-    return keystones
 
+def _get_or_create_by_names(model: Type[M], names: Set[str]) -> List[M]:
+    """Rows of a model identified by its unique name, the missing ones are created in one insert."""
+    if not names:
+        return []
+    existing = list(model.objects.filter(name__in=names))
+    if len(existing) < len(names):
+        found_names = {obj.name for obj in existing}
+        model.objects.bulk_create([model(name=name) for name in names - found_names], ignore_conflicts=True)
+        # ignore_conflicts leaves the new objects without ids, and some may have been inserted by another import
+        existing = list(model.objects.filter(name__in=names))
+    return existing
 
-def publish_guide(draft: BuildGuide) -> BuildGuide:
-    draft_guide_id = draft.guide_id
 
+def publish_guide(draft: BuildGuide) -> BuildGuide:
+    """Copies the draft over its public version, creating the public guide when the draft wasn't published yet."""
     now = timezone.now()
-    try:
-        public_guide_id = draft.public_version.guide_id
-        public_guide = draft
-        public_guide.guide_id = public_guide_id
-        public_guide.save()
-    except BuildGuide.DoesNotExist:
-        public_guide = draft
-        public_guide.creation_datetime = now
-        public_guide.guide_id = None
-        public_guide._state.adding = True
-        public_guide.save()
-
-    original_draft = BuildGuide.objects.get(guide_id=draft_guide_id)
-    public_guide.draft = original_draft
-    public_guide.primary_skills.set(original_draft.primary_skills.all())
-    public_guide.keystones.set(original_draft.keystones.all())
-    public_guide.author = original_draft.author
-    public_guide.status = BuildGuide.GuideStatus.PUBLIC
-    public_guide.unique_items.set(original_draft.unique_items.all())
-    if public_guide.creation_datetime != original_draft.creation_datetime:
-        original_draft.creation_datetime = public_guide.creation_datetime
-    public_guide.modification_datetime = now
-    public_guide.save()
-    original_draft.save()
+    with transaction.atomic():
+        public_guide_id = (BuildGuide.objects.filter(draft_id=draft.guide_id)
+                           .values_list('guide_id', flat=True).first())
+        public_guide = _copy_guide(draft, guide_id=public_guide_id, draft_id=draft.guide_id,
+                                   status=BuildGuide.GuideStatus.PUBLIC, modification_datetime=now)
+        if public_guide_id is None:
+            public_guide.creation_datetime = now
+            public_guide.save(force_insert=True)
+            BuildGuide.objects.filter(guide_id=draft.guide_id).update(creation_datetime=now)
+            draft.creation_datetime = now
+        else:
+            public_guide.save(force_update=True)
+        _copy_m2m_relations(draft.guide_id, public_guide.guide_id, replace=public_guide_id is not None)
     return public_guide
 
 
 def clear_draft(guide: BuildGuide) -> BuildGuide:
-    public_guide_id = guide.guide_id
-
-    draft = guide.draft
-    draft_id = draft.guide_id
-    draft = guide
-    draft.guide_id = draft_id
-    draft.draft = None
-    draft.save()
-
-    public_guide = BuildGuide.objects.get(guide_id=public_guide_id)
-    draft.public_version = public_guide
-    draft.primary_skills.set(public_guide.primary_skills.all())
-    draft.keystones.set(public_guide.keystones.all())
-    draft.status = BuildGuide.GuideStatus.DRAFT
-    draft.unique_items.set(public_guide.unique_items.all())
-    draft.author = public_guide.author
-    draft.save()
-
-    return public_guide
+    """Discards the changes made in the draft of a public guide by copying the public guide over it."""
+    with transaction.atomic():
+        draft = _copy_guide(guide, guide_id=guide.draft_id, draft_id=None, status=BuildGuide.GuideStatus.DRAFT)
+        draft.save(force_update=True)
+        _copy_m2m_relations(guide.guide_id, draft.guide_id, replace=True)
+    return guide
+
+
+def _copy_guide(guide: BuildGuide, **changed_values) -> BuildGuide:
+    values = {field.attname: getattr(guide, field.attname) for field in BuildGuide._meta.concrete_fields}
+    values.update(changed_values)
+    return BuildGuide(**values)
+
+
+def _copy_m2m_relations(source_guide_id: int, target_guide_id: int, replace: bool) -> None:
+    """Gives the target guide the same skills, keystones and unique items as the source, through rows are copied
+    with one bulk insert per relation."""
+    for field_name in GUIDE_M2M_FIELDS:
+        field = BuildGuide._meta.get_field(field_name)
+        through = field.remote_field.through
+        guide_column = through._meta.get_field(field.m2m_field_name()).attname
+        related_column = through._meta.get_field(field.m2m_reverse_field_name()).attname
+        related_ids = list(through.objects.filter(**{guide_column: source_guide_id})
+                           .values_list(related_column, flat=True))
+        if replace:
+            through.objects.filter(**{guide_column: target_guide_id}).delete()
+        through.objects.bulk_create([through(**{guide_column: target_guide_id, related_column: related_id})
+                                     for related_id in related_ids])
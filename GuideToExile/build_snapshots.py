@@ -0,0 +1,63 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Dict
+
+from django.db import transaction, IntegrityError
+from django.db.models import Exists, OuterRef, ProtectedError
+from django.utils import timezone
+
+from GuideToExile import json_encoder, item_html_store
+from GuideToExile.data_classes import PobDetails
+from GuideToExile.models import BuildSnapshot, BuildGuide
+
+logger = logging.getLogger('guidetoexile')
+
+
+def snapshot_key(pob_string: str, sections: Dict[str, dict]) -> str:
+    snapshot_hash = hashlib.sha256(pob_string.encode('utf-8'))
+    for section in json_encoder.POB_DETAILS_SECTIONS:
+        section_json = json.dumps(sections[section], cls=json_encoder.BuildDetailsJsonEncoder, sort_keys=True)
+        snapshot_hash.update(section_json.encode('utf-8'))
+    return snapshot_hash.hexdigest()
+
+
+def get_or_create_snapshot(pob_string: str, sections: Dict[str, dict]) -> BuildSnapshot:
+    """The snapshot with this content, an existing one is marked as used so it isn't garbage collected meanwhile."""
+    key = snapshot_key(pob_string, sections)
+    snapshot = BuildSnapshot(key=key, pob_string=pob_string,
+                             **{f'pob_{section}': values for section, values in sections.items()})
+    if not BuildSnapshot.objects.filter(key=key).update(last_used=timezone.now()):
+        BuildSnapshot.objects.bulk_create([snapshot], ignore_conflicts=True)
+    return snapshot
+
+
+def snapshot_for(pob_string: str, pob_details: PobDetails) -> BuildSnapshot:
+    item_html_store.store_items_html(item_html_store.iter_gear_items(pob_details.items, pob_details.item_sets,
+                                                                     pob_details.used_jewels))
+    return get_or_create_snapshot(pob_string, json_encoder.split_pob_details(pob_details))
+
+
+def with_summary_changes(snapshot: BuildSnapshot, **changed_values) -> BuildSnapshot:
+    """A snapshot of the same build with some of the summary fields changed, snapshots themselves are immutable."""
+    sections = {section: getattr(snapshot, f'pob_{section}') for section in json_encoder.POB_DETAILS_SECTIONS}
+    sections['summary'] = {**sections['summary'], **changed_values}
+    return get_or_create_snapshot(snapshot.pob_string, sections)
+
+
+def collect_garbage(unused_since: datetime, dry_run: bool = False) -> int:
+    # checked again by the delete itself, a guide may start pointing at a snapshot since it was counted
+    unused = BuildSnapshot.objects.filter(~Exists(BuildGuide.objects.filter(snapshot=OuterRef('pk'))),
+                                          last_used__lt=unused_since)
+    if dry_run:
+        return unused.count()
+    try:
+        with transaction.atomic():
+            deleted, _ = unused.delete()
+    except (ProtectedError, IntegrityError):
+        # a guide started pointing at one of them while they were being deleted, they are collected next time
+        logger.warning('Build snapshots got used while being collected, none were deleted', exc_info=True)
+        return 0
+    logger.info('Deleted %s unused build snapshots', deleted)
+    return deleted
@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from GuideToExile.exceptions import MissingFixtureException
+
+logger = logging.getLogger('guidetoexile')
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class Crawler:
+    """Fetches pages with up to `concurrency` requests in flight, reusing one session per host.
+
+    Responses are saved in cache_dir and reused for cache_ttl seconds. In replay mode pages are read only from
+    cache_dir, whatever their age, so a crawl saved once can be re-run offline.
+    """
+
+    def __init__(self, cache_dir: str, concurrency: int = 8, cache_ttl: Optional[float] = None, replay: bool = False,
+                 session_factory: Callable[[str], requests.Session] = None, timeout=(3.05, 30)):
+        self.cache_dir = cache_dir
+        self.concurrency = concurrency
+        self.cache_ttl = cache_ttl
+        self.replay = replay
+        self.session_factory = session_factory or (lambda host: requests.Session())
+        self.timeout = timeout
+        self.requests = 0
+        self.cache_hits = 0
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='crawler')
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def fetch(self, url: str) -> bytes:
+        cache_path = self._cache_path(url)
+        if self._is_cached(cache_path):
+            with open(cache_path, 'rb') as f:
+                content = f.read()
+            with self._lock:
+                self.cache_hits += 1
+            return content
+        if self.replay:
+            raise MissingFixtureException(f'No saved response for {url} in {self.cache_dir}')
+
+        response = self._session_for(url).get(url, timeout=self.timeout)
+        response.raise_for_status()
+        with self._lock:
+            self.requests += 1
+        tmp_path = f'{cache_path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(response.content)
+        os.replace(tmp_path, cache_path)
+        return response.content
+
+    def fetch_many(self, urls: Iterable[str]) -> List[Optional[bytes]]:
+        return self.map(self.fetch, urls)
+
+    def map(self, fn: Callable[[T], R], items: Iterable[T]) -> List[Optional[R]]:
+        """fn applied to every item concurrently, None in place of the results that failed."""
+        futures = [self._executor.submit(fn, item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as err:
+                logger.warning('Crawler task failed: %r', err)
+                results.append(None)
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'requests': self.requests, 'cache_hits': self.cache_hits}
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        for session in self._sessions.values():
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _session_for(self, url: str) -> requests.Session:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                session = self.session_factory(host)
+                session.mount('https://', HTTPAdapter(pool_maxsize=self.concurrency))
+                self._sessions[host] = session
+            return self._sessions[host]
+
+    def _cache_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def _is_cached(self, cache_path: str) -> bool:
+        try:
+            modified = os.path.getmtime(cache_path)
+        except FileNotFoundError:
+            return False
+        return self.replay or self.cache_ttl is None or time.time() - modified < self.cache_ttl
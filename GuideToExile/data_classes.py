@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import Union, Optional, List, Dict, Tuple
+from typing import Union, Optional, List, Dict, Tuple, FrozenSet
 
 from GuideToExile import items_service
 
@@ -16,10 +16,18 @@ class SkillGem:
     alt_quality_pref: str = field(default='')
     is_item_provided: bool = field(default=False)
     is_fake: bool = field(default=False)
+    asset_path: Optional[str] = field(default=None)
+
+    def __post_init__(self):
+        if self.asset_path is None:
+            self.asset_path = assetService.get_asset_name_for_gem(self.name)
 
     @property
     def asset(self):
-        return assetService.get_asset_name_for_gem(self.name)
+        # guides imported before asset paths were stored don't have one
+        if self.asset_path is None:
+            return assetService.get_asset_name_for_gem(self.name)
+        return self.asset_path
 
 
 @dataclass
@@ -47,13 +55,23 @@ class Item:
     name: str
     base_name: str
     rarity: str
-    display_html: str
+    # left out of stored guides once display_html_key is set, the HTML itself is kept in the ItemHtml table
+    display_html: Optional[str] = field(metadata={'key_field': 'display_html_key'})
     support_gems: List[SkillGem]
     is_broken: bool = field(default=False)
+    asset_path: Optional[str] = field(default=None)
+    display_html_key: Optional[str] = field(default=None)
+
+    def __post_init__(self):
+        if self.asset_path is None:
+            self.asset_path = assetService.get_asset_name_for_gear(self)
 
     @property
     def asset(self):
-        return assetService.get_asset_name_for_gear(self)
+        # guides imported before asset paths were stored don't have one
+        if self.asset_path is None:
+            return assetService.get_asset_name_for_gear(self)
+        return self.asset_path
 
 
 @dataclass
@@ -135,8 +153,22 @@ class SkillTree:
     skills_per_orbit: List[int]
     orbit_radii: List[int]
     mastery_effects: Dict[str, List[str]]
+    # indexes built from the fields above
+    node_groups_by_node: Dict[str, NodeGroup] = field(init=False, repr=False)
+    node_ascendancies: Dict[str, str] = field(init=False, repr=False)
+    adjacent_nodes: Dict[str, FrozenSet[str]] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.node_groups_by_node = {node_id: group for group in self.node_groups.values()
+                                    for node_id in group.node_ids}
+        self.node_ascendancies = {node_id: node.ascendancy_name for node_id, node in self.nodes.items()}
+        adjacent_nodes = {node_id: set() for node_id in self.nodes}
+        for node_id, node in self.nodes.items():
+            for connected_node_id in node.connected_out_nodes + node.connected_in_nodes:
+                if connected_node_id in adjacent_nodes:
+                    adjacent_nodes[node_id].add(connected_node_id)
+                    adjacent_nodes[connected_node_id].add(node_id)
+        self.adjacent_nodes = {node_id: frozenset(connected) for node_id, connected in adjacent_nodes.items()}
 
     def find_group_containing_node(self, node_id):
-        for group in self.node_groups.values():
-            if node_id in group.node_ids:
-                return group
+        return self.node_groups_by_node.get(node_id)
@@ -0,0 +1,40 @@
+import logging
+import threading
+from typing import Dict, Type
+
+from django.db import models
+
+logger = logging.getLogger('guidetoexile')
+
+
+class DbLruCache:
+    """Hit counting and least recently used eviction for caches stored in a table with `key` and `last_used`."""
+    model: Type[models.Model]
+    # what the entries are, for the eviction log
+    entries_name: str
+
+    def __init__(self, pob_version: str, max_entries: int):
+        self.pob_version = pob_version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_ratio': self.hits / total if total else 0.0}
+
+    def _count_lookups(self, hit_count: int, lookup_count: int) -> None:
+        with self._lock:
+            self.hits += hit_count
+            self.misses += lookup_count - hit_count
+
+    def _evict_least_recently_used(self) -> None:
+        oldest_kept = (self.model.objects.order_by('-last_used')
+                       .values_list('last_used', flat=True)[self.max_entries:self.max_entries + 1])
+        if oldest_kept:
+            deleted, _ = self.model.objects.filter(last_used__lte=oldest_kept[0]).delete()
+            logger.info('Evicted %s %s from cache', deleted, self.entries_name)
@@ -16,3 +16,19 @@ class BuildXmlParsingException(Exception):
 
 class BuildWithoutActiveSkillException(Exception):
     pass
+
+
+class PobXmlTooLargeException(Exception):
+    pass
+
+
+class MissingFixtureException(Exception):
+    pass
+
+
+class UnsupportedSchemaVersionException(Exception):
+    pass
+
+
+class ImportJobTimeoutException(Exception):
+    pass
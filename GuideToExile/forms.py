@@ -10,8 +10,8 @@ from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import ValidationError
 from django.forms import Form, ModelForm, Select
 
-from GuideToExile import pob_import
-from GuideToExile.exceptions import BuildWithoutActiveSkillException
+from GuideToExile import pastebin
+from GuideToExile.exceptions import PastebinImportException
 from GuideToExile.models import UserProfile, AscendancyClass, ActiveSkill, Keystone, UniqueItem
 from apps.django_tiptap.widgets import TipTapWidget
 
@@ -20,6 +20,7 @@ logger = logging.getLogger('guidetoexile')
 URL_REGEX = re.compile(
     r'''(https?:\/\/)(\s)*(www\.)?(\s)*((\w|\s)+\.)*([\w\-\s]+\/)*([\w\-]+)(\/)?(\.html)?((\?)?[\w\s]*=\s*[\w\%&]*)*''',
     flags=re.MULTILINE)
+POB_CODE_REGEX = re.compile(r'[A-Za-z0-9_\-+/=]+')
 
 
 class SignUpForm(UserCreationForm):
@@ -58,18 +59,16 @@ class PobStringForm(Form):
                                 widget=forms.TextInput(attrs={'class': ' form-control'}))
 
     def clean_pob_input(self):
-        data = self.cleaned_data['pob_input']
-        try:
-            if data.startswith('https://pastebin.com'):
-                data = pob_import.import_from_pastebin(data)
-
-            xml = pob_import.base64_to_xml(data)
-            return pob_import.parse_pob_details(xml), data
-        except BuildWithoutActiveSkillException:
-            raise ValidationError('At least one active skill required', code='missing active skill')
-        except Exception as err:
-            logger.error('Something went wrong while importing a build', exc_info=True)
+        # only a sanity check, the build is fetched and parsed later by the import worker
+        data = self.cleaned_data['pob_input'].strip()
+        if data.startswith('https://pastebin.com'):
+            try:
+                pastebin.paste_id_from_url(data)
+            except PastebinImportException:
+                raise ValidationError('Invalid Pastebin link', code='invalid_pob_string')
+        elif not POB_CODE_REGEX.fullmatch(data):
             raise ValidationError('Invalid export code or Pastebin link', code='invalid_pob_string')
+        return data
 
 
 class EditGuideForm(Form):
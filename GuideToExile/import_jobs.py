@@ -0,0 +1,163 @@
+import binascii
+import logging
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta, datetime
+from typing import Optional, Dict
+
+import requests
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from GuideToExile import pob_import, build_guide, pastebin
+from GuideToExile.exceptions import BuildWithoutActiveSkillException, PastebinImportException, \
+    BuildXmlParsingException, PobXmlTooLargeException, ImportJobTimeoutException
+from GuideToExile.models import PobImportJob, UserProfile, BuildGuide
+from GuideToExile.settings import IMPORT_JOB_MAX_ATTEMPTS, IMPORT_JOB_RETRY_DELAY, IMPORT_JOB_TIMEOUT
+from GuideToExile.skill_tree import SkillTreeService
+from apps.pob_wrapper import PoolTimeoutError
+
+logger = logging.getLogger('guidetoexile')
+
+INVALID_INPUT_MESSAGE = 'Invalid export code or Pastebin link'
+MISSING_ACTIVE_SKILL_MESSAGE = 'At least one active skill required'
+TOO_LARGE_MESSAGE = 'This build is too large to import'
+TIMED_OUT_MESSAGE = 'Import took too long, please try again later'
+UNEXPECTED_ERROR_MESSAGE = 'Something went wrong while importing the build, please try again later'
+
+# bad input, retrying won't help
+INVALID_INPUT_ERRORS = (PastebinImportException, BuildXmlParsingException, binascii.Error, zlib.error,
+                        UnicodeDecodeError)
+# PoB or Pastebin being slow or unavailable, worth another attempt
+TRANSIENT_ERRORS = (PoolTimeoutError, TimeoutError, EOFError, requests.ConnectionError, requests.Timeout)
+
+
+def enqueue_import(author: UserProfile, pob_input: str, guide: Optional[BuildGuide] = None) -> PobImportJob:
+    job = PobImportJob.objects.create(author=author, guide=guide, pob_input=pob_input)
+    logger.info('Queued PoB import job=%s guide=%s', job.job_id, guide.guide_id if guide else None)
+    return job
+
+
+def claim_next_job() -> Optional[PobImportJob]:
+    """Marks the oldest job that is due as running and returns it, None if there is nothing to do.
+
+    Claiming is a conditional update, so several workers can poll the same table.
+    """
+    _requeue_timed_out_jobs()
+    now = timezone.now()
+    candidate_ids = (PobImportJob.objects
+                     .filter(status=PobImportJob.JobStatus.QUEUED, run_after__lte=now)
+                     .order_by('run_after', 'job_id')
+                     .values_list('job_id', flat=True)[:10])
+    for job_id in candidate_ids:
+        claimed = (PobImportJob.objects
+                   .filter(job_id=job_id, status=PobImportJob.JobStatus.QUEUED)
+                   .update(status=PobImportJob.JobStatus.RUNNING, started_datetime=now, attempts=F('attempts') + 1))
+        if claimed:
+            return PobImportJob.objects.select_related('author', 'guide').get(job_id=job_id)
+    return None
+
+
+def run_job(job: PobImportJob, skill_tree_service: SkillTreeService) -> None:
+    stage_timings = {}
+    deadline = job.started_datetime + timedelta(seconds=IMPORT_JOB_TIMEOUT)
+    try:
+        pob_string = job.pob_input
+        if pob_string.startswith('https://pastebin.com'):
+            with _timed_stage(stage_timings, 'fetch', deadline):
+                pob_string = pastebin.fetch_paste(pob_string)
+        # the export code is inflated while it's being parsed, so both count as one stage
+        with _timed_stage(stage_timings, 'parse', deadline):
+            pob_details = pob_import.get_or_parse_pob_string(pob_string)
+        with transaction.atomic():
+            with _timed_stage(stage_timings, 'save', deadline):
+                if job.guide is None:
+                    guide = build_guide.create_build_guide(job.author, pob_details, pob_string, skill_tree_service)
+                else:
+                    guide = job.guide
+                    build_guide.assign_pob_details_to_guide(guide, pob_details, pob_string, skill_tree_service)
+            # the guide is kept only if the job wasn't handed to another worker in the meantime
+            if not _finish(job, stage_timings, status=PobImportJob.JobStatus.DONE, guide=guide):
+                transaction.set_rollback(True)
+                return
+        logger.info('Finished PoB import job=%s guide=%s in %s', job.job_id, guide.guide_id, stage_timings)
+    except BuildWithoutActiveSkillException:
+        _fail(job, stage_timings, MISSING_ACTIVE_SKILL_MESSAGE)
+    except PobXmlTooLargeException:
+        _fail(job, stage_timings, TOO_LARGE_MESSAGE)
+    except INVALID_INPUT_ERRORS:
+        logger.info('Invalid PoB input in job=%s', job.job_id, exc_info=True)
+        _fail(job, stage_timings, INVALID_INPUT_MESSAGE)
+    except requests.HTTPError as err:
+        if err.response is not None and err.response.status_code == 404:
+            _fail(job, stage_timings, INVALID_INPUT_MESSAGE)
+        else:
+            _retry_or_fail(job, stage_timings, err)
+    except ImportJobTimeoutException as err:
+        _retry_or_fail(job, stage_timings, err, TIMED_OUT_MESSAGE)
+    except TRANSIENT_ERRORS as err:
+        _retry_or_fail(job, stage_timings, err)
+    except Exception as err:
+        logger.error('Something went wrong while importing a build, job=%s', job.job_id, exc_info=True)
+        _retry_or_fail(job, stage_timings, err)
+
+
+def _fail(job: PobImportJob, stage_timings: Dict[str, float], error_message: str) -> None:
+    _finish(job, stage_timings, status=PobImportJob.JobStatus.FAILED, error_message=error_message)
+
+
+def _retry_or_fail(job: PobImportJob, stage_timings: Dict[str, float], err: Exception,
+                   error_message: str = UNEXPECTED_ERROR_MESSAGE) -> None:
+    if job.attempts >= IMPORT_JOB_MAX_ATTEMPTS:
+        logger.warning('Giving up on PoB import job=%s after %s attempts: %r', job.job_id, job.attempts, err)
+        _fail(job, stage_timings, error_message)
+        return
+    logger.warning('Retrying PoB import job=%s after attempt %s: %r', job.job_id, job.attempts, err)
+    _update_claimed_job(job, status=PobImportJob.JobStatus.QUEUED, stage_timings=stage_timings,
+                        run_after=timezone.now() + timedelta(seconds=IMPORT_JOB_RETRY_DELAY * job.attempts))
+
+
+def _finish(job: PobImportJob, stage_timings: Dict[str, float], **fields) -> bool:
+    return _update_claimed_job(job, stage_timings=stage_timings, finished_datetime=timezone.now(), **fields)
+
+
+def _update_claimed_job(job: PobImportJob, **fields) -> bool:
+    """Saves the outcome of an attempt, unless the job timed out and was claimed again since this attempt started.
+
+    Conditional like claiming, so a late worker can't overwrite the attempt that replaced it.
+    """
+    updated = (PobImportJob.objects
+               .filter(job_id=job.job_id, status=PobImportJob.JobStatus.RUNNING, attempts=job.attempts)
+               .update(**fields))
+    if not updated:
+        logger.warning('Dropping outcome of PoB import job=%s attempt %s, it was claimed again',
+                       job.job_id, job.attempts)
+        return False
+    for field_name, value in fields.items():
+        setattr(job, field_name, value)
+    return True
+
+
+def _requeue_timed_out_jobs() -> None:
+    deadline = timezone.now() - timedelta(seconds=IMPORT_JOB_TIMEOUT)
+    timed_out = PobImportJob.objects.filter(status=PobImportJob.JobStatus.RUNNING, started_datetime__lt=deadline)
+    timed_out.filter(attempts__gte=IMPORT_JOB_MAX_ATTEMPTS).update(status=PobImportJob.JobStatus.FAILED,
+                                                                   error_message=TIMED_OUT_MESSAGE,
+                                                                   finished_datetime=timezone.now())
+    requeued_count = timed_out.update(status=PobImportJob.JobStatus.QUEUED, run_after=timezone.now())
+    if requeued_count:
+        logger.warning('Requeued %s timed out PoB import jobs', requeued_count)
+
+
+@contextmanager
+def _timed_stage(stage_timings: Dict[str, float], stage: str, deadline: datetime):
+    """Records how long a stage took, the job is given up once a stage ends after its deadline."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+    if timezone.now() > deadline:
+        raise ImportJobTimeoutException(f'{stage} stage ended after the {IMPORT_JOB_TIMEOUT}s job timeout')
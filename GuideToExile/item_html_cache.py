@@ -0,0 +1,36 @@
+import hashlib
+from typing import Dict, List, Optional
+
+from django.utils import timezone
+
+from GuideToExile.db_lru_cache import DbLruCache
+from GuideToExile.models import RenderedItemHtml
+
+# lines that differ between copies of the same item, but don't change how PoB displays it
+IGNORED_LINE_PREFIXES = ('Unique ID:',)
+
+
+class ItemHtmlCache(DbLruCache):
+    """Rendered item HTML, keyed by a hash of the normalised item text and the PoB version that rendered it."""
+    model = RenderedItemHtml
+    entries_name = 'rendered items'
+
+    def key_for(self, item_text: str) -> str:
+        lines = (line.strip() for line in item_text.splitlines())
+        normalised_text = '\n'.join(line for line in lines if line and not line.startswith(IGNORED_LINE_PREFIXES))
+        return hashlib.sha256(f'{self.pob_version}\n{normalised_text}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        found = dict(RenderedItemHtml.objects.filter(key__in=set(keys)).values_list('key', 'html'))
+        if found:
+            RenderedItemHtml.objects.filter(key__in=found.keys()).update(last_used=timezone.now())
+        self._count_lookups(sum(1 for key in keys if key in found), len(keys))
+        return found
+
+    def set_many(self, items_html: Dict[str, Optional[str]]) -> None:
+        if not items_html:
+            return
+        now = timezone.now()
+        RenderedItemHtml.objects.bulk_create([RenderedItemHtml(key=key, html=html, last_used=now)
+                                              for key, html in items_html.items()], ignore_conflicts=True)
+        self._evict_least_recently_used()
@@ -0,0 +1,40 @@
+import hashlib
+from typing import Dict, Iterable, Iterator, List
+
+from GuideToExile.data_classes import Item, ItemSet
+from GuideToExile.models import ItemHtml
+
+
+def html_key(html: str) -> str:
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def iter_gear_items(items: List[Item], item_sets: List[ItemSet], used_jewels: Dict[str, List[Item]]) -> Iterator[Item]:
+    """Every Item of a build, item sets and jewels hold their own copies of them once decoded."""
+    yield from items
+    for item_set in item_sets:
+        yield from item_set.slots.values()
+    for jewels in used_jewels.values():
+        yield from jewels
+
+
+def store_items_html(items: Iterable[Item]) -> None:
+    """Saves the HTML of the items once per distinct content, the items get its key to be stored with instead."""
+    new_html = {}
+    for item in items:
+        if item.display_html_key is None and item.display_html:
+            item.display_html_key = html_key(item.display_html)
+            new_html[item.display_html_key] = item.display_html
+    ItemHtml.objects.bulk_create([ItemHtml(key=key, html=html) for key, html in new_html.items()],
+                                 ignore_conflicts=True)
+
+
+def load_items_html(items: Iterable[Item]) -> None:
+    """Fills in display_html of items that were stored with only its key, with one query."""
+    items_without_html = [item for item in items if item.display_html is None and item.display_html_key]
+    if not items_without_html:
+        return
+    keys = {item.display_html_key for item in items_without_html}
+    html_by_key = dict(ItemHtml.objects.filter(key__in=keys).values_list('key', 'html'))
+    for item in items_without_html:
+        item.display_html = html_by_key.get(item.display_html_key)
@@ -2,18 +2,30 @@ from __future__ import annotations
 
 import copy
 import json
+import logging
+import os
+import pickle
 import re
+import threading
 from collections import defaultdict
-from typing import List
+from dataclasses import dataclass
+from typing import List, Dict, FrozenSet, Optional
 
 from django.contrib.staticfiles import finders
 
-from GuideToExile.settings import ASSET_DIR, BASE_ITEMS_LOOKUP_FILE, UNIQUE_ITEMS_LOOKUP_FILE, GEMS_FILE
+from GuideToExile.settings import ASSET_DIR, BASE_ITEMS_LOOKUP_FILE, UNIQUE_ITEMS_LOOKUP_FILE, GEMS_FILE, \
+    GEM_INDEX_FILE
+
+logger = logging.getLogger('guidetoexile')
 
 PARENTHESIS_REGEX = re.compile(r"\(.*\)")
 
+# bump when GemIndex changes, so compiled indexes are not unpickled into a stale class
+GEM_INDEX_FORMAT_VERSION = 1
+
 
 class AssetsService:
+    """Asset paths by normalised item and gem name, the names are normalised once when the lookup files are loaded."""
 
     def __init__(self):
         base_items_lookup_file = finders.find(BASE_ITEMS_LOOKUP_FILE)
@@ -24,37 +36,43 @@ class AssetsService:
             for details in data.values():
                 for name in details['names'].values():
                     if 'artName' in details:
-                        self.mapping[name.lower()] = f'{ASSET_DIR}/{details["artName"]}.png'
+                        self.mapping[_normalise_name(name)] = f'{ASSET_DIR}/{details["artName"]}.png'
 
         with open(unique_items_lookup_file, 'r', encoding='utf-8') as file:
             data = json.load(file, object_pairs_hook=_dict_skip_duplicates)
             for lang in data.values():
                 for name, art_name in lang.items():
-                    self.mapping[name.lower()] = f'{ASSET_DIR}/{art_name}.png'
+                    self.mapping[_normalise_name(name)] = f'{ASSET_DIR}/{art_name}.png'
 
     def get_asset_name_for_gem(self, gem_name: str) -> str:
-        return self.mapping.get(gem_name.lower(), '')
+        return self.mapping.get(_normalise_name(gem_name), '')
 
     def get_asset_name_for_gear(self, item: Item) -> str:
-        if item.rarity in ['UNIQUE', 'RELIC']:
-            return self.mapping.get(item.name.lower(), '')
-        if item.rarity == 'RARE':
-            base_name = PARENTHESIS_REGEX.sub('', item.base_name).strip().lower()
-            return self.mapping.get(base_name, '')
-
-        # hacks for dealing with prefix and suffix
-        base_name = item.base_name.lower()
-        if x := self.mapping.get(base_name, ''):
-            return x
-        prefixless_name = base_name.split(' ', maxsplit=1)[1]
-        if x := self.mapping.get(prefixless_name, ''):
-            return x
-        suffixless_name = base_name.split(' of ')[0]
-        if x := self.mapping.get(suffixless_name, ''):
-            return x
-        stripped_name = prefixless_name.split(' of ')[0]
-        if x := self.mapping.get(stripped_name, ''):
-            return x
+        for name in _gear_name_variants(item.rarity, item.name, item.base_name):
+            if x := self.mapping.get(name, ''):
+                return x
+        return ''
+
+
+def _normalise_name(name: str) -> str:
+    return name.lower()
+
+
+def _gear_name_variants(rarity: str, name: str, base_name: str) -> List[str]:
+    """Names an item's art could be listed under, most specific first."""
+    if rarity in ['UNIQUE', 'RELIC']:
+        return [_normalise_name(name)]
+    if rarity == 'RARE':
+        return [_normalise_name(PARENTHESIS_REGEX.sub('', base_name).strip())]
+
+    # hacks for dealing with prefix and suffix
+    base_name = _normalise_name(base_name)
+    suffixless_name = base_name.split(' of ')[0]
+    if ' ' not in base_name:
+        return [base_name, suffixless_name]
+    prefixless_name = base_name.split(' ', maxsplit=1)[1]
+    stripped_name = prefixless_name.split(' of ')[0]
+    return [base_name, prefixless_name, suffixless_name, stripped_name]
 
 
 def _dict_skip_duplicates(ordered_pairs):
@@ -94,41 +112,92 @@ def assign_skills_to_items(item_sets: List[ItemSet], skill_groups: List[SkillGro
 
 
 class GemsData:
-    def __init__(self):
-        self.gem_id_to_name_mapping = {}
-        self.skill_id_to_name_mapping = {}
-        self.active_skill_gems = []
-        gems_file = finders.find(GEMS_FILE)
-        with open(gems_file, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            self._init_name_mappings(data)
-            self._init_active_skill_gems(data)
-
-    def _init_name_mappings(self, data):
-        for key, details in data.items():
-            if 'active_skill' in details:
-                self.skill_id_to_name_mapping[key] = details['active_skill']['display_name']
-            elif 'base_item' in details and details['base_item'] is not None:
-                self.skill_id_to_name_mapping[key] = details['base_item']['display_name']
-            else:
-                self.skill_id_to_name_mapping[key] = 'None'
-            if 'base_item' in details and details['base_item'] is not None:
-                self.gem_id_to_name_mapping[key] = details['base_item']['id']
-
-    def _init_active_skill_gems(self, data):
-        for key, details in data.items():
-            if not details.get('is_support', True):
-                self.active_skill_gems.append(key)
-            elif 'secondary_granted_effect' in details:
-                granted_skill = details['secondary_granted_effect']
-                if not data[granted_skill].get('is_support', True):
-                    self.active_skill_gems.append(key)
+    """Gem names and active gems by skill id, loaded on first use.
+
+    Read from the index compiled with `manage.py compile_gem_index` when it's up to date, from gems.min.json otherwise.
+    """
+
+    def __init__(self, index_file: Optional[str] = None):
+        self.index_file = index_file or GEM_INDEX_FILE
+        self._index: Optional[GemIndex] = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self) -> GemIndex:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = _load_gem_index(finders.find(GEMS_FILE), self.index_file)
+        return self._index
 
     def get_name(self, skill_id: int, gem_id) -> str:
-        if skill_id in self.skill_id_to_name_mapping:
-            return self.skill_id_to_name_mapping[skill_id]
+        index = self.index
+        if skill_id in index.skill_id_to_name_mapping:
+            return index.skill_id_to_name_mapping[skill_id]
         else:
-            return self.gem_id_to_name_mapping.get(gem_id, f'Unknown skill {skill_id}')
+            return index.gem_id_to_name_mapping.get(gem_id, f'Unknown skill {skill_id}')
 
     def is_gem_active(self, skill_id):
-        return skill_id in self.active_skill_gems
+        return skill_id in self.index.active_skill_gems
+
+
+@dataclass(frozen=True)
+class GemIndex:
+    skill_id_to_name_mapping: Dict[str, str]
+    gem_id_to_name_mapping: Dict[str, str]
+    active_skill_gems: FrozenSet[str]
+
+
+def compile_gem_index(gems_file: str, index_file: str) -> GemIndex:
+    gem_index = _read_gems_file(gems_file)
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+    tmp_path = f'{index_file}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump((GEM_INDEX_FORMAT_VERSION, gem_index), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, index_file)
+    return gem_index
+
+
+def _load_gem_index(gems_file: str, index_file: str) -> GemIndex:
+    try:
+        if os.path.getmtime(index_file) >= os.path.getmtime(gems_file):
+            with open(index_file, 'rb') as f:
+                format_version, gem_index = pickle.load(f)
+            if format_version == GEM_INDEX_FORMAT_VERSION:
+                return gem_index
+        logger.warning('Gem index %s is outdated, reading %s', index_file, gems_file)
+    except FileNotFoundError:
+        logger.info('No gem index in %s, reading %s', index_file, gems_file)
+    except Exception:
+        logger.warning('Unable to read gem index %s', index_file, exc_info=True)
+    return _read_gems_file(gems_file)
+
+
+def _read_gems_file(gems_file: str) -> GemIndex:
+    with open(gems_file, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+
+    skill_id_to_name_mapping = {}
+    gem_id_to_name_mapping = {}
+    for key, details in data.items():
+        if 'active_skill' in details:
+            skill_id_to_name_mapping[key] = details['active_skill']['display_name']
+        elif 'base_item' in details and details['base_item'] is not None:
+            skill_id_to_name_mapping[key] = details['base_item']['display_name']
+        else:
+            skill_id_to_name_mapping[key] = 'None'
+        if 'base_item' in details and details['base_item'] is not None:
+            gem_id_to_name_mapping[key] = details['base_item']['id']
+
+    active_skill_gems = set()
+    for key, details in data.items():
+        if not details.get('is_support', True):
+            active_skill_gems.add(key)
+        elif 'secondary_granted_effect' in details:
+            granted_skill = details['secondary_granted_effect']
+            if not data[granted_skill].get('is_support', True):
+                active_skill_gems.add(key)
+
+    return GemIndex(skill_id_to_name_mapping=skill_id_to_name_mapping,
+                    gem_id_to_name_mapping=gem_id_to_name_mapping,
+                    active_skill_gems=frozenset(active_skill_gems))
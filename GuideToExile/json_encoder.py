@@ -1,26 +1,194 @@
+import dataclasses
 import json
+import typing
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
 
-import jsonpickle
+from jsonpickle.unpickler import Unpickler
 
 from GuideToExile.data_classes import PobDetails
+from GuideToExile.exceptions import UnsupportedSchemaVersionException
+
+# bump when a change to the data classes needs stored guides to be read differently
+POB_DETAILS_SCHEMA_VERSION = 2
+# version 1 differs only by always having the item HTML inline
+READABLE_SCHEMA_VERSIONS = (1, 2)
+SCHEMA_VERSION_KEY = 'schema_version'
+LEGACY_OBJECT_KEY = 'py/object'
+SECTION_KEY = 'section'
+# PobDetails fields stored together, grouped by the guide tab that shows them
+POB_DETAILS_SECTIONS = {
+    'summary': ('build_stats', 'class_name', 'ascendancy_name', 'main_active_skills', 'imported_primary_skill'),
+    'skill_groups': ('skill_groups',),
+    'tree': ('tree_specs', 'active_tree_spec_index'),
+    'gear': ('items', 'item_sets', 'active_item_set_id', 'used_jewels'),
+}
+
+Codec = Optional[Callable[[Any], Any]]
+
+_codecs: Dict[Any, Tuple[Codec, Codec]] = {}
+_field_codecs: Dict[type, Dict[str, Tuple[Codec, Codec]]] = {}
+
+
+def encode_pob_details(pob_details: PobDetails) -> dict:
+    encode, _ = _codecs_for(PobDetails)
+    return {SCHEMA_VERSION_KEY: POB_DETAILS_SCHEMA_VERSION, **encode(pob_details)}
+
+
+def decode_pob_details(obj: dict) -> PobDetails:
+    if LEGACY_OBJECT_KEY in obj:
+        # guides saved before the schema was introduced were pickled by jsonpickle
+        pob_details = Unpickler().restore(obj)
+        _fill_missing_fields(pob_details)
+        return pob_details
+    _check_schema_version(obj)
+    _, decode = _codecs_for(PobDetails)
+    return decode(obj)
+
+
+def _fill_missing_fields(obj) -> None:
+    """Gives restored objects the fields added to their class after they were pickled, jsonpickle doesn't call
+    __init__ so they would have neither the value nor, for default_factory fields, a class attribute to fall back to."""
+    if isinstance(obj, (list, tuple)):
+        for value in obj:
+            _fill_missing_fields(value)
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _fill_missing_fields(value)
+    elif dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        for field in dataclasses.fields(obj):
+            if field.name in obj.__dict__:
+                _fill_missing_fields(obj.__dict__[field.name])
+            elif field.default is not dataclasses.MISSING:
+                setattr(obj, field.name, field.default)
+            elif field.default_factory is not dataclasses.MISSING:
+                setattr(obj, field.name, field.default_factory())
+            else:
+                setattr(obj, field.name, None)
+
+
+def split_pob_details(pob_details: PobDetails) -> Dict[str, dict]:
+    """Sections of the build, dicts of PobDetails fields tagged with the name of their section."""
+    return {section: {SECTION_KEY: section, **{name: getattr(pob_details, name) for name in names}}
+            for section, names in POB_DETAILS_SECTIONS.items()}
+
+
+def join_pob_details(sections: Iterable[dict]) -> PobDetails:
+    return PobDetails(**{name: value for section in sections for name, value in section.items()
+                         if name != SECTION_KEY})
+
+
+def encode_pob_details_section(section: dict) -> dict:
+    field_codecs = _field_codecs_for(PobDetails)
+    encoded = {SCHEMA_VERSION_KEY: POB_DETAILS_SCHEMA_VERSION}
+    for name, value in section.items():
+        encode = field_codecs[name][0] if name != SECTION_KEY else None
+        encoded[name] = value if encode is None else encode(value)
+    return encoded
+
+
+def decode_pob_details_section(obj: dict) -> dict:
+    _check_schema_version(obj)
+    field_codecs = _field_codecs_for(PobDetails)
+    section = {SECTION_KEY: obj[SECTION_KEY]}
+    for name in POB_DETAILS_SECTIONS[obj[SECTION_KEY]]:
+        if name not in obj:
+            continue
+        decode = field_codecs[name][1]
+        section[name] = obj[name] if decode is None else decode(obj[name])
+    return section
+
+
+def _check_schema_version(obj: dict) -> None:
+    schema_version = obj.get(SCHEMA_VERSION_KEY)
+    if schema_version not in READABLE_SCHEMA_VERSIONS:
+        raise UnsupportedSchemaVersionException(f'Unsupported PobDetails schema version: {schema_version}')
+
+
+def _codecs_for(tp) -> Tuple[Codec, Codec]:
+    """Encode and decode functions for values annotated with tp, None where the value is stored as it is."""
+    if tp not in _codecs:
+        _codecs[tp] = _build_codecs(tp)
+    return _codecs[tp]
+
+
+def _build_codecs(tp) -> Tuple[Codec, Codec]:
+    if dataclasses.is_dataclass(tp):
+        return _dataclass_codecs(tp)
+    origin, args = typing.get_origin(tp), typing.get_args(tp)
+    if origin is typing.Union:
+        # Optional[X] or a union of primitives, like Union[int, float]
+        non_none_args = [arg for arg in args if arg is not type(None)]
+        if len(non_none_args) > 1:
+            return None, None
+        encode, decode = _codecs_for(non_none_args[0])
+        return (encode and (lambda value: None if value is None else encode(value)),
+                decode and (lambda value: None if value is None else decode(value)))
+    if origin is list:
+        encode, decode = _codecs_for(args[0])
+        return (encode and (lambda values: [encode(value) for value in values]),
+                decode and (lambda values: [decode(value) for value in values]))
+    if origin is dict:
+        encode, decode = _codecs_for(args[1])
+        return (encode and (lambda values: {key: encode(value) for key, value in values.items()}),
+                decode and (lambda values: {key: decode(value) for key, value in values.items()}))
+    if origin is tuple:
+        # JSON has no tuples, they are stored as lists
+        return list, tuple
+    return None, None
+
+
+def _field_codecs_for(cls) -> Dict[str, Tuple[Codec, Codec]]:
+    if cls not in _field_codecs:
+        type_hints = typing.get_type_hints(cls)
+        _field_codecs[cls] = {field.name: _codecs_for(type_hints[field.name]) for field in dataclasses.fields(cls)
+                              if field.init}
+    return _field_codecs[cls]
+
+
+def _dataclass_codecs(cls) -> Tuple[Codec, Codec]:
+    fields = [(name, encode, decode) for name, (encode, decode) in _field_codecs_for(cls).items()]
+    # fields kept outside of the JSON once the field with their key is set
+    key_fields = {field.name: field.metadata['key_field'] for field in dataclasses.fields(cls)
+                  if 'key_field' in field.metadata}
+
+    def encode(obj):
+        encoded = {name: getattr(obj, name) if encode_field is None else encode_field(getattr(obj, name))
+                   for name, encode_field, _ in fields}
+        for name, key_field in key_fields.items():
+            if encoded[key_field] is not None:
+                del encoded[name]
+        return encoded
+
+    def decode(values):
+        # fields added after a guide was saved are left to their defaults
+        decoded = {name: values[name] if decode_field is None else decode_field(values[name])
+                   for name, _, decode_field in fields if name in values}
+        for name in key_fields:
+            decoded.setdefault(name, None)
+        return cls(**decoded)
+
+    return encode, decode
 
 
 class BuildDetailsJsonEncoder(json.JSONEncoder):
+    def encode(self, o):
+        if isinstance(o, dict) and SECTION_KEY in o:
+            o = encode_pob_details_section(o)
+        return super().encode(o)
+
     def default(self, obj):
         if isinstance(obj, PobDetails):
-            obj_str = jsonpickle.encode(obj, make_refs=False)
-            obj_dict = json.loads(obj_str)
-            return obj_dict
+            return encode_pob_details(obj)
 
         return json.JSONEncoder.default(self, obj)
 
 
 class BuildDetailsJsonDecoder(json.JSONDecoder):
-    def __init__(self, *args, **kwargs):
-        json.JSONDecoder.__init__(self, object_hook=self.object_hook, *args, **kwargs)
-
-    @staticmethod
-    def object_hook(obj):
-        if "py/object" in obj.keys() and obj["py/object"] == "GuideToExile.data_classes.PobDetails":
-            return jsonpickle.decode(json.dumps(obj))
+    def decode(self, s, *args, **kwargs):
+        obj = super().decode(s, *args, **kwargs)
+        if isinstance(obj, dict):
+            if SECTION_KEY in obj:
+                return decode_pob_details_section(obj)
+            if SCHEMA_VERSION_KEY in obj or LEGACY_OBJECT_KEY in obj:
+                return decode_pob_details(obj)
         return obj
@@ -0,0 +1,17 @@
+import os
+
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand
+
+from GuideToExile import items_service
+from GuideToExile.settings import GEMS_FILE, GEM_INDEX_FILE
+
+
+class Command(BaseCommand):
+    help = 'Compiles gems.min.json into the index GemsData loads without parsing JSON'
+
+    def handle(self, *args, **options):
+        gem_index = items_service.compile_gem_index(finders.find(GEMS_FILE), GEM_INDEX_FILE)
+        size_kb = os.path.getsize(GEM_INDEX_FILE) / 1024
+        self.stdout.write(f'Compiled {len(gem_index.skill_id_to_name_mapping)} gems into {GEM_INDEX_FILE} '
+                          f'({size_kb:.0f} KB)')
@@ -0,0 +1,22 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+import GuideToExile.settings as settings
+from GuideToExile import skill_tree
+
+
+class Command(BaseCommand):
+    help = 'Compiles skill tree data.json files into artifacts that SkillTreeService loads without parsing JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('versions', nargs='*', help='tree versions to compile, all of them by default')
+        parser.add_argument('--trees-dir', default='GuideToExile/trees')
+        parser.add_argument('--artifact-dir', default=settings.SKILL_TREE_ARTIFACT_DIR)
+
+    def handle(self, *args, **options):
+        versions = options['versions'] or skill_tree._find_tree_versions(options['trees_dir'])
+        for version in versions:
+            artifact_path = skill_tree.compile_tree_artifact(version, options['trees_dir'], options['artifact_dir'])
+            size_kb = os.path.getsize(artifact_path) / 1024
+            self.stdout.write(f'Compiled tree version={version} into {artifact_path} ({size_kb:.0f} KB)')
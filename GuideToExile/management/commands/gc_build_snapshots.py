@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from GuideToExile import build_snapshots
+from GuideToExile.settings import BUILD_SNAPSHOT_GC_MIN_AGE
+
+
+class Command(BaseCommand):
+    help = 'Deletes build snapshots that no guide points to and that were not used recently'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=BUILD_SNAPSHOT_GC_MIN_AGE,
+                            help='seconds since a snapshot was last used before it can be deleted')
+        parser.add_argument('--dry-run', action='store_true', help='only count the snapshots that would be deleted')
+
+    def handle(self, *args, **options):
+        unused_since = timezone.now() - timedelta(seconds=options['min_age'])
+        count = build_snapshots.collect_garbage(unused_since, dry_run=options['dry_run'])
+        action = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(f'{action} {count} build snapshots')
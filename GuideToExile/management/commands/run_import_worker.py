@@ -0,0 +1,30 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from GuideToExile import import_jobs
+from GuideToExile.settings import IMPORT_WORKER_POLL_INTERVAL
+from GuideToExile.skill_tree import SkillTreeService
+
+logger = logging.getLogger('guidetoexile')
+
+
+class Command(BaseCommand):
+    help = 'Processes queued PoB imports, keeps polling for new ones unless --burst is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true', help='exit once the queue is empty')
+        parser.add_argument('--poll-interval', type=float, default=IMPORT_WORKER_POLL_INTERVAL)
+
+    def handle(self, *args, **options):
+        skill_tree_service = SkillTreeService()
+        logger.info('PoB import worker started')
+        while True:
+            job = import_jobs.claim_next_job()
+            if job is not None:
+                import_jobs.run_job(job, skill_tree_service)
+            elif options['burst']:
+                return
+            else:
+                time.sleep(options['poll_interval'])
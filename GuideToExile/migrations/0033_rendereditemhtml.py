@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('GuideToExile', '0032_buildguide_video_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderedItemHtml',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('html', models.TextField(null=True)),
+                ('last_used', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
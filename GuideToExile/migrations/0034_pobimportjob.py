@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('GuideToExile', '0033_rendereditemhtml'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PobImportJob',
+            fields=[
+                ('job_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('pob_input', models.TextField()),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'queued'), (2, 'running'), (3, 'done'), (4, 'failed')], db_index=True, default=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error_message', models.CharField(max_length=255, null=True)),
+                ('stage_timings', models.JSONField(default=dict)),
+                ('creation_datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_datetime', models.DateTimeField(null=True)),
+                ('finished_datetime', models.DateTimeField(null=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GuideToExile.userprofile')),
+                ('guide', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='GuideToExile.buildguide')),
+            ],
+        ),
+    ]
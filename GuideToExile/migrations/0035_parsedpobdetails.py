@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:23
+
+import GuideToExile.json_encoder
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('GuideToExile', '0034_pobimportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParsedPobDetails',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('pob_details', models.JSONField(decoder=GuideToExile.json_encoder.BuildDetailsJsonDecoder, encoder=GuideToExile.json_encoder.BuildDetailsJsonEncoder)),
+                ('last_used', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
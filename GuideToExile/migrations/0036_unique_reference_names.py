@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+def merge_duplicate_names(apps, schema_editor):
+    BuildGuide = apps.get_model('GuideToExile', 'BuildGuide')
+    for model_name, field_name in (('Keystone', 'keystones'), ('UniqueItem', 'unique_items')):
+        model = apps.get_model('GuideToExile', model_name)
+        through = getattr(BuildGuide, field_name).through
+        target_column = f'{model_name.lower()}_id'
+        kept_ids = {}
+        for obj_id, name in model.objects.order_by('id').values_list('id', 'name'):
+            kept_id = kept_ids.setdefault(name, obj_id)
+            if kept_id == obj_id:
+                continue
+            guides_with_kept = through.objects.filter(**{target_column: kept_id}).values_list('buildguide_id')
+            through.objects.filter(**{target_column: obj_id}, buildguide_id__in=guides_with_kept).delete()
+            through.objects.filter(**{target_column: obj_id}).update(**{target_column: kept_id})
+            model.objects.filter(id=obj_id).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('GuideToExile', '0035_parsedpobdetails'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='keystone',
+            name='name',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='uniqueitem',
+            name='name',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
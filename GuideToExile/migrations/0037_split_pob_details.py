@@ -0,0 +1,151 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:02
+
+import dataclasses
+import json
+
+import GuideToExile.json_encoder
+from django.db import migrations, models
+from django.db.models import TextField, Value
+from django.db.models.functions import Cast
+from jsonpickle.unpickler import Unpickler
+
+# the stored format as it was when this migration was written, the live json_encoder is not used to convert rows
+SCHEMA_VERSION_KEY = 'schema_version'
+LEGACY_SCHEMA_VERSION = 1
+LEGACY_OBJECT_KEY = 'py/object'
+SECTION_KEY = 'section'
+SECTIONS = {
+    'summary': ('build_stats', 'class_name', 'ascendancy_name', 'main_active_skills', 'imported_primary_skill'),
+    'skill_groups': ('skill_groups',),
+    'tree': ('tree_specs', 'active_tree_spec_index'),
+    'gear': ('items', 'item_sets', 'active_item_set_id', 'used_jewels'),
+}
+SECTION_FIELDS = [f'pob_{section}' for section in SECTIONS]
+BATCH_SIZE = 200
+
+
+def fill_missing_fields(obj) -> None:
+    """Fields added to the data classes after a jsonpickle row was saved get their defaults."""
+    if isinstance(obj, (list, tuple)):
+        for element in obj:
+            fill_missing_fields(element)
+    elif isinstance(obj, dict):
+        for element in obj.values():
+            fill_missing_fields(element)
+    elif dataclasses.is_dataclass(obj):
+        for field in dataclasses.fields(obj):
+            if field.name not in obj.__dict__:
+                if field.default is not dataclasses.MISSING:
+                    setattr(obj, field.name, field.default)
+                elif field.default_factory is not dataclasses.MISSING:
+                    setattr(obj, field.name, field.default_factory())
+                else:
+                    setattr(obj, field.name, None)
+            fill_missing_fields(getattr(obj, field.name))
+
+
+def to_schema_json(value):
+    """Restored jsonpickle objects as schema version 1 stored them: dataclasses as dicts of fields, tuples as lists."""
+    if dataclasses.is_dataclass(value):
+        return {field.name: to_schema_json(getattr(value, field.name))
+                for field in dataclasses.fields(value) if field.init}
+    if isinstance(value, (list, tuple)):
+        return [to_schema_json(element) for element in value]
+    if isinstance(value, dict):
+        return {key: to_schema_json(element) for key, element in value.items()}
+    return value
+
+
+def split_row(pob_details: dict) -> dict:
+    """Stored sections of a stored build, both as JSON."""
+    if LEGACY_OBJECT_KEY in pob_details:
+        restored = Unpickler().restore(pob_details)
+        # jsonpickle gives back the dict itself when it can't find the class
+        if not dataclasses.is_dataclass(restored):
+            raise ValueError(f'Unreadable jsonpickle build: {pob_details[LEGACY_OBJECT_KEY]}')
+        fill_missing_fields(restored)
+        pob_details = {SCHEMA_VERSION_KEY: LEGACY_SCHEMA_VERSION, **to_schema_json(restored)}
+    return {f'pob_{section}': {SCHEMA_VERSION_KEY: pob_details[SCHEMA_VERSION_KEY], SECTION_KEY: section,
+                               **{name: pob_details[name] for name in names if name in pob_details}}
+            for section, names in SECTIONS.items()}
+
+
+def join_row(sections: list) -> dict:
+    pob_details = {SCHEMA_VERSION_KEY: sections[0][SCHEMA_VERSION_KEY]}
+    for section in sections:
+        pob_details.update((name, value) for name, value in section.items()
+                           if name not in (SCHEMA_VERSION_KEY, SECTION_KEY))
+    return pob_details
+
+
+def stored_json(value: dict):
+    """The value written as it is, bypassing the encoder of the field."""
+    return Cast(Value(json.dumps(value)), models.JSONField())
+
+
+def as_stored_json(queryset, field_names):
+    """Rows with the given fields as their stored JSON text, so they are not decoded by the field."""
+    pk_name = queryset.model._meta.pk.name
+    return (queryset.annotate(**{f'{field_name}_json': Cast(field_name, TextField()) for field_name in field_names})
+            .values_list(pk_name, *(f'{field_name}_json' for field_name in field_names))
+            .iterator(chunk_size=BATCH_SIZE))
+
+
+def for_each_batch(model, rows, field_names, convert):
+    """Writes what convert returns for each row, in batches, errors abort the migration, no row is left behind."""
+    pk_name = model._meta.pk.name
+    batch = []
+    for pk, *values in rows:
+        converted = convert(*(json.loads(value) for value in values))
+        batch.append(model(**{pk_name: pk}, **{name: stored_json(value) for name, value in converted.items()}))
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_update(batch, field_names)
+            batch.clear()
+    model.objects.bulk_update(batch, field_names)
+
+
+def split_pob_details(apps, schema_editor):
+    BuildGuide = apps.get_model('GuideToExile', 'BuildGuide')
+    rows = as_stored_json(BuildGuide.objects.filter(pob_details__isnull=False), ['pob_details'])
+    for_each_batch(BuildGuide, rows, SECTION_FIELDS, split_row)
+
+
+def join_pob_details(apps, schema_editor):
+    BuildGuide = apps.get_model('GuideToExile', 'BuildGuide')
+    rows = as_stored_json(BuildGuide.objects.filter(pob_summary__isnull=False), SECTION_FIELDS)
+    for_each_batch(BuildGuide, rows, ['pob_details'],
+                   lambda *sections: {'pob_details': join_row(list(sections))})
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('GuideToExile', '0036_unique_reference_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildguide',
+            name='pob_gear',
+            field=models.JSONField(decoder=GuideToExile.json_encoder.BuildDetailsJsonDecoder, encoder=GuideToExile.json_encoder.BuildDetailsJsonEncoder, null=True),
+        ),
+        migrations.AddField(
+            model_name='buildguide',
+            name='pob_skill_groups',
+            field=models.JSONField(decoder=GuideToExile.json_encoder.BuildDetailsJsonDecoder, encoder=GuideToExile.json_encoder.BuildDetailsJsonEncoder, null=True),
+        ),
+        migrations.AddField(
+            model_name='buildguide',
+            name='pob_summary',
+            field=models.JSONField(decoder=GuideToExile.json_encoder.BuildDetailsJsonDecoder, encoder=GuideToExile.json_encoder.BuildDetailsJsonEncoder, null=True),
+        ),
+        migrations.AddField(
+            model_name='buildguide',
+            name='pob_tree',
+            field=models.JSONField(decoder=GuideToExile.json_encoder.BuildDetailsJsonDecoder, encoder=GuideToExile.json_encoder.BuildDetailsJsonEncoder, null=True),
+        ),
+        migrations.RunPython(split_pob_details, join_pob_details),
+        migrations.RemoveField(
+            model_name='buildguide',
+            name='pob_details',
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:10
+
+import hashlib
+
+from django.db import migrations, models
+
+BATCH_SIZE = 200
+
+
+# copies of the item_html_store helpers as they were when this migration was written
+def html_key(html: str) -> str:
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def iter_gear_items(items, item_sets, used_jewels):
+    yield from items
+    for item_set in item_sets:
+        yield from item_set.slots.values()
+    for jewels in used_jewels.values():
+        yield from jewels
+
+
+def gear_items(gear: dict):
+    return iter_gear_items(gear['items'], gear['item_sets'], gear['used_jewels'])
+
+
+def for_each_batch(queryset, field_name, update):
+    """Applies update to field_name of every row in batches, rows for which it returns False are left as they are."""
+    batch = []
+    for obj in queryset.only(queryset.model._meta.pk.name, field_name).iterator(chunk_size=BATCH_SIZE):
+        if update(getattr(obj, field_name)):
+            batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            queryset.model.objects.bulk_update(batch, [field_name])
+            batch.clear()
+    queryset.model.objects.bulk_update(batch, [field_name])
+
+
+def move_html_to_table(apps, schema_editor):
+    ItemHtml = apps.get_model('GuideToExile', 'ItemHtml')
+    BuildGuide = apps.get_model('GuideToExile', 'BuildGuide')
+    ParsedPobDetails = apps.get_model('GuideToExile', 'ParsedPobDetails')
+
+    def move_html(items):
+        new_html = {}
+        for item in items:
+            if item.display_html_key is None and item.display_html:
+                item.display_html_key = html_key(item.display_html)
+                new_html[item.display_html_key] = item.display_html
+        ItemHtml.objects.bulk_create([ItemHtml(key=key, html=html) for key, html in new_html.items()],
+                                     ignore_conflicts=True)
+        return bool(new_html)
+
+    for_each_batch(BuildGuide.objects.filter(pob_gear__isnull=False), 'pob_gear',
+                   lambda gear: move_html(gear_items(gear)))
+    for_each_batch(ParsedPobDetails.objects.all(), 'pob_details',
+                   lambda pob_details: move_html(iter_gear_items(pob_details.items, pob_details.item_sets,
+                                                                 pob_details.used_jewels)))
+
+
+def move_html_to_guides(apps, schema_editor):
+    ItemHtml = apps.get_model('GuideToExile', 'ItemHtml')
+    BuildGuide = apps.get_model('GuideToExile', 'BuildGuide')
+    ParsedPobDetails = apps.get_model('GuideToExile', 'ParsedPobDetails')
+
+    def inline_html(items):
+        items = [item for item in items if item.display_html_key is not None]
+        html_by_key = dict(ItemHtml.objects.filter(key__in={item.display_html_key for item in items})
+                           .values_list('key', 'html'))
+        for item in items:
+            item.display_html = html_by_key.get(item.display_html_key)
+            item.display_html_key = None
+        return bool(items)
+
+    for_each_batch(BuildGuide.objects.filter(pob_gear__isnull=False), 'pob_gear',
+                   lambda gear: inline_html(gear_items(gear)))
+    for_each_batch(ParsedPobDetails.objects.all(), 'pob_details',
+                   lambda pob_details: inline_html(iter_gear_items(pob_details.items, pob_details.item_sets,
+                                                                   pob_details.used_jewels)))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('GuideToExile', '0037_split_pob_details'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemHtml',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('html', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(move_html_to_table, move_html_to_guides),
+    ]
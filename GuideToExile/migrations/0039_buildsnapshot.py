@@ -0,0 +1,105 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:25
+
+import hashlib
+import json
+
+import GuideToExile.json_encoder
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+SECTION_FIELDS = ['pob_summary', 'pob_skill_groups', 'pob_tree', 'pob_gear']
+BATCH_SIZE = 200
+
+
+def snapshot_key(pob_string: str, sections: dict) -> str:
+    """Copy of build_snapshots.snapshot_key as it was when this migration was written."""
+    snapshot_hash = hashlib.sha256(pob_string.encode('utf-8'))
+    for field_name in SECTION_FIELDS:
+        section_json = json.dumps(sections[field_name], cls=GuideToExile.json_encoder.BuildDetailsJsonEncoder,
+                                  sort_keys=True)
+        snapshot_hash.update(section_json.encode('utf-8'))
+    return snapshot_hash.hexdigest()
+
+
+def move_builds_to_snapshots(apps, schema_editor):
+    BuildGuide = apps.get_model('GuideToExile', 'BuildGuide')
+    BuildSnapshot = apps.get_model('GuideToExile', 'BuildSnapshot')
+    guides = BuildGuide.objects.filter(pob_summary__isnull=False).only('guide_id', 'pob_string', *SECTION_FIELDS)
+    batch = []
+
+    def save_batch():
+        snapshots = {guide.snapshot.key: guide.snapshot for guide in batch}
+        BuildSnapshot.objects.bulk_create(snapshots.values(), ignore_conflicts=True)
+        BuildGuide.objects.bulk_update(batch, ['snapshot'])
+        batch.clear()
+
+    for guide in guides.iterator(chunk_size=BATCH_SIZE):
+        pob_string = guide.pob_string or ''
+        sections = {field_name: getattr(guide, field_name) for field_name in SECTION_FIELDS}
+        guide.snapshot = BuildSnapshot(key=snapshot_key(pob_string, sections), pob_string=pob_string, **sections)
+        batch.append(guide)
+        if len(batch) >= BATCH_SIZE:
+            save_batch()
+    save_batch()
+
+
+def move_snapshots_to_builds(apps, schema_editor):
+    BuildGuide = apps.get_model('GuideToExile', 'BuildGuide')
+    guides = BuildGuide.objects.filter(snapshot__isnull=False).select_related('snapshot')
+    batch = []
+    for guide in guides.iterator(chunk_size=BATCH_SIZE):
+        for field_name in ('pob_string', *SECTION_FIELDS):
+            setattr(guide, field_name, getattr(guide.snapshot, field_name))
+        batch.append(guide)
+        if len(batch) >= BATCH_SIZE:
+            BuildGuide.objects.bulk_update(batch, ['pob_string', *SECTION_FIELDS])
+            batch.clear()
+    BuildGuide.objects.bulk_update(batch, ['pob_string', *SECTION_FIELDS])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('GuideToExile', '0038_itemhtml'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildSnapshot',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('pob_string', models.TextField()),
+                ('pob_summary', models.JSONField(decoder=GuideToExile.json_encoder.BuildDetailsJsonDecoder, encoder=GuideToExile.json_encoder.BuildDetailsJsonEncoder)),
+                ('pob_skill_groups', models.JSONField(decoder=GuideToExile.json_encoder.BuildDetailsJsonDecoder, encoder=GuideToExile.json_encoder.BuildDetailsJsonEncoder)),
+                ('pob_tree', models.JSONField(decoder=GuideToExile.json_encoder.BuildDetailsJsonDecoder, encoder=GuideToExile.json_encoder.BuildDetailsJsonEncoder)),
+                ('pob_gear', models.JSONField(decoder=GuideToExile.json_encoder.BuildDetailsJsonDecoder, encoder=GuideToExile.json_encoder.BuildDetailsJsonEncoder)),
+                ('last_used', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='buildguide',
+            name='snapshot',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='GuideToExile.buildsnapshot'),
+        ),
+        migrations.RunPython(move_builds_to_snapshots, move_snapshots_to_builds),
+        migrations.RemoveField(
+            model_name='buildguide',
+            name='pob_gear',
+        ),
+        migrations.RemoveField(
+            model_name='buildguide',
+            name='pob_skill_groups',
+        ),
+        migrations.RemoveField(
+            model_name='buildguide',
+            name='pob_string',
+        ),
+        migrations.RemoveField(
+            model_name='buildguide',
+            name='pob_summary',
+        ),
+        migrations.RemoveField(
+            model_name='buildguide',
+            name='pob_tree',
+        ),
+    ]
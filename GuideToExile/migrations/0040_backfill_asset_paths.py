@@ -0,0 +1,72 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:40
+
+import dataclasses
+import json
+
+from django.db import migrations
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+BATCH_SIZE = 200
+
+# models with the JSON fields that hold items and gems
+BACKFILLED_FIELDS = [
+    ('BuildSnapshot', ['pob_skill_groups', 'pob_gear']),
+    ('ParsedPobDetails', ['pob_details']),
+]
+
+
+def lacks_asset_paths(value) -> bool:
+    """Whether stored JSON has an item or a gem saved before asset paths were, items are the dicts with support gems."""
+    if isinstance(value, list):
+        return any(lacks_asset_paths(element) for element in value)
+    if not isinstance(value, dict):
+        return False
+    if ('support_gems' in value or 'is_active_skill' in value) and value.get('asset_path') is None:
+        return True
+    return any(lacks_asset_paths(element) for element in value.values())
+
+
+def resolve_asset_paths(value) -> None:
+    if isinstance(value, (list, tuple)):
+        for element in value:
+            resolve_asset_paths(element)
+    elif isinstance(value, dict):
+        for element in value.values():
+            resolve_asset_paths(element)
+    elif dataclasses.is_dataclass(value):
+        if hasattr(value, 'asset') and value.asset_path is None:
+            value.asset_path = value.asset
+        for field in dataclasses.fields(value):
+            resolve_asset_paths(getattr(value, field.name))
+
+
+def backfill_asset_paths(apps, schema_editor):
+    """Stores the asset paths that rows saved before them had resolved again on every decode.
+
+    Snapshots keep their keys, they identify the build and are not recomputed from the content.
+    """
+    for model_name, field_names in BACKFILLED_FIELDS:
+        model = apps.get_model('GuideToExile', model_name)
+        pk_name = model._meta.pk.name
+        rows = (model.objects
+                .annotate(**{f'{field_name}_json': Cast(field_name, TextField()) for field_name in field_names})
+                .values_list(pk_name, *(f'{field_name}_json' for field_name in field_names)))
+        pks = [pk for pk, *values in rows.iterator(chunk_size=BATCH_SIZE)
+               if any(value is not None and lacks_asset_paths(json.loads(value)) for value in values)]
+        for start in range(0, len(pks), BATCH_SIZE):
+            batch = list(model.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).only(pk_name, *field_names))
+            for obj in batch:
+                for field_name in field_names:
+                    resolve_asset_paths(getattr(obj, field_name))
+            model.objects.bulk_update(batch, field_names)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('GuideToExile', '0039_buildsnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_asset_paths, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 from django.db.models.signals import post_save, pre_save
@@ -6,20 +8,39 @@ from django.utils import timezone
 from django.utils.text import slugify
 
 from GuideToExile import json_encoder, settings
+from GuideToExile.data_classes import PobDetails
 
 
 class Keystone(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, unique=True)
 
 
 class UniqueItem(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, unique=True)
 
 
 class ActiveSkill(models.Model):
     name = models.CharField(max_length=255)
 
 
+class RenderedItemHtml(models.Model):
+    key = models.CharField(max_length=64, primary_key=True)
+    html = models.TextField(null=True)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+
+
+class ItemHtml(models.Model):
+    key = models.CharField(max_length=64, primary_key=True)
+    html = models.TextField()
+
+
+class ParsedPobDetails(models.Model):
+    key = models.CharField(max_length=64, primary_key=True)
+    pob_details = models.JSONField(encoder=json_encoder.BuildDetailsJsonEncoder,
+                                   decoder=json_encoder.BuildDetailsJsonDecoder)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+
+
 class UserProfileManager(models.Manager):
     def get_by_natural_key(self, username):
         return self.get(user__username=username)
@@ -117,6 +138,32 @@ class AscendancyClass(models.Model):
         return name
 
 
+class BuildSnapshot(models.Model):
+    """An imported build, keyed by a hash of its content. Rows are never changed, guides point to a new one instead."""
+    key = models.CharField(max_length=64, primary_key=True)
+    pob_string = models.TextField()
+    # PobDetails is stored in sections, see json_encoder.POB_DETAILS_SECTIONS, a guide tab loads only its own
+    pob_summary = models.JSONField(encoder=json_encoder.BuildDetailsJsonEncoder,
+                                   decoder=json_encoder.BuildDetailsJsonDecoder)
+    pob_skill_groups = models.JSONField(encoder=json_encoder.BuildDetailsJsonEncoder,
+                                        decoder=json_encoder.BuildDetailsJsonDecoder)
+    pob_tree = models.JSONField(encoder=json_encoder.BuildDetailsJsonEncoder,
+                                decoder=json_encoder.BuildDetailsJsonDecoder)
+    pob_gear = models.JSONField(encoder=json_encoder.BuildDetailsJsonEncoder,
+                                decoder=json_encoder.BuildDetailsJsonDecoder)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+
+    POB_DETAILS_FIELDS = tuple(f'pob_{section}' for section in json_encoder.POB_DETAILS_SECTIONS)
+
+    @property
+    def pob_details(self) -> PobDetails:
+        """The whole build, joined from all its sections. Views showing a part of it should use its section."""
+        deferred = self.get_deferred_fields().intersection(self.POB_DETAILS_FIELDS)
+        if deferred:
+            self.refresh_from_db(fields=deferred)
+        return json_encoder.join_pob_details(getattr(self, field_name) for field_name in self.POB_DETAILS_FIELDS)
+
+
 class BuildGuide(models.Model):
     class GuideStatus(models.IntegerChoices):
         DRAFT = 1, 'draft'
@@ -128,9 +175,6 @@ class BuildGuide(models.Model):
     author = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True)
     creation_datetime = models.DateTimeField(blank=True, null=True)
     modification_datetime = models.DateTimeField(blank=True, null=True)
-    pob_string = models.TextField(null=True)
-    pob_details = models.JSONField(encoder=json_encoder.BuildDetailsJsonEncoder,
-                                   decoder=json_encoder.BuildDetailsJsonDecoder, null=True)
     title = models.CharField(max_length=180, null=True)
     text = models.TextField(null=True)
     video_url = models.CharField(max_length=200, null=True, blank=True)
@@ -140,6 +184,12 @@ class BuildGuide(models.Model):
     ascendancy_class = models.ForeignKey(AscendancyClass, on_delete=models.SET_NULL, null=True)
     draft = models.OneToOneField('BuildGuide', on_delete=models.CASCADE, related_name='public_version', null=True)
     status = models.PositiveSmallIntegerField(choices=GuideStatus.choices)
+    # shared with the other version of the guide, publishing only points it at the draft's snapshot
+    snapshot = models.ForeignKey(BuildSnapshot, on_delete=models.PROTECT, null=True)
+
+    @property
+    def pob_details(self) -> Optional[PobDetails]:
+        return self.snapshot.pob_details if self.snapshot_id else None
 
     @property
     def is_draft(self):
@@ -154,6 +204,31 @@ class BuildGuide(models.Model):
         return self.status == BuildGuide.GuideStatus.ARCHIVED
 
 
+class PobImportJob(models.Model):
+    class JobStatus(models.IntegerChoices):
+        QUEUED = 1, 'queued'
+        RUNNING = 2, 'running'
+        DONE = 3, 'done'
+        FAILED = 4, 'failed'
+
+    job_id = models.BigAutoField(primary_key=True)
+    author = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
+    guide = models.ForeignKey(BuildGuide, on_delete=models.CASCADE, null=True)
+    pob_input = models.TextField()
+    status = models.PositiveSmallIntegerField(choices=JobStatus.choices, default=JobStatus.QUEUED, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error_message = models.CharField(max_length=255, null=True)
+    stage_timings = models.JSONField(default=dict)
+    creation_datetime = models.DateTimeField(default=timezone.now)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_datetime = models.DateTimeField(null=True)
+    finished_datetime = models.DateTimeField(null=True)
+
+    @property
+    def is_finished(self):
+        return self.status in (PobImportJob.JobStatus.DONE, PobImportJob.JobStatus.FAILED)
+
+
 class GuideLike(models.Model):
     guide = models.ForeignKey(BuildGuide, on_delete=models.CASCADE)
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
@@ -0,0 +1,38 @@
+import hashlib
+from typing import Iterable, Optional
+
+from django.utils import timezone
+
+from GuideToExile import item_html_store
+from GuideToExile.data_classes import PobDetails
+from GuideToExile.db_lru_cache import DbLruCache
+from GuideToExile.models import ParsedPobDetails
+
+# bump when parse_pob_details starts producing different PobDetails for the same XML
+PARSED_BUILD_FORMAT_VERSION = 1
+
+
+class ParsedBuildCache(DbLruCache):
+    """Parsed builds, keyed by a hash of their XML and the PoB version that rendered their items."""
+    model = ParsedPobDetails
+    entries_name = 'parsed builds'
+
+    def key_for(self, xml_chunks: Iterable[str]) -> str:
+        xml_hash = hashlib.sha256(f'{PARSED_BUILD_FORMAT_VERSION}\n{self.pob_version}\n'.encode('utf-8'))
+        for chunk in xml_chunks:
+            xml_hash.update(chunk.encode('utf-8'))
+        return xml_hash.hexdigest()
+
+    def get(self, key: str) -> Optional[PobDetails]:
+        found = ParsedPobDetails.objects.filter(key=key).values_list('pob_details', flat=True).first()
+        if found is not None:
+            ParsedPobDetails.objects.filter(key=key).update(last_used=timezone.now())
+        self._count_lookups(int(found is not None), 1)
+        return found
+
+    def set(self, key: str, pob_details: PobDetails) -> None:
+        item_html_store.store_items_html(item_html_store.iter_gear_items(pob_details.items, pob_details.item_sets,
+                                                                         pob_details.used_jewels))
+        ParsedPobDetails.objects.bulk_create([ParsedPobDetails(key=key, pob_details=pob_details)],
+                                             ignore_conflicts=True)
+        self._evict_least_recently_used()
@@ -0,0 +1,84 @@
+import logging
+import re
+from typing import Dict
+
+import requests
+from django.core.cache import caches
+from requests.adapters import HTTPAdapter
+
+from GuideToExile.exceptions import PastebinImportException
+from GuideToExile.settings import PASTEBIN_CONNECT_TIMEOUT, PASTEBIN_READ_TIMEOUT, PASTEBIN_MAX_SIZE, \
+    PASTEBIN_POOL_SIZE
+
+logger = logging.getLogger('guidetoexile')
+
+PASTE_CACHE_ALIAS = 'pastes'
+PASTE_URL_REGEX = re.compile(r'https://pastebin\.com/(\w+)/?')
+RAW_PASTE_URL = 'https://pastebin.com/raw/{}'
+
+
+def paste_id_from_url(url: str) -> str:
+    match = PASTE_URL_REGEX.fullmatch(url.strip())
+    if not match:
+        raise PastebinImportException('Incorrect Pastebin URL - must start with "https://pastebin.com/"')
+    return match.group(1)
+
+
+class PastebinSource:
+    """Downloads raw pastes over a pooled session, giving up on slow responses and ones larger than max_size."""
+
+    def __init__(self, connect_timeout: float = PASTEBIN_CONNECT_TIMEOUT, read_timeout: float = PASTEBIN_READ_TIMEOUT,
+                 max_size: int = PASTEBIN_MAX_SIZE, pool_size: int = PASTEBIN_POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_size = max_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+    def get(self, paste_id: str) -> str:
+        with self.session.get(RAW_PASTE_URL.format(paste_id), timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            content = bytearray()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                content.extend(chunk)
+                if len(content) > self.max_size:
+                    raise PastebinImportException(f'Paste {paste_id} is larger than {self.max_size} bytes')
+            return content.decode(response.encoding or 'utf-8')
+
+
+class LocalPasteSource:
+    """Pastes kept in memory, stands in for Pastebin in tests and offline scripts."""
+
+    def __init__(self, pastes: Dict[str, str]):
+        self.pastes = pastes
+
+    def get(self, paste_id: str) -> str:
+        if paste_id not in self.pastes:
+            raise PastebinImportException(f'No paste {paste_id}')
+        return self.pastes[paste_id]
+
+
+class PasteFetcher:
+    """Pastes by URL, kept in the 'pastes' cache so submitting the same link again doesn't download it again."""
+
+    def __init__(self, source, cache_alias: str = PASTE_CACHE_ALIAS):
+        self.source = source
+        self.cache_alias = cache_alias
+
+    def fetch(self, url: str) -> str:
+        paste_id = paste_id_from_url(url)
+        cache = caches[self.cache_alias]
+        cache_key = f'paste:{paste_id}'
+        paste = cache.get(cache_key)
+        if paste is None:
+            logger.debug('Importing from Pastebin: %s', url)
+            paste = self.source.get(paste_id)
+            cache.set(cache_key, paste)
+        return paste
+
+
+PASTE_FETCHER = PasteFetcher(PastebinSource())
+
+
+def fetch_paste(url: str) -> str:
+    return PASTE_FETCHER.fetch(url)
@@ -1,19 +1,22 @@
 import base64
-import copy
+import codecs
+import dataclasses
 import logging
 import re
 import xml.etree.ElementTree as ET
 import zlib
-from typing import Union, Optional, Dict, List
-
-import requests
+from typing import Union, Optional, Dict, List, Iterable, Tuple, Set, Iterator, Callable
 
 from GuideToExile import items_service
 from GuideToExile.data_classes import SkillGem, SkillGroup, TreeSpec, ItemSet, Item, PobDetails
-from GuideToExile.exceptions import PastebinImportException, BuildXmlParsingException, TreeParsingException, \
-    BuildWithoutActiveSkillException
-from GuideToExile.settings import POB_PATH
-from apps.pob_wrapper import PathOfBuilding
+from GuideToExile.exceptions import BuildXmlParsingException, TreeParsingException, \
+    BuildWithoutActiveSkillException, PobXmlTooLargeException
+from GuideToExile.item_html_cache import ItemHtmlCache
+from GuideToExile.parsed_build_cache import ParsedBuildCache
+from GuideToExile.settings import POB_PATH, POB_POOL_SIZE, POB_POOL_MAX_REQUESTS, POB_POOL_CHECKOUT_TIMEOUT, \
+    ITEM_HTML_CACHE_MAX_ENTRIES, POB_REQUEST_TIMEOUT, POB_START_TIMEOUT, POB_XML_MAX_SIZE, \
+    PARSED_BUILD_CACHE_MAX_ENTRIES
+from apps.pob_wrapper import PathOfBuildingPool, ExternalError, read_pob_version
 
 logger = logging.getLogger('guidetoexile')
 
@@ -28,23 +31,39 @@ ALT_QUALITY_PREF_MAPPING = {
     'Alternate3': 'Phantasmal ',
 }
 
+XML_CHUNK_SIZE = 64 * 1024
+
 GEMS_DATA = items_service.GemsData()
 
+POB_POOL = PathOfBuildingPool(POB_PATH, POB_PATH, size=POB_POOL_SIZE, max_requests=POB_POOL_MAX_REQUESTS,
+                              timeout=POB_REQUEST_TIMEOUT, start_timeout=POB_START_TIMEOUT)
 
-def import_from_pastebin(url: str) -> str:
-    logger.debug('Importing from Pastebin: %s', url)
-    parts = url.rsplit('/', maxsplit=1)
-    if parts[0] != 'https://pastebin.com':
-        raise PastebinImportException('Incorrect Pastebin URL - must start with "https://pastebin.com/"')
-    final_url = parts[0] + '/raw/' + parts[1]
-    response = requests.get(final_url)
-    response.raise_for_status()
-    return response.text
+ITEM_HTML_CACHE = ItemHtmlCache(read_pob_version(POB_PATH), ITEM_HTML_CACHE_MAX_ENTRIES)
+PARSED_BUILD_CACHE = ParsedBuildCache(ITEM_HTML_CACHE.pob_version, PARSED_BUILD_CACHE_MAX_ENTRIES)
 
 
 def base64_to_xml(base64_str: str) -> str:
+    return ''.join(iter_xml_chunks(base64_str))
+
+
+def iter_xml_chunks(base64_str: str, max_size: int = POB_XML_MAX_SIZE,
+                    chunk_size: int = XML_CHUNK_SIZE) -> Iterator[str]:
+    """Inflates an export code piece by piece, giving up as soon as the XML grows over max_size bytes."""
     compressed_bytes = base64.urlsafe_b64decode(base64_str)
-    return zlib.decompress(compressed_bytes).decode('utf-8')
+    decompressor = zlib.decompressobj()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    xml_size = 0
+    pending = compressed_bytes
+    while not decompressor.eof:
+        chunk = decompressor.decompress(pending, chunk_size)
+        pending = decompressor.unconsumed_tail
+        if not chunk and not pending:
+            raise zlib.error('Error -5 while decompressing data: incomplete or truncated stream')
+        xml_size += len(chunk)
+        if xml_size > max_size:
+            raise PobXmlTooLargeException(f'PoB XML larger than {max_size} bytes')
+        yield text_decoder.decode(chunk)
+    yield text_decoder.decode(b'', final=True)
 
 
 def xml_to_base64(xml: str) -> str:
@@ -52,47 +71,141 @@ def xml_to_base64(xml: str) -> str:
     return base64.urlsafe_b64encode(compressed_bytes).decode('utf-8')
 
 
-def parse_pob_details(xml: str) -> PobDetails:
+def parse_pob_details(xml: Union[str, Iterable[str]]) -> PobDetails:
+    """Builds PobDetails from PoB XML, given whole or as consecutive chunks."""
+    reader = PobXmlReader()
     try:
-        xml_root = ET.fromstring(xml)
-    except Exception as err:
+        for chunk in ([xml] if isinstance(xml, str) else xml):
+            reader.feed(chunk)
+        reader.close()
+    except ET.ParseError as err:
         raise BuildXmlParsingException(err)
-
-    skill_groups = extract_skills_groups(xml_root)
-
-    # sorting must be after picking main skill, in the xml they use index for that, not id
-    main_active_skill = get_main_active_skill(skill_groups, xml_root)
-    if not main_active_skill:
-        raise BuildWithoutActiveSkillException
-
-    skill_groups.sort(key=lambda x: SLOTS_ORDER.index(x.slot))
-
-    items = extract_items(xml_root)
-    return PobDetails(
-        build_stats=(extract_stats(xml_root)),
-        class_name=(xml_root.find('Build').get('className')),
-        ascendancy_name=(xml_root.find('Build').get('ascendClassName')),
-        skill_groups=skill_groups,
-        main_active_skills=[main_active_skill],
-        imported_primary_skill=main_active_skill,
-        tree_specs=(extract_tree_specs(xml_root)),
-        active_tree_spec_index=int(xml_root.find('Tree').get('activeSpec')),
-        items=items,
-        item_sets=(extract_item_sets(xml_root, items)),
-        active_item_set_id=extract_active_item_set_id(xml_root),
-        used_jewels=(extract_used_jewels(xml_root, items)))
-
-
-def extract_used_jewels(xml_root: ET.Element, items: List[Item]) -> Dict[str, List[Item]]:
+    return reader.to_pob_details()
+
+
+def get_or_parse_pob_details(xml: str) -> PobDetails:
+    """Like parse_pob_details, but a build with the same XML as one imported before isn't parsed again."""
+    return _get_or_parse(lambda: [xml])
+
+
+def get_or_parse_pob_string(pob_string: str) -> PobDetails:
+    """get_or_parse_pob_details for an export code, inflated once to hash it and once more only if it isn't cached."""
+    return _get_or_parse(lambda: iter_xml_chunks(pob_string))
+
+
+def _get_or_parse(read_xml_chunks: Callable[[], Iterable[str]]) -> PobDetails:
+    key = PARSED_BUILD_CACHE.key_for(read_xml_chunks())
+    pob_details = PARSED_BUILD_CACHE.get(key)
+    if pob_details is None:
+        pob_details = parse_pob_details(read_xml_chunks())
+        PARSED_BUILD_CACHE.set(key, pob_details)
+    logger.debug('Parsed build cache stats: %s', PARSED_BUILD_CACHE.stats())
+    return pob_details
+
+
+class PobXmlReader:
+    """Reads PoB XML in a single pass, with an incremental parser.
+
+    Direct children of the top level sections (a stat, a skill group, an item, an item set, a tree spec) are
+    converted as soon as they are complete and then cleared, so the whole document is never held as a tree.
+    Items are rendered afterwards, all of them in one PoB call.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._depth = 0
+        self._section = None
+        self.build_attributes: Dict[str, str] = {}
+        self.build_stats: Dict[str, Union[int, float]] = {}
+        self.skill_groups: List[SkillGroup] = []
+        self.item_texts: List[Tuple[int, str]] = []
+        self.item_set_slots: List[Tuple[str, str, List[Tuple[str, int]]]] = []
+        self.active_item_set_id = '1'
+        self.tree_specs: List[TreeSpec] = []
+        self.tree_jewel_ids: Set[int] = set()
+        self.active_tree_spec_index = None
+
+    def feed(self, chunk: str) -> None:
+        self._parser.feed(chunk)
+        self._read_events()
+
+    def close(self) -> None:
+        self._parser.close()
+        self._read_events()
+
+    def _read_events(self) -> None:
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                self._depth += 1
+                if self._depth == 2:
+                    self._start_section(element)
+                continue
+            if self._depth == 3:
+                self._read_section_child(element)
+                element.clear()
+            elif self._depth == 2:
+                element.clear()
+            self._depth -= 1
+
+    def _start_section(self, section_xml: ET.Element) -> None:
+        self._section = section_xml.tag
+        if self._section == 'Build':
+            self.build_attributes = dict(section_xml.attrib)
+        elif self._section == 'Items':
+            if (active_item_set_id := section_xml.get('activeItemSet')) not in (None, 'nil'):
+                self.active_item_set_id = active_item_set_id
+        elif self._section == 'Tree':
+            self.active_tree_spec_index = int(section_xml.get('activeSpec'))
+
+    def _read_section_child(self, child_xml: ET.Element) -> None:
+        if self._section == 'Build':
+            add_stat(self.build_stats, child_xml)
+        elif self._section == 'Skills':
+            self.skill_groups.append(extract_skill_group(child_xml))
+        elif self._section == 'Tree':
+            self.tree_specs.append(extract_tree_spec(child_xml))
+            self.tree_jewel_ids.update(item_id for socket_xml in child_xml.iterfind('Sockets/Socket')
+                                       if (item_id := int(socket_xml.get('itemId'))) != 0)
+        elif self._section == 'Items' and child_xml.tag == 'Item':
+            self.item_texts.append((int(child_xml.get('id')), child_xml.text.strip()))
+        elif self._section == 'Items' and child_xml.tag == 'ItemSet':
+            title = title if (title := child_xml.get('title')) is not None else 'Default'
+            slots = [(slot_xml.get('name'), int(slot_xml.get('itemId'))) for slot_xml in child_xml]
+            self.item_set_slots.append((title, child_xml.get('id'), slots))
+
+    def to_pob_details(self) -> PobDetails:
+        skill_groups = self.skill_groups
+        # sorting must be after picking main skill, in the xml they use index for that, not id
+        main_socket_group_index = int(self.build_attributes['mainSocketGroup']) - 1
+        main_active_skill = get_main_active_skill(skill_groups, main_socket_group_index)
+        if not main_active_skill:
+            raise BuildWithoutActiveSkillException
+
+        skill_groups.sort(key=lambda x: SLOTS_ORDER.index(x.slot))
+
+        items = extract_items(self.item_texts)
+        return PobDetails(
+            build_stats=self.build_stats,
+            class_name=self.build_attributes['className'],
+            ascendancy_name=self.build_attributes['ascendClassName'],
+            skill_groups=skill_groups,
+            main_active_skills=[main_active_skill],
+            imported_primary_skill=main_active_skill,
+            tree_specs=self.tree_specs,
+            active_tree_spec_index=self.active_tree_spec_index,
+            items=items,
+            item_sets=extract_item_sets(self.item_set_slots, items),
+            active_item_set_id=self.active_item_set_id,
+            used_jewels=extract_used_jewels(self.item_set_slots, self.tree_jewel_ids, items))
+
+
+def extract_used_jewels(item_set_slots: List[Tuple[str, str, List[Tuple[str, int]]]], tree_jewel_ids: Set[int],
+                        items: List[Item]) -> Dict[str, List[Item]]:
     logger.debug('Extracting jewels')
-    jewels_in_tree = set(item_id for spec_xml in xml_root.find('Tree')
-                         for socket_xml in spec_xml.find('Sockets')
-                         if (item_id := int(socket_xml.get('itemId'))) != 0)
-    jewels_in_items = set(item_id for item_set_xml in xml_root.find('Items').findall('ItemSet')
-                          for slot_xml in item_set_xml
-                          if (item_id := int(slot_xml.get('itemId'))) != 0
-                          and 'Abyssal' in slot_xml.get('name'))
-    all_jewels = jewels_in_items | jewels_in_tree
+    jewels_in_items = set(item_id for _, _, slots in item_set_slots
+                          for slot_name, item_id in slots
+                          if item_id != 0 and 'Abyssal' in slot_name)
+    all_jewels = jewels_in_items | tree_jewel_ids
 
     items_by_id = {item.item_id_in_itemset: item for item in items}
     used_jewels = {'abyssal': [],
@@ -110,42 +223,32 @@ def extract_used_jewels(xml_root: ET.Element, items: List[Item]) -> Dict[str, Li
     return used_jewels
 
 
-def extract_active_item_set_id(xml_root: ET.Element) -> str:
-    return active_item_set_index if (active_item_set_index := xml_root.find('Items').get(
-        'activeItemSet')) != 'nil' else '1'
-
-
-def extract_stats(xml_root: ET.Element) -> Dict[str, Union[int, float]]:
-    stats = {}
-    for stat in xml_root.find('Build'):
-        value_str = stat.get('value')
-        name_pref = 'minion_' if stat.tag == 'MinionStat' else ''
-        if value_str is None:
-            continue
-        try:
-            value = int(value_str)
-            name = name_pref + stat.get('stat').lower().replace(":", '_')
-            stats[name] = value
-            continue
-        except ValueError:
-            pass
-        try:
-            value = round(float(value_str), 1)
-            name = name_pref + stat.get('stat').lower().replace(":", '_')
-            stats[name] = value
-        except ValueError:
-            pass
-    return stats
-
-
-def extract_items(xml_root: ET.Element) -> List[Item]:
+def add_stat(stats: Dict[str, Union[int, float]], stat: ET.Element) -> None:
+    value_str = stat.get('value')
+    name_pref = 'minion_' if stat.tag == 'MinionStat' else ''
+    if value_str is None:
+        return
+    try:
+        value = int(value_str)
+        name = name_pref + stat.get('stat').lower().replace(":", '_')
+        stats[name] = value
+        return
+    except ValueError:
+        pass
+    try:
+        value = round(float(value_str), 1)
+        name = name_pref + stat.get('stat').lower().replace(":", '_')
+        stats[name] = value
+    except ValueError:
+        pass
+
+
+def extract_items(item_texts: List[Tuple[int, str]]) -> List[Item]:
     logger.debug('Extracting items')
     items = []
-    pob_instance = PathOfBuilding(POB_PATH, POB_PATH)
+    items_display_html = render_items_html([item_str for _, item_str in item_texts])
 
-    for item_xml in xml_root.find('Items').findall('Item'):
-        item_id = int(item_xml.get('id'))
-        item_str = item_xml.text.strip()
+    for (item_id, item_str), item_display_html in zip(item_texts, items_display_html):
         item_lines = item_str.split('\n')
         item_rarity = item_lines[0].split(': ')[1].strip()
         item_name = item_lines[1].strip()
@@ -154,8 +257,6 @@ def extract_items(xml_root: ET.Element) -> List[Item]:
         else:
             base_name = item_lines[1].strip()
 
-        item_display_html = pob_instance.item_as_html(item_str)
-
         is_broken = True if not item_display_html else False
 
         items.append(Item(item_id_in_itemset=item_id,
@@ -166,10 +267,30 @@ def extract_items(xml_root: ET.Element) -> List[Item]:
                           support_gems=extract_support_gems_from_item(item_lines),
                           is_broken=is_broken))
 
-    pob_instance.kill()
     return items
 
 
+def render_items_html(item_strings: List[str]) -> List[Optional[str]]:
+    keys = [ITEM_HTML_CACHE.key_for(item_str) for item_str in item_strings]
+    cached_html = ITEM_HTML_CACHE.get_many(keys)
+    missing = {key: item_str for key, item_str in zip(keys, item_strings) if key not in cached_html}
+    if missing:
+        with POB_POOL.borrow(timeout=POB_POOL_CHECKOUT_TIMEOUT) as pob_instance:
+            rendered_html = pob_instance.items_as_html(list(missing.values()))
+        new_html = {}
+        for key, item_display_html in zip(missing.keys(), rendered_html):
+            if isinstance(item_display_html, ExternalError):
+                logger.warning('PoB failed to render item: %s', item_display_html.status)
+                cached_html[key] = None
+            else:
+                new_html[key] = item_display_html
+        ITEM_HTML_CACHE.set_many(new_html)
+        cached_html.update(new_html)
+        logger.debug('PoB pool stats: %s', POB_POOL.stats())
+    logger.debug('Item HTML cache stats: %s', ITEM_HTML_CACHE.stats())
+    return [cached_html[key] for key in keys]
+
+
 def extract_support_gems_from_item(item_lines: List[str]) -> List[SkillGem]:
     result = []
     for line in item_lines:
@@ -182,18 +303,16 @@ def extract_support_gems_from_item(item_lines: List[str]) -> List[SkillGem]:
     return result
 
 
-def extract_item_sets(xml_root: ET.Element, items: List[Item]) -> List[ItemSet]:
+def extract_item_sets(item_set_slots: List[Tuple[str, str, List[Tuple[str, int]]]],
+                      items: List[Item]) -> List[ItemSet]:
     logger.debug('Extracting item sets')
     items_by_id = {item.item_id_in_itemset: item for item in items}
     item_sets = []
-    for item_set_xml in xml_root.find('Items').findall('ItemSet'):
-        title = title if (title := item_set_xml.get('title')) is not None else 'Default'
-        set_id = item_set_xml.get('id')
+    for title, set_id, set_slots in item_set_slots:
         slots = {}
-        for slot_xml in item_set_xml:
-            item_id = int(slot_xml.get('itemId'))
+        for slot_name, item_id in set_slots:
             if item_id != 0:
-                slot_name = slot_xml.get('name').lower().replace(' ', '-')
+                slot_name = slot_name.lower().replace(' ', '-')
                 if item_id in items_by_id:
                     slots[slot_name] = items_by_id[item_id]
         item_sets.append(ItemSet(title=title,
@@ -202,23 +321,17 @@ def extract_item_sets(xml_root: ET.Element, items: List[Item]) -> List[ItemSet]:
     return item_sets
 
 
-def extract_tree_specs(xml_root: ET.Element) -> List[TreeSpec]:
-    logger.debug('Extracting tree specs')
-    tree_specs = []
-    for spec_xml in xml_root.find('Tree'):
-        nodes_str = spec_xml.get('nodes')
-        if nodes_str:
-            nodes = nodes_str.split(',')
-            title = title if (title := spec_xml.get('title')) is not None else 'Default'
-            tree_specs.append(TreeSpec(title=title,
-                                       nodes=nodes,
-                                       mastery_effects=extract_mastery_effects(spec_xml),
-                                       url=(spec_xml.find('URL').text.strip()),
-                                       tree_version=(spec_xml.get('treeVersion'))))
-        else:
-            raise TreeParsingException
-
-    return tree_specs
+def extract_tree_spec(spec_xml: ET.Element) -> TreeSpec:
+    nodes_str = spec_xml.get('nodes')
+    if not nodes_str:
+        raise TreeParsingException
+    nodes = nodes_str.split(',')
+    title = title if (title := spec_xml.get('title')) is not None else 'Default'
+    return TreeSpec(title=title,
+                    nodes=nodes,
+                    mastery_effects=extract_mastery_effects(spec_xml),
+                    url=(spec_xml.find('URL').text.strip()),
+                    tree_version=(spec_xml.get('treeVersion')))
 
 
 def extract_mastery_effects(spec_xml):
@@ -231,24 +344,19 @@ def extract_mastery_effects(spec_xml):
     return mastery_effects
 
 
-def extract_skills_groups(xml_root: ET.Element) -> List[SkillGroup]:
-    logger.debug('Extracting skill groups')
-
-    skill_groups = []
-    for group_xml in xml_root.find('Skills'):
-        source = group_xml.get('source')
-        slot = slot if (slot := group_xml.get('slot')) else 'Unassigned'
-        gems = extract_gems_in_group(group_xml)
+def extract_skill_group(group_xml: ET.Element) -> SkillGroup:
+    source = group_xml.get('source')
+    slot = slot if (slot := group_xml.get('slot')) else 'Unassigned'
+    gems = extract_gems_in_group(group_xml)
 
-        is_ignored = (not gems) or (source is not None and source.startswith('Tree'))
+    is_ignored = (not gems) or (source is not None and source.startswith('Tree'))
 
-        is_group_enabled = parse_bool(group_xml.get('enabled'))
-        main_active_skill_index = group_xml.get('mainActiveSkill')
-        main_active_skill_index = int(main_active_skill_index) - 1 if not main_active_skill_index == 'nil' else 0
-        skill_groups.append(SkillGroup(is_enabled=is_group_enabled,
-                                       main_active_skill_index=main_active_skill_index,
-                                       gems=gems, source=source, slot=slot, is_ignored=is_ignored))
-    return skill_groups
+    is_group_enabled = parse_bool(group_xml.get('enabled'))
+    main_active_skill_index = group_xml.get('mainActiveSkill')
+    main_active_skill_index = int(main_active_skill_index) - 1 if not main_active_skill_index == 'nil' else 0
+    return SkillGroup(is_enabled=is_group_enabled,
+                      main_active_skill_index=main_active_skill_index,
+                      gems=gems, source=source, slot=slot, is_ignored=is_ignored)
 
 
 def extract_gems_in_group(group_xml: ET.Element) -> List[SkillGem]:
@@ -273,16 +381,12 @@ def extract_gems_in_group(group_xml: ET.Element) -> List[SkillGem]:
 
 
 def get_nonvaal_gem_version(gem: SkillGem) -> SkillGem:
-    nonvaal_gem = copy.copy(gem)
-    nonvaal_gem.name = gem.name.replace('Vaal ', '')
-    nonvaal_gem.is_fake = True
-    return nonvaal_gem
+    return dataclasses.replace(gem, name=gem.name.replace('Vaal ', ''), is_fake=True, asset_path=None)
 
 
-def get_main_active_skill(skill_groups: List[SkillGroup], xml_root: ET.Element) -> Optional[str]:
+def get_main_active_skill(skill_groups: List[SkillGroup], main_socket_group_index: int) -> Optional[str]:
     if not len(skill_groups):
         return None
-    main_socket_group_index = int(xml_root.find('Build').get('mainSocketGroup')) - 1
     main_socket_group = skill_groups[main_socket_group_index]
     main_skill_index_within_group = main_socket_group.main_active_skill_index
     active_gems_in_main_group = list(filter(lambda x: x.is_active_skill, main_socket_group.gems))
@@ -0,0 +1,54 @@
+# manage.py runscript gem_resolution_benchmark --script-args 1000
+import random
+import tempfile
+import time
+
+from django.contrib.staticfiles import finders
+
+from GuideToExile import items_service
+from GuideToExile.settings import GEMS_FILE
+
+BUILD_GEMS_COUNT = 60
+
+
+def resolve_gems(gems_data, skill_ids):
+    return [(gems_data.get_name(skill_id, None), gems_data.is_gem_active(skill_id)) for skill_id in skill_ids]
+
+
+class ListScanGemsData:
+    """Active gems kept in a list, as GemsData did before the index."""
+
+    def __init__(self, gem_index):
+        self.gem_index = gem_index
+        self.active_skill_gems = sorted(gem_index.active_skill_gems)
+
+    def get_name(self, skill_id, gem_id):
+        return self.gem_index.skill_id_to_name_mapping.get(skill_id, f'Unknown skill {skill_id}')
+
+    def is_gem_active(self, skill_id):
+        return skill_id in self.active_skill_gems
+
+
+def run(*args):
+    repeats = int(args[0]) if args else 1000
+    gems_file = finders.find(GEMS_FILE)
+
+    start = time.perf_counter()
+    gem_index = items_service._read_gems_file(gems_file)
+    print(f'load gems.min.json: {(time.perf_counter() - start) * 1000:.1f} ms')
+    with tempfile.TemporaryDirectory() as index_dir:
+        index_file = f'{index_dir}/gem_index.pickle'
+        items_service.compile_gem_index(gems_file, index_file)
+        start = time.perf_counter()
+        _ = items_service.GemsData(index_file).index
+        print(f'load compiled index: {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    skill_ids = random.Random(0).sample(sorted(gem_index.skill_id_to_name_mapping), BUILD_GEMS_COUNT)
+    gems_data = items_service.GemsData()
+    gems_data._index = gem_index
+    for name, implementation in (('list scan', ListScanGemsData(gem_index)), ('index', gems_data)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            resolve_gems(implementation, skill_ids)
+        resolve_time = (time.perf_counter() - start) / repeats
+        print(f'resolve {BUILD_GEMS_COUNT} gems with {name}: {resolve_time * 1000:.3f} ms')
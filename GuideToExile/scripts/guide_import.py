@@ -1,15 +1,20 @@
-# manage.py runscript guide_import
+# manage.py runscript guide_import --script-args replay
 import collections
 import logging
 import re
+import time
+from typing import List, Optional
 
 import cfscrape
+import requests
 from bs4 import BeautifulSoup
 from django.contrib.auth import get_user_model
 
-from GuideToExile import pob_import, build_guide, skill_tree
+from GuideToExile import pob_import, build_guide, skill_tree, pastebin
+from GuideToExile.crawler import Crawler
 from GuideToExile.models import BuildGuide
-from GuideToExile.settings import GUIDE_IMPORT_USERNAME, GUIDE_IMPORT_MAIL, GUIDE_IMPORT_PASSWORD
+from GuideToExile.settings import GUIDE_IMPORT_USERNAME, GUIDE_IMPORT_MAIL, GUIDE_IMPORT_PASSWORD, \
+    FORUM_CRAWLER_CACHE_DIR, FORUM_CRAWLER_CACHE_TTL, FORUM_CRAWLER_CONCURRENCY
 
 logger = logging.getLogger('guidetoexile')
 
@@ -28,17 +33,42 @@ PASTEBIN_URL_REGEX = re.compile(r'https://pastebin\.com/\w*')
 skill_tree_service = skill_tree.SkillTreeService()
 
 
-def run():
+def run(*args):
+    """With `replay` the forum and Pastebin responses saved by an earlier run are used, nothing is downloaded."""
     if not BuildGuide.objects.count() == 0:
         return
+    start = time.perf_counter()
     user = make_importing_user()
-    urls = generate_urls()
-    guides_data = []
-    for url in urls:
-        guides_data.extend(scrape_forum_section_page(url))
+    with make_crawler(replay='replay' in args) as crawler:
+        guides_data = scrape_forum(generate_urls(), crawler)
+        paste_fetcher = pastebin.PasteFetcher(CrawlerPasteSource(crawler))
+        import_strs = crawler.map(paste_fetcher.fetch, [data.pastebin_url for data in guides_data])
+        for data, import_str in zip(guides_data, import_strs):
+            if import_str:
+                make_new_guide(data, user, import_str)
+        logger.info('Processed %s guides in %.1f s, crawler stats: %s', len(guides_data),
+                    time.perf_counter() - start, crawler.stats())
 
-    for data in guides_data:
-        make_new_guide(data, user)
+
+def make_crawler(replay: bool = False) -> Crawler:
+    return Crawler(FORUM_CRAWLER_CACHE_DIR, concurrency=FORUM_CRAWLER_CONCURRENCY, cache_ttl=FORUM_CRAWLER_CACHE_TTL,
+                   replay=replay, session_factory=create_session)
+
+
+def create_session(host: str):
+    if host == 'www.pathofexile.com':
+        return cfscrape.create_scraper()
+    return requests.Session()
+
+
+class CrawlerPasteSource:
+    """Raw pastes downloaded by the crawler, so they are saved and replayed along with the forum pages."""
+
+    def __init__(self, crawler: Crawler):
+        self.crawler = crawler
+
+    def get(self, paste_id: str) -> str:
+        return self.crawler.fetch(pastebin.RAW_PASTE_URL.format(paste_id)).decode('utf-8')
 
 
 def make_importing_user():
@@ -49,13 +79,13 @@ def make_importing_user():
     return user
 
 
-def make_new_guide(guide_details, user):
+def make_new_guide(guide_details, user, import_str: Optional[str] = None):
     if not BuildGuide.objects.filter(title=guide_details.title).exists():
         logger.info(f'Creating guide {guide_details.title=}')
         try:
-            import_str = pob_import.import_from_pastebin(guide_details.pastebin_url)
-            build_xml = pob_import.base64_to_xml(import_str)
-            pob_details = pob_import.parse_pob_details(build_xml)
+            if import_str is None:
+                import_str = pastebin.fetch_paste(guide_details.pastebin_url)
+            pob_details = pob_import.get_or_parse_pob_string(import_str)
             guide = build_guide.create_build_guide(user.userprofile, pob_details, import_str, skill_tree_service,
                                                    guide_details.post_content, guide_details.title)
             build_guide.publish_guide(guide)
@@ -66,11 +96,24 @@ def make_new_guide(guide_details, user):
 guide_data = collections.namedtuple('GuideData', ['post_content', 'pastebin_url', 'title'])
 
 
+def scrape_forum(section_urls: List[str], crawler: Crawler) -> List[guide_data]:
+    section_pages = crawler.fetch_many(section_urls)
+    # a thread can show up on several pages, dict keeps the first occurrence of each
+    threads_urls = list(dict.fromkeys(thread_url for page in section_pages if page
+                                      for thread_url in find_threads_urls(page)))
+    thread_pages = crawler.fetch_many(threads_urls)
+    return [data for thread_url, page in zip(threads_urls, thread_pages)
+            if page and (data := parse_guide_thread(thread_url, page))]
+
+
 def scrape_guide_thread(thread_url):
     logger.info(f'Scraping {thread_url=}')
-    scraper = cfscrape.create_scraper()
-    page = scraper.get(thread_url)
-    soup = BeautifulSoup(page.content, "html.parser")
+    with make_crawler() as crawler:
+        return parse_guide_thread(thread_url, crawler.fetch(thread_url))
+
+
+def parse_guide_thread(thread_url, page_content):
+    soup = BeautifulSoup(page_content, "html.parser")
     table = soup.find('table')
     post, post_info = table.find_all('td')[0:2]
     pastebin_url = find_pastebin_url(post)
@@ -106,13 +149,14 @@ def parse_post_info(post_info):
 
 
 def scrape_forum_section_page(page_url):
-    scraper = cfscrape.create_scraper()
-    page = scraper.get(page_url)
-    soup = BeautifulSoup(page.content, "html.parser")
+    with make_crawler() as crawler:
+        return scrape_forum([page_url], crawler)
+
+
+def find_threads_urls(page_content):
+    soup = BeautifulSoup(page_content, "html.parser")
     titles = soup.find_all('div', class_='title')
-    threads_urls = ['https://www.pathofexile.com' + title.find('a').get('href') for title in titles]
-    guides_data = [data for thread_url in threads_urls if (data := scrape_guide_thread(thread_url))]
-    return guides_data
+    return ['https://www.pathofexile.com' + title.find('a').get('href') for title in titles]
 
 
 def generate_urls():
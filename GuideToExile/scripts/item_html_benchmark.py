@@ -0,0 +1,68 @@
+# manage.py runscript item_html_benchmark --script-args 200
+import copy
+import json
+import time
+
+from django.db import connection
+from django.db.models import Sum
+from django.db.models.functions import Length
+
+from GuideToExile import json_encoder, item_html_store
+from GuideToExile.models import BuildSnapshot, ItemHtml
+
+
+def load_gear_rows(limit: int):
+    """pob_gear of stored builds as the DB returns them, before the field decodes them."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT pob_gear FROM "{BuildSnapshot._meta.db_table}" LIMIT %s', [limit])
+        return [row if isinstance(row, str) else json.dumps(row) for row, in cursor.fetchall()]
+
+
+def gear_items(gear: dict):
+    return item_html_store.iter_gear_items(gear['items'], gear['item_sets'], gear['used_jewels'])
+
+
+def decode(row: str):
+    return json.loads(row, cls=json_encoder.BuildDetailsJsonDecoder)
+
+
+def decode_with_html(row: str):
+    gear = decode(row)
+    item_html_store.load_items_html(gear_items(gear))
+    return gear
+
+
+def inline_html(row: str) -> str:
+    """The row as it was stored before item HTML had its own table."""
+    gear = copy.deepcopy(decode_with_html(row))
+    for item in gear_items(gear):
+        item.display_html_key = None
+    return json.dumps(gear, cls=json_encoder.BuildDetailsJsonEncoder)
+
+
+def measure(fn, rows):
+    start = time.perf_counter()
+    for row in rows:
+        fn(row)
+    return (time.perf_counter() - start) / len(rows)
+
+
+def run(*args):
+    limit = int(args[0]) if args else 200
+    rows = load_gear_rows(limit)
+    if not rows:
+        print('No stored builds to measure')
+        return
+    inline_rows = [inline_html(row) for row in rows]
+
+    inline_size = sum(map(len, inline_rows))
+    stored_size = sum(map(len, rows))
+    table_size = ItemHtml.objects.aggregate(size=Sum(Length('html')))['size'] or 0
+    print(f'{len(rows)} builds, {ItemHtml.objects.count()} distinct items HTML')
+    print(f'inline HTML: {inline_size / 1024:.0f} KB, '
+          f'HTML by key: {stored_size / 1024:.0f} KB + {table_size / 1024:.0f} KB in the ItemHtml table '
+          f'(the whole table, including builds not measured)')
+    print(f'{"format":<14}{"gear decode per build [ms]":>28}')
+    for name, decode_fn, measured_rows in (('inline HTML', decode, inline_rows),
+                                           ('HTML by key', decode_with_html, rows)):
+        print(f'{name:<14}{measure(decode_fn, measured_rows) * 1000:>28.2f}')
@@ -1,13 +1,91 @@
-# manage.py runscript ladder_imports
+# manage.py runscript ladder_imports --script-args <ladder json> <workers> <requests per second>
 import json
 import logging
-from time import sleep
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, TextIO, Tuple
+
+from django import db
+from django.db import transaction
 
 from GuideToExile import pob_import, skill_tree
 from GuideToExile.build_guide import create_build_guide
+from GuideToExile.data_classes import PobDetails
 from GuideToExile.models import UserProfile
-from GuideToExile.settings import POB_PATH
-from apps.pob_wrapper import PathOfBuilding
+from GuideToExile.settings import POB_POOL_CHECKOUT_TIMEOUT
+
+logger = logging.getLogger('guidetoexile')
+
+LADDER_PATH = 'GuideToExile/scripts/ssf_expedition_ladder.json'
+WORKERS = 4
+# characters are fetched from the official API by PoB, keep well below its rate limit
+REQUESTS_PER_SECOND = 1.0
+BATCH_SIZE = 50
+READ_CHUNK_SIZE = 64 * 1024
+ENTRIES_REGEX = re.compile(r'"entries"\s*:\s*\[')
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def iter_ladder_entries(file: TextIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[dict]:
+    """Entries of a ladder API response, decoded one at a time instead of loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while (match := ENTRIES_REGEX.search(buffer)) is None:
+        if eof:
+            return
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+    pos = match.end()
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer):
+            if buffer[pos] == ']':
+                return
+            try:
+                entry, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield entry
+                continue
+        elif eof:
+            raise ValueError('Ladder entries are not terminated')
+        # the entry continues in the next chunk
+        buffer = buffer[pos:]
+        pos = 0
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
 
 
 def get_acc_and_chars_from_json(ladder_json):
@@ -17,33 +95,116 @@ def get_acc_and_chars_from_json(ladder_json):
 
 
 def get_pob_xml(acc_name, char_name):
-    pob = PathOfBuilding(POB_PATH, POB_PATH)
-    xml = pob.import_build_as_xml(acc_name, char_name)
-    pob.kill()
-    return xml
+    with pob_import.POB_POOL.borrow(timeout=POB_POOL_CHECKOUT_TIMEOUT) as pob:
+        return pob.import_build_as_xml(acc_name, char_name)
 
 
-def save_as_guide(acc_name, char_name, count, skill_tree_service):
-    logging.info(f'{count} converting to guide: {acc_name=}, {char_name=}')
+def fetch_and_parse(acc_name: str, char_name: str) -> Optional[Tuple[str, PobDetails]]:
+    """Runs in a pool process, each of them keeps its own warm PoB workers between characters."""
     build_xml = get_pob_xml(acc_name, char_name)
     if not build_xml:
-        return
-    build_details = pob_import.parse_pob_details(build_xml)
-    title = 'Auto-imported build ' + str(count)
-    text = 'Auto-imported build ' + str(count)
+        return None
+    return build_xml, pob_import.get_or_parse_pob_details(build_xml)
+
+
+def save_as_guide(acc_name, char_name, count, skill_tree_service):
+    logger.info(f'{count} converting to guide: {acc_name=}, {char_name=}')
+    fetched = fetch_and_parse(acc_name, char_name)
+    if fetched:
+        save_guides([(count, *fetched)], skill_tree_service)
+
+
+def save_guides(builds: List[Tuple[int, str, PobDetails]], skill_tree_service) -> int:
+    """Saves a batch of builds in one transaction, a build that can't be saved is skipped."""
     author = UserProfile.objects.get_or_create(user__username='Importer')[0]
-    author.save()
-    pob_string = pob_import.xml_to_base64(build_xml)
+    saved = 0
+    with transaction.atomic():
+        for count, build_xml, build_details in builds:
+            title = 'Auto-imported build ' + str(count)
+            text = 'Auto-imported build ' + str(count)
+            pob_string = pob_import.xml_to_base64(build_xml)
+            try:
+                with transaction.atomic():
+                    create_build_guide(author, build_details, pob_string, skill_tree_service, text, title)
+            except Exception:
+                logger.warning('Failed to save build %s', count, exc_info=True)
+            else:
+                saved += 1
+    return saved
+
+
+def read_checkpoint(checkpoint_path: str) -> int:
+    try:
+        with open(checkpoint_path, 'r') as f:
+            return json.load(f)['processed']
+    except FileNotFoundError:
+        return 0
 
-    create_build_guide(author, build_details, pob_string, skill_tree_service, text, title)
 
+def write_checkpoint(checkpoint_path: str, processed: int) -> None:
+    tmp_path = f'{checkpoint_path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'processed': processed}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def run(*args):
+    ladder_path = args[0] if args else LADDER_PATH
+    workers = int(args[1]) if len(args) > 1 else WORKERS
+    rate_limiter = TokenBucket(float(args[2]) if len(args) > 2 else REQUESTS_PER_SECOND)
+    checkpoint_path = f'{ladder_path}.checkpoint'
+    skipped = read_checkpoint(checkpoint_path)
+    if skipped:
+        logger.info('Resuming %s after %s characters', ladder_path, skipped)
 
-def run():
     skill_tree_service = skill_tree.SkillTreeService()
-    path = 'GuideToExile/scripts/ssf_expedition_ladder.json'
-    with open(path, 'r') as f:
-        ladder_json = json.load(f)
-    chars = get_acc_and_chars_from_json(ladder_json)
-    for count, char in enumerate(chars):
-        save_as_guide(*char, count, skill_tree_service)
-        sleep(1)
+    processed, saved, failed = skipped, 0, 0
+    batch = []
+    in_flight = deque()
+    start = time.perf_counter()
+
+    def collect_oldest():
+        nonlocal processed, failed
+        count, acc_name, char_name, future = in_flight.popleft()
+        try:
+            fetched = future.result()
+        except Exception:
+            logger.warning('Failed to import %s/%s', acc_name, char_name, exc_info=True)
+            failed += 1
+            fetched = None
+        if fetched:
+            batch.append((count, *fetched))
+        processed = count + 1
+        if len(batch) >= BATCH_SIZE:
+            flush()
+
+    def flush():
+        nonlocal saved, failed
+        if batch:
+            saved_count = save_guides(batch, skill_tree_service)
+            saved += saved_count
+            failed += len(batch) - saved_count
+            batch.clear()
+        write_checkpoint(checkpoint_path, processed)
+        rate = (processed - skipped) / (time.perf_counter() - start)
+        logger.info('%s characters processed, %s guides saved, %s failed, %.2f characters/s',
+                    processed, saved, failed, rate)
+
+    # pool processes are forked, they must not share the parent's DB connections
+    db.connections.close_all()
+    with open(ladder_path, 'r', encoding='utf-8') as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        read_count = skipped
+        for count, entry in enumerate(iter_ladder_entries(f)):
+            read_count = max(read_count, count + 1)
+            if count < skipped or 'public' not in entry:
+                continue
+            rate_limiter.acquire()
+            acc_name, char_name = entry['account']['name'], entry['character']['name']
+            in_flight.append((count, acc_name, char_name, executor.submit(fetch_and_parse, acc_name, char_name)))
+            if len(in_flight) >= workers * 2:
+                collect_oldest()
+        while in_flight:
+            collect_oldest()
+    # entries after the last public one count as processed too, so a resumed run doesn't read them again
+    processed = read_count
+    flush()
@@ -0,0 +1,54 @@
+# manage.py runscript pob_details_serialization_benchmark --script-args 200
+import json
+import time
+
+import jsonpickle
+
+from GuideToExile import json_encoder
+from GuideToExile.models import BuildSnapshot
+
+
+def encode_jsonpickle(pob_details) -> str:
+    """What BuildDetailsJsonEncoder did before the schema: pickle, parse back and dump again."""
+    return json.dumps(json.loads(jsonpickle.encode(pob_details, make_refs=False)))
+
+
+def decode_jsonpickle(row: str):
+    return json.loads(row, object_hook=lambda obj: jsonpickle.decode(json.dumps(obj)) if obj.get(
+        'py/object') == 'GuideToExile.data_classes.PobDetails' else obj)
+
+
+def encode_schema(pob_details) -> str:
+    return json.dumps(pob_details, cls=json_encoder.BuildDetailsJsonEncoder)
+
+
+def decode_schema(row: str):
+    return json.loads(row, cls=json_encoder.BuildDetailsJsonDecoder)
+
+
+def load_pob_details(limit: int):
+    return [snapshot.pob_details for snapshot in BuildSnapshot.objects.defer('pob_string')[:limit]]
+
+
+def measure(fn, values):
+    start = time.perf_counter()
+    results = [fn(value) for value in values]
+    return results, (time.perf_counter() - start) / len(values)
+
+
+def run(*args):
+    limit = int(args[0]) if args else 200
+    pob_details = load_pob_details(limit)
+    if not pob_details:
+        print('No stored builds to measure')
+        return
+
+    print(f'{len(pob_details)} builds')
+    print(f'{"format":<12}{"encode [ms]":>13}{"decode [ms]":>13}{"size [KB]":>11}')
+    for name, encode, decode in (('jsonpickle', encode_jsonpickle, decode_jsonpickle),
+                                 ('schema', encode_schema, decode_schema)):
+        encoded, encode_time = measure(encode, pob_details)
+        decoded, decode_time = measure(decode, encoded)
+        assert decoded == pob_details
+        size = sum(map(len, encoded)) / len(encoded) / 1024
+        print(f'{name:<12}{encode_time * 1000:>13.2f}{decode_time * 1000:>13.2f}{size:>11.1f}')
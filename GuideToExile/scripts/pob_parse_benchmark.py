@@ -0,0 +1,74 @@
+# manage.py runscript pob_parse_benchmark --script-args 5
+import copy
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from GuideToExile import pob_import
+
+TEST_POB_PATH = 'GuideToExile/test_data/test_pob.xml'
+SYNTHETIC_SCALES = [10, 100]
+
+
+def make_synthetic_build(xml: str, scale: int) -> str:
+    """The test build with its items, item sets, skill groups and tree specs repeated `scale` times."""
+    xml_root = ET.fromstring(xml)
+    items_xml = xml_root.find('Items')
+    items = items_xml.findall('Item')
+    max_id = max(int(item_xml.get('id')) for item_xml in items)
+    for copy_index in range(1, scale):
+        for item_xml in items:
+            item_copy = copy.deepcopy(item_xml)
+            item_copy.set('id', str(int(item_xml.get('id')) + copy_index * max_id))
+            items_xml.append(item_copy)
+    for section_name in ('Skills', 'Tree'):
+        section_xml = xml_root.find(section_name)
+        section_xml.extend(copy.deepcopy(child) for _ in range(1, scale) for child in list(section_xml))
+    return ET.tostring(xml_root, encoding='unicode')
+
+
+def parse_as_tree(xml: str):
+    """What parse_pob_details did before streaming: the whole document as an ElementTree, walked per section."""
+    xml_root = ET.fromstring(xml)
+    stats = {}
+    for stat_xml in xml_root.find('Build'):
+        pob_import.add_stat(stats, stat_xml)
+    skill_groups = [pob_import.extract_skill_group(group_xml) for group_xml in xml_root.find('Skills')]
+    tree_specs = [pob_import.extract_tree_spec(spec_xml) for spec_xml in xml_root.find('Tree')]
+    item_texts = [(int(item_xml.get('id')), item_xml.text.strip()) for item_xml in xml_root.find('Items').findall('Item')]
+    return xml_root, stats, skill_groups, tree_specs, item_texts
+
+
+def parse_streaming(xml: str):
+    reader = pob_import.PobXmlReader()
+    for start in range(0, len(xml), 64 * 1024):
+        reader.feed(xml[start:start + 64 * 1024])
+    reader.close()
+    return reader
+
+
+def measure(parse_fn, xml: str, repeats: int):
+    tracemalloc.start()
+    result = parse_fn(xml)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        parse_fn(xml)
+    return (time.perf_counter() - start) / repeats, peak
+
+
+def run(*args):
+    repeats = int(args[0]) if args else 5
+    with open(TEST_POB_PATH, 'r') as f:
+        test_xml = f.read()
+    builds = [('test_pob.xml', test_xml)] + [(f'synthetic x{scale}', make_synthetic_build(test_xml, scale))
+                                             for scale in SYNTHETIC_SCALES]
+
+    print(f'{"build":<16}{"size [KB]":>11}{"parser":>11}{"time [ms]":>11}{"peak memory [KB]":>18}')
+    for name, xml in builds:
+        for parser_name, parse_fn in (('tree', parse_as_tree), ('streaming', parse_streaming)):
+            parse_time, peak = measure(parse_fn, xml, repeats)
+            print(f'{name:<16}{len(xml) / 1024:>11.0f}{parser_name:>11}{parse_time * 1000:>11.1f}{peak / 1024:>18.0f}')
@@ -0,0 +1,52 @@
+# manage.py runscript publish_benchmark --script-args 50
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from GuideToExile import build_guide
+from GuideToExile.models import BuildGuide, Keystone, UniqueItem, ActiveSkill
+
+BENCHMARK_USERNAME = 'publish-benchmark'
+
+
+class Rollback(Exception):
+    pass
+
+
+def make_draft(user) -> BuildGuide:
+    draft = BuildGuide.objects.create(status=BuildGuide.GuideStatus.DRAFT, author=user.userprofile, title='Benchmark')
+    draft.primary_skills.set(ActiveSkill.objects.all()[:2])
+    for model, field, count in ((Keystone, draft.keystones, 6), (UniqueItem, draft.unique_items, 15)):
+        model.objects.bulk_create(model(name=f'{BENCHMARK_USERNAME} {i}') for i in range(count))
+        field.set(model.objects.filter(name__startswith=BENCHMARK_USERNAME))
+    return draft
+
+
+def measure(operation, repeats):
+    with CaptureQueriesContext(connection) as queries:
+        operation()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        operation()
+    return len(queries), (time.perf_counter() - start) / repeats
+
+
+def run(*args):
+    """Everything is created in a transaction that is rolled back, the DB is left as it was."""
+    repeats = int(args[0]) if args else 50
+    try:
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(BENCHMARK_USERNAME)
+            draft = make_draft(user)
+            public_guide = build_guide.publish_guide(draft)
+            results = [('publish', measure(lambda: build_guide.publish_guide(draft), repeats)),
+                       ('clear draft', measure(lambda: build_guide.clear_draft(public_guide), repeats))]
+            raise Rollback()
+    except Rollback:
+        pass
+
+    print(f'{"operation":<14}{"queries":>9}{"time [ms]":>11}')
+    for name, (query_count, duration) in results:
+        print(f'{name:<14}{query_count:>9}{duration * 1000:>11.2f}')
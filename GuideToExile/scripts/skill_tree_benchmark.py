@@ -0,0 +1,126 @@
+# manage.py runscript skill_tree_benchmark --script-args 20
+import copy
+import math
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from GuideToExile import skill_tree, tree_geometry
+from GuideToExile.tree_graph import TreeGraph
+
+TREES_DIR = 'GuideToExile/trees'
+TAKEN_NODES_COUNT = 120
+
+
+def pick_taken_nodes(tree_graph: TreeGraph):
+    rng = random.Random(0)
+    taken_node_ids = rng.sample(sorted(tree_graph.nodes), TAKEN_NODES_COUNT)
+    taken_node_ids.append(next(iter(tree_graph.skill_tree.asc_start_nodes.values())))
+    return taken_node_ids
+
+
+def reference_geometry(tree):
+    """Per-node geometry as computed before it was vectorised, kept to compare against."""
+    for asc in skill_tree._find_asc_groups(tree.node_groups, tree.nodes).values():
+        center_group = skill_tree._find_asc_center_group(asc, tree.nodes)
+        move_x = tree.max_x + skill_tree.ASC_TREE_OFFSET_X - center_group.x
+        move_y = tree.min_y + skill_tree.ASC_TREE_OFFSET_Y - center_group.y
+        for group in asc:
+            group.x = group.x + move_x
+            group.y = group.y + move_y
+
+    positions = {}
+    for group in tree.node_groups.values():
+        for node_id in group.node_ids:
+            node = tree.nodes[node_id]
+            angle_radians = math.radians((360.0 / tree.skills_per_orbit[node.orbit_radii]) * node.orbit_index - 90.0)
+            orbit_radius = tree.orbit_radii[node.orbit_radii]
+            positions[node_id] = (math.cos(angle_radians) * orbit_radius + group.x,
+                                  math.sin(angle_radians) * orbit_radius + group.y)
+
+    clockwise = {}
+    for node_id, node in tree.nodes.items():
+        for connected_node_id in node.connected_out_nodes:
+            if not node.is_connected_to(tree.nodes[connected_node_id]):
+                continue
+            group = tree.find_group_containing_node(node_id)
+            start_pos, end_pos = positions[node_id], positions[connected_node_id]
+            det = ((start_pos[0] - group.x) * (end_pos[1] - group.y)
+                   - (end_pos[0] - group.x) * (start_pos[1] - group.y))
+            clockwise[(node_id, connected_node_id)] = det <= 0
+    return positions, clockwise
+
+
+def vectorised_geometry(tree):
+    skill_tree._move_asc_groups_to_pos(tree.node_groups, tree.nodes, tree.max_x + skill_tree.ASC_TREE_OFFSET_X,
+                                       tree.min_y + skill_tree.ASC_TREE_OFFSET_Y)
+    node_ids, groups = [], []
+    for group in tree.node_groups.values():
+        for node_id in group.node_ids:
+            node_ids.append(node_id)
+            groups.append(group)
+    positions = tree_geometry.calculate_node_positions(
+        [tree.nodes[node_id].orbit_radii for node_id in node_ids],
+        [tree.nodes[node_id].orbit_index for node_id in node_ids],
+        [group.x for group in groups], [group.y for group in groups], tree.skills_per_orbit, tree.orbit_radii)
+    rows = {node_id: row for row, node_id in enumerate(node_ids)}
+
+    edges = [(node_id, connected_node_id) for node_id, node in tree.nodes.items()
+             for connected_node_id in node.connected_out_nodes if node.is_connected_to(tree.nodes[connected_node_id])]
+    start_rows = [rows[node_id] for node_id, _ in edges]
+    end_rows = [rows[connected_node_id] for _, connected_node_id in edges]
+    centres = np.array([(group.x, group.y) for group in map(tree.find_group_containing_node, (e[0] for e in edges))])
+    clockwise = tree_geometry.are_paths_clockwise(positions[start_rows], positions[end_rows], centres)
+    return positions, clockwise
+
+
+def benchmark_geometry(tree):
+    results = []
+    for geometry_fn in (reference_geometry, vectorised_geometry):
+        tree_copy = copy.deepcopy(tree)
+        start = time.perf_counter()
+        geometry_fn(tree_copy)
+        results.append(time.perf_counter() - start)
+    return results
+
+
+def benchmark_version(version, renders):
+    start = time.perf_counter()
+    tree = skill_tree._read_tree_data_file(f'{TREES_DIR}/{version}/data.json')
+    tree_graph = TreeGraph(tree)
+    load_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        skill_tree.compile_tree_artifact(version, TREES_DIR, artifact_dir)
+        start = time.perf_counter()
+        skill_tree.SkillTreeService(TREES_DIR, artifact_dir).tree_graphs[version]
+        artifact_load_time = time.perf_counter() - start
+
+    reference_geometry_time, geometry_time = benchmark_geometry(tree)
+
+    taken_node_ids = pick_taken_nodes(tree_graph)
+    start = time.perf_counter()
+    tree_graph.as_html_with_taken_nodes(taken_node_ids)
+    first_render_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(renders):
+        tree_graph.as_html_with_taken_nodes(taken_node_ids)
+    render_time = (time.perf_counter() - start) / renders
+    return load_time, artifact_load_time, reference_geometry_time, geometry_time, first_render_time, render_time
+
+
+def run(*args):
+    renders = int(args[0]) if args else 20
+    versions = sorted(f.name for f in os.scandir(TREES_DIR) if f.is_dir())
+    print(f'{"version":<10}{"cold load [ms]":>16}{"artifact load [ms]":>20}{"per-node geometry [ms]":>24}'
+          f'{"numpy geometry [ms]":>21}{"first render [ms]":>20}{"render [ms]":>14}')
+    for version in versions:
+        (load_time, artifact_load_time, reference_geometry_time, geometry_time, first_render_time,
+         render_time) = benchmark_version(version, renders)
+        print(f'{version:<10}{load_time * 1000:>16.1f}{artifact_load_time * 1000:>20.1f}'
+              f'{reference_geometry_time * 1000:>24.1f}{geometry_time * 1000:>21.1f}'
+              f'{first_render_time * 1000:>20.1f}{render_time * 1000:>14.2f}')
@@ -191,6 +191,32 @@ SOCIALACCOUNT_PROVIDERS = {
     }
 }
 
+# ##### CACHE CONFIGURATION ###############################
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # taken nodes and paths of rendered skill trees, a few KB each, culled above MAX_ENTRIES
+    'skill_trees': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'skill_trees',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # raw Pastebin pastes by paste ID, a link submitted again within TIMEOUT seconds isn't downloaded again
+    'pastes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pastes',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+        },
+    },
+}
+
 # ##### DEBUG CONFIGURATION ###############################
 DEBUG = False
 
@@ -276,6 +302,21 @@ DJANGO_TIPTAP_CONFIG = {
 
 # ##### OTHER CONFIGURATION ###############################
 
+# PoB imports are queued as PobImportJob rows and processed by `manage.py run_import_worker`
+IMPORT_JOB_MAX_ATTEMPTS = 3
+IMPORT_JOB_RETRY_DELAY = 30
+# seconds a job may run, its worker gives up after the stage that overruns it and other workers pick it up again
+IMPORT_JOB_TIMEOUT = 300
+IMPORT_WORKER_POLL_INTERVAL = 1
+
+# SVG base layers of skill trees are generated once and kept here
+TREE_SVG_CACHE_DIR = join(PROJECT_ROOT, 'run', 'tree_svg')
+
+# skill trees compiled with `manage.py compile_skill_trees`, data.json is parsed only for versions missing here
+SKILL_TREE_ARTIFACT_DIR = join(PROJECT_ROOT, 'run', 'trees')
+# tree versions kept in memory per worker, CURRENT_TREE_VERSION included, older ones are loaded again on demand
+SKILL_TREE_MAX_RESIDENT_VERSIONS = 2
+
 ASC_TREE_X = 7000
 ASC_TREE_Y = -5500
 
@@ -285,10 +326,40 @@ ASSET_DIR = 'poe_assets'
 BASE_ITEMS_LOOKUP_FILE = join('poe_assets', 'base_items_lookup.json')
 UNIQUE_ITEMS_LOOKUP_FILE = join('poe_assets', 'unique_items_lookup.json')
 GEMS_FILE = join('poe_assets', 'gems.min.json')
+# gems.min.json compiled with `manage.py compile_gem_index`
+GEM_INDEX_FILE = join(PROJECT_ROOT, 'run', 'gem_index.pickle')
+
+# warm Path of Building processes kept per web worker, each one is recycled after POB_POOL_MAX_REQUESTS imports
+POB_POOL_SIZE = 2
+POB_POOL_MAX_REQUESTS = 200
+POB_POOL_CHECKOUT_TIMEOUT = 60
+# seconds to wait for a single PoB response and for PoB to boot, a PoB process is restarted when exceeded
+POB_REQUEST_TIMEOUT = 60
+POB_START_TIMEOUT = 120
+
+# rendered item HTML kept in the DB, least recently used entries are dropped above the limit
+ITEM_HTML_CACHE_MAX_ENTRIES = 50000
+# parsed builds kept in the DB by hash of their XML, so importing the same build again skips parsing
+PARSED_BUILD_CACHE_MAX_ENTRIES = 5000
+
+# export codes are inflated in chunks, imports inflating to more than this are rejected
+POB_XML_MAX_SIZE = 10 * 1024 * 1024
+
+# Pastebin downloads, connect and read timeouts are in seconds, larger pastes are rejected
+PASTEBIN_CONNECT_TIMEOUT = 3.05
+PASTEBIN_READ_TIMEOUT = 10
+PASTEBIN_MAX_SIZE = 1024 * 1024
+PASTEBIN_POOL_SIZE = 10
 
 GUIDE_IMPORT_USERNAME = os.environ.get('IMPORTER_USERNAME', None)
 GUIDE_IMPORT_PASSWORD = os.environ.get('IMPORTER_PASSWORD', None)
 GUIDE_IMPORT_MAIL = os.environ.get('IMPORTER_EMAIL', None)
+# forum threads and pastes fetched by guide_import, replayed from here with `--script-args replay`
+FORUM_CRAWLER_CACHE_DIR = join(PROJECT_ROOT, 'run', 'forum_crawler')
+FORUM_CRAWLER_CACHE_TTL = 24 * 60 * 60
+FORUM_CRAWLER_CONCURRENCY = 8
+# build snapshots no guide points to are deleted by gc_build_snapshots once unused for this long, in seconds
+BUILD_SNAPSHOT_GC_MIN_AGE = 24 * 60 * 60
 
 # finally grab the SECRET KEY
 try:
@@ -1,10 +1,19 @@
+import gc
+import hashlib
 import json
 import logging
 import os
-from collections import defaultdict
-from typing import Dict, List, Tuple
+import pickle
+import threading
+import time
+from collections import defaultdict, OrderedDict
+from typing import Dict, List, Tuple, Iterable, Callable, Any, Optional, Mapping
+
+import numpy as np
+from django.core.cache import caches
 
 import GuideToExile.settings as settings
+from GuideToExile import tree_geometry
 from GuideToExile.data_classes import NodeGroup, TreeNode, SkillTree
 from GuideToExile.exceptions import SkillTreeLoadingException
 from GuideToExile.settings import ASC_TREE_OFFSET_Y, ASC_TREE_OFFSET_X
@@ -12,24 +21,69 @@ from GuideToExile.tree_graph import TreeGraph
 
 logger = logging.getLogger('guidetoexile')
 
+TREE_HTML_CACHE_ALIAS = 'skill_trees'
+
+# bump when SkillTree, TreeGraph or their elements change, so compiled artifacts are not unpickled into stale classes
+TREE_ARTIFACT_FORMAT_VERSION = 1
+
 
 class SkillTreeService:
-    skill_trees: Dict[str, SkillTree] = {}
-    tree_graphs: Dict[str, TreeGraph] = {}
-
-    def __init__(self, trees_dir='GuideToExile/trees'):
-        for f in os.scandir(trees_dir):
-            if f.is_dir():
-                version = f.path.split(os.path.sep)[-1]
-                if not settings.LOAD_ALL_SKILLTREES and version != settings.CURRENT_TREE_VERSION:
-                    continue
-                skill_tree = _read_tree_data_file(f.path + '/data.json')
-                self.skill_trees[version] = skill_tree
-                self.tree_graphs[version] = TreeGraph(skill_tree)
-                logger.info('Loaded tree version=%s', version)
-
-    def get_html_with_taken_nodes(self, taken_node_ids: List[str], tree_version: str) -> str:
-        return self.tree_graphs[tree_version].as_html_with_taken_nodes(taken_node_ids)
+    """Skill trees and their graphs by version, loaded on first use.
+
+    Versions compiled with `manage.py compile_skill_trees` are unpickled from SKILL_TREE_ARTIFACT_DIR,
+    others fall back to parsing data.json. At most `max_resident` versions are kept in memory,
+    the least recently used one is dropped first, CURRENT_TREE_VERSION never is.
+    """
+    skill_trees: Mapping[str, SkillTree]
+    tree_graphs: Mapping[str, TreeGraph]
+
+    def __init__(self, trees_dir='GuideToExile/trees', artifact_dir=None, max_resident=None):
+        self.trees_dir = trees_dir
+        self.artifact_dir = artifact_dir or settings.SKILL_TREE_ARTIFACT_DIR
+        self.versions = [version for version in _find_tree_versions(trees_dir)
+                         if settings.LOAD_ALL_SKILLTREES or version == settings.CURRENT_TREE_VERSION]
+        self.tree_graphs = _TreeVersionCache(self._load_tree_graph, self.versions,
+                                             max_resident or settings.SKILL_TREE_MAX_RESIDENT_VERSIONS,
+                                             pinned_version=settings.CURRENT_TREE_VERSION)
+        self.skill_trees = _SkillTreesView(self.tree_graphs)
+
+    def _load_tree_graph(self, version: str) -> TreeGraph:
+        source_path = os.path.join(self.trees_dir, version, 'data.json')
+        artifact_path = _tree_artifact_path(self.artifact_dir, version)
+        tree_graph = _read_tree_artifact(artifact_path, source_path)
+        if tree_graph is None:
+            tree_graph = TreeGraph(_read_tree_data_file(source_path))
+        tree_graph.cache_dir = os.path.join(settings.TREE_SVG_CACHE_DIR, version)
+        return tree_graph
+
+    def stats(self) -> Dict[str, Any]:
+        version_stats = {}
+        for version in self.versions:
+            artifact_path = _tree_artifact_path(self.artifact_dir, version)
+            tree_graph = self.tree_graphs.get_resident(version)
+            version_stats[version] = {
+                **self.tree_graphs.version_stats(version),
+                'resident': tree_graph is not None,
+                'artifact_bytes': os.path.getsize(artifact_path) if os.path.exists(artifact_path) else None,
+                'base_layers_bytes': sum(map(len, tree_graph._base_layers.values())) if tree_graph else 0,
+            }
+        return {
+            'max_resident': self.tree_graphs.max_resident,
+            'resident': self.tree_graphs.resident_versions(),
+            'versions': version_stats,
+        }
+
+    def get_html_with_taken_nodes(self, taken_node_ids: List[str], tree_version: str,
+                                  mastery_effects: Iterable[Tuple[str, str]] = ()) -> str:
+        # only the build's overlay is cached, the base layer is shared by all builds of an ascendancy
+        cache = caches[TREE_HTML_CACHE_ALIAS]
+        cache_key = _tree_overlay_cache_key(taken_node_ids, tree_version, mastery_effects)
+        tree_graph = self.tree_graphs[tree_version]
+        asc_name_and_overlay = cache.get(cache_key)
+        if asc_name_and_overlay is None:
+            asc_name_and_overlay = tree_graph.get_taken_overlay(taken_node_ids)
+            cache.set(cache_key, asc_name_and_overlay)
+        return tree_graph.with_base_layer(*asc_name_and_overlay)
 
     def get_keystones(self, taken_node_ids: List[str], tree_version: str) -> List[TreeNode]:
         keystones = [node for node_id in taken_node_ids if
@@ -46,6 +100,161 @@ class SkillTreeService:
         return mastery_effects_descriptions
 
 
+class _TreeVersionCache(Mapping):
+    """Every available version, of which only the resident ones are kept in memory.
+
+    A version is loaded outside of the cache-wide lock, so requests for resident versions don't wait for it.
+    Concurrent requests for the same missing version wait for a single load.
+    """
+
+    def __init__(self, load_fn: Callable[[str], Any], versions: List[str], max_resident: int,
+                 pinned_version: Optional[str] = None):
+        self.versions = versions
+        self.max_resident = max_resident
+        self.pinned_version = pinned_version
+        self._load_fn = load_fn
+        self._resident: OrderedDict[str, Any] = OrderedDict()
+        self._loads: Dict[str, int] = defaultdict(int)
+        self._hits: Dict[str, int] = defaultdict(int)
+        self._load_times: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+
+    def __getitem__(self, version: str):
+        if version not in self.versions:
+            raise KeyError(version)
+        with self._lock:
+            value = self._get_resident_and_count_hit(version)
+            load_lock = self._load_locks[version]
+        if value is not None:
+            return value
+        with load_lock:
+            with self._lock:
+                # loaded by another thread while this one was waiting
+                value = self._get_resident_and_count_hit(version)
+            if value is not None:
+                return value
+            start = time.perf_counter()
+            value = self._load_fn(version)
+            load_time = time.perf_counter() - start
+            with self._lock:
+                self._load_times[version] = load_time
+                self._loads[version] += 1
+                self._resident[version] = value
+                self._evict()
+        logger.info('Loaded tree version=%s in %.0fms', version, load_time * 1000)
+        return value
+
+    def __contains__(self, version):
+        return version in self.versions
+
+    def __iter__(self):
+        return iter(self.versions)
+
+    def __len__(self):
+        return len(self.versions)
+
+    def get_resident(self, version: str):
+        return self._resident.get(version)
+
+    def resident_versions(self) -> List[str]:
+        """Versions in memory, from the least to the most recently used."""
+        with self._lock:
+            return list(self._resident)
+
+    def version_stats(self, version: str) -> Dict[str, Any]:
+        load_time = self._load_times.get(version)
+        return {
+            'loads': self._loads[version],
+            'hits': self._hits[version],
+            'load_time_ms': None if load_time is None else round(load_time * 1000, 1),
+        }
+
+    def _get_resident_and_count_hit(self, version: str):
+        if version not in self._resident:
+            return None
+        self._resident.move_to_end(version)
+        self._hits[version] += 1
+        return self._resident[version]
+
+    def _evict(self):
+        for version in list(self._resident):
+            if len(self._resident) <= self.max_resident:
+                break
+            if version != self.pinned_version:
+                del self._resident[version]
+                logger.info('Evicted tree version=%s', version)
+
+
+class _SkillTreesView(Mapping):
+    def __init__(self, tree_graphs: _TreeVersionCache):
+        self._tree_graphs = tree_graphs
+
+    def __getitem__(self, version: str) -> SkillTree:
+        return self._tree_graphs[version].skill_tree
+
+    def __contains__(self, version):
+        return version in self._tree_graphs
+
+    def __iter__(self):
+        return iter(self._tree_graphs)
+
+    def __len__(self):
+        return len(self._tree_graphs)
+
+
+def compile_tree_artifact(version: str, trees_dir: str, artifact_dir: str) -> str:
+    """Parses data.json of a tree version and pickles the resulting TreeGraph, returns the artifact path."""
+    source_path = os.path.join(trees_dir, version, 'data.json')
+    tree_graph = TreeGraph(_read_tree_data_file(source_path))
+    artifact_path = _tree_artifact_path(artifact_dir, version)
+    os.makedirs(artifact_dir, exist_ok=True)
+    tmp_path = f'{artifact_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump((TREE_ARTIFACT_FORMAT_VERSION, tree_graph), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, artifact_path)
+    return artifact_path
+
+
+def _find_tree_versions(trees_dir: str) -> List[str]:
+    return sorted(f.name for f in os.scandir(trees_dir) if f.is_dir())
+
+
+def _tree_artifact_path(artifact_dir: str, version: str) -> str:
+    return os.path.join(artifact_dir, f'{version}.pickle')
+
+
+def _read_tree_artifact(artifact_path: str, source_path: str) -> Optional[TreeGraph]:
+    try:
+        if os.path.getmtime(artifact_path) < os.path.getmtime(source_path):
+            logger.warning('Tree artifact %s is older than %s, ignoring it', artifact_path, source_path)
+            return None
+        with open(artifact_path, 'rb') as f:
+            # the artifact is a large graph of small objects, collecting while it's being built only slows it down
+            gc.disable()
+            try:
+                format_version, tree_graph = pickle.load(f)
+            finally:
+                gc.enable()
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning('Unable to read tree artifact %s', artifact_path, exc_info=True)
+        return None
+    if format_version != TREE_ARTIFACT_FORMAT_VERSION:
+        logger.warning('Tree artifact %s has outdated format %s', artifact_path, format_version)
+        return None
+    return tree_graph
+
+
+def _tree_overlay_cache_key(taken_node_ids: Iterable[str], tree_version: str,
+                         mastery_effects: Iterable[Tuple[str, str]]) -> str:
+    nodes_part = ','.join(sorted(set(taken_node_ids)))
+    mastery_effects_part = ','.join(sorted(f'{node_id}:{effect_id}' for node_id, effect_id in mastery_effects))
+    digest = hashlib.sha256(f'{nodes_part}|{mastery_effects_part}'.encode('utf-8')).hexdigest()
+    return f'tree_overlay:{tree_version}:{digest}'
+
+
 def _read_tree_data_file(filepath: str) -> SkillTree:
     try:
         with open(filepath, 'r') as f:
@@ -80,9 +289,18 @@ def _read_tree_data_file(filepath: str) -> SkillTree:
 
 
 def _move_asc_groups_to_pos(groups: Dict[str, NodeGroup], nodes: Dict[str, TreeNode], x: int, y: int) -> None:
-    asc_groups = _find_asc_groups(groups, nodes)
-    for asc in asc_groups.values():
-        _move_asc_to_pos(asc, nodes, x, y)
+    asc_groups = [(group, _find_asc_center_group(asc, nodes))
+                  for asc in _find_asc_groups(groups, nodes).values() for group in asc]
+    if not asc_groups:
+        return
+    group_rows = {group.group_id: row for row, (group, _) in enumerate(asc_groups)}
+    group_positions = np.array([(group.x, group.y) for group, _ in asc_groups], dtype=np.float64)
+    center_indices = [group_rows[center_group.group_id] for _, center_group in asc_groups]
+    offsets = tree_geometry.calculate_group_offsets(group_positions, center_indices,
+                                                    np.array([(x, y)] * len(asc_groups), dtype=np.float64))
+    for (group, _), (new_x, new_y) in zip(asc_groups, (group_positions + offsets).tolist()):
+        group.x = new_x
+        group.y = new_y
 
 
 def _find_asc_groups(groups: Dict[str, NodeGroup], nodes: Dict[str, TreeNode]) -> Dict[str, List[NodeGroup]]:
@@ -96,15 +314,6 @@ def _find_asc_groups(groups: Dict[str, NodeGroup], nodes: Dict[str, TreeNode]) -
     return groups_by_asc
 
 
-def _move_asc_to_pos(asc: List[NodeGroup], nodes: Dict[str, TreeNode], x: int, y: int) -> None:
-    asc_center_group = _find_asc_center_group(asc, nodes)
-    move_x = x - asc_center_group.x
-    move_y = y - asc_center_group.y
-    for group in asc:
-        group.x = group.x + move_x
-        group.y = group.y + move_y
-
-
 def _find_asc_center_group(asc_groups: List[NodeGroup], nodes: Dict[str, TreeNode]) -> NodeGroup:
     for group in asc_groups:
         for node_id in group.node_ids:
@@ -1,20 +1,69 @@
+import asyncio
+import base64
+import dataclasses
+import io
 import json
+import os
+import sys
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
+import jsonpickle
+import numpy as np
 import requests
-from django.test import TestCase, SimpleTestCase
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles import finders
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db.models import ProtectedError
+from django.db.models.deletion import Collector
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
 from parameterized import parameterized
 
-from GuideToExile import skill_tree, pob_import
-from GuideToExile.exceptions import SkillTreeLoadingException, PastebinImportException, TreeParsingException
-from GuideToExile.models import BuildGuide
+import GuideToExile.settings as settings
+from GuideToExile import skill_tree, pob_import, tree_geometry, import_jobs, items_service, data_classes, \
+    pastebin, build_guide, json_encoder, item_html_store, build_snapshots
+from GuideToExile.crawler import Crawler
+from GuideToExile.data_classes import TreeSpec, Item, SkillGem, PobDetails, SkillGroup, ItemSet
+from GuideToExile.item_html_cache import ItemHtmlCache
+from GuideToExile.parsed_build_cache import ParsedBuildCache
+from GuideToExile.exceptions import SkillTreeLoadingException, PastebinImportException, TreeParsingException, \
+    PobXmlTooLargeException, MissingFixtureException, UnsupportedSchemaVersionException
+from GuideToExile.models import BuildGuide, PobImportJob, UniqueItem, Keystone, ItemHtml, BuildSnapshot
 from GuideToExile.scripts import ladder_imports, guide_import
-from GuideToExile.settings import POB_PATH
+from GuideToExile.settings import POB_PATH, IMPORT_JOB_TIMEOUT
 from GuideToExile.skill_tree import SkillTreeService
 from GuideToExile.tree_graph import TreeGraph
-from apps.pob_wrapper import PathOfBuilding
+from apps.pob_wrapper import PathOfBuilding, PathOfBuildingPool, ProcessWrapper, AsyncProcessWrapper
+from apps.pob_wrapper import process_wrapper
 
 
-class PobImportTests(SimpleTestCase):
+def make_pob_details(**changes) -> PobDetails:
+    """A small build with one of everything, fields given in changes replace the defaults."""
+    gem = SkillGem(is_enabled=True, name='Raise Spectre', is_active_skill=True, level=20, quality=20,
+                   asset_path='gems/raise_spectre.png')
+    item = Item(item_id_in_itemset=1, name='Bones of Ullr', base_name='Silk Slippers', rarity='UNIQUE',
+                display_html='<div>Bones of Ullr</div>', support_gems=[gem], asset_path='')
+    tree_spec = TreeSpec(title='Endgame', nodes=['31961'], url='', tree_version='3_15',
+                         mastery_effects=[('1', '2')])
+    pob_details = PobDetails(build_stats={'Life': 4000, 'CritChance': 5.5}, class_name='Witch',
+                             ascendancy_name='Necromancer',
+                             skill_groups=[SkillGroup(slot=None, source=None, is_enabled=True,
+                                                      main_active_skill_index=0, gems=[gem])],
+                             main_active_skills=['Raise Spectre'], imported_primary_skill='Raise Spectre',
+                             tree_specs=[tree_spec], active_tree_spec_index=0, items=[item],
+                             item_sets=[ItemSet(set_id=1, title='', slots={'Boots': item})], active_item_set_id='1',
+                             used_jewels={'Endgame': [item]})
+    return dataclasses.replace(pob_details, **changes)
+
+
+class PobImportTests(TestCase):
 
     def test_bas64_to_xml(self):
         with open('GuideToExile/test_data/test_pob.xml', 'r') as f:
@@ -32,19 +81,19 @@ class PobImportTests(SimpleTestCase):
 
     def test_import_from_pastebin(self):
         url = 'https://pastebin.com/pnSQVi92'
-        result = pob_import.import_from_pastebin(url)
+        result = pastebin.fetch_paste(url)
         expected_base64 = 'eNrNW-tv4kgS_zz8FRbSSXcSCW6_HSW7Im9WIcOEzMzNfRl17Aa8adyM3YZkT_e_X3XbBCcDofDuSZcPxI9fvaurq5rk-NenGTcWLMsTkZ60yaHZNlgaiThJJyftz_eXB0H7119ax0Mqpx_Hp0XC1ZtfWh-O9bXB2YJxoGsbkmYTJr-sONnfgdOcpnLKRDqgv4vsSsQn7VuRsrbxQNM4kau7iNM8v6UzdtIeRUDcNmgesTQ-Wz8vgTOapCMRPTJ5lYlirsUuErYciBgw_cHw4919TWiS1oWCzh-Oh5w-s2wkqTRy-Dhp98B0OmHXiQRWlBfAx7Js6zAMfeKZpu_77e67lOd0Bp_7Eo_mjMUvROTQq_38HxDdZ3R-P83EEmJ9n8zW5pmH3ns0Z0LwWCzTF7yzDT3M2MV4zCKZLNhZlsizKU2jtZytUvbFDgoukzlPWFbzgbuN4von5sQ0txosJOXnw9EL1vYt5V8S2rbjWcH_hk6sE3WrZl8TOT3lEPe6FGRmKtr-JE0ka0g8FEku0gbEK_vqpFtNPBOzhyRtZOGKtLeY7Es6oCk9E3mtVtjboDfJmL2CbjXlYoTD3UGdwSGVmkOWQQ2VOAKl7F4EI1lbT-bW9XTHfrxCOuE25Dl7WjvVfIdfHUjcrZL7Kcaj7AcKd84WQuqNCePItXrEeqcqR0cK3E8jHNfPacZyli3qxXw7_9cUVWgxRU0R3rEJW9tqHVrOe-gbxqLpFezMIKW-jb6bnesNwnzXRQqLcpECbnCRgyTYw0OK8LWHyHvQvd1zkbJs8jyaJozHiIWovFQnQXmrTvDaFhTJ_jYtaF5fP8R7354Sjgs8g40OCGL2Zud2_zqKYSZ-V60K34-sl81EkSFjWIJRJg-nz3kSwV6pW887FhcRrjq9dFwDsWAzyHfdHEL3vDuVTzn03W8Mf88gzvei6ElJo8dzEU_YXkL2orhMMvBWntQ2uAMPgf4Inf4ZnWOaErWcsALWaLSAm2QylSk05Xgpb0jwtkypyPcwZg1Hi7gsOEc1e6PH5DVS0gfOjgzzybQo851o-1IRS1BmqkbTHLGwaugBXfcZW5u8y4ylfzyj-b-CowRcpHGRqexGy3hL8bOY464e3dVVfzYXmdQPzyiPcs2yn84LaaR67s6V57-nxexBDVDl73WVqCNnSR59fyjGYzWMt0GZTJ8gXFxeXpzd979cVCQjpmuVEQnO6TxnMJ2nCW8bSVyFeQTVOZIINGw81ey9G_uVZlGWgPt2Q9WAhVBVT9W7cWoERcAgDpQzrIvun-dMRTzHeakqj7uxemRE4MoJD2OWniMxTmcRfUbgXhoPBPaCs17C1S6H8dMA0rfcHjFo2K6y5KGQqIzSMwFCA9UWI8yqt4cITcseBMG3atF2I6tNAZNP0AEgfX_OxgyyFLVC9aq_p48srerZqnYd6-WRGzkUtSs2y0-fYdO4VJ56c2DwCgDbSVZAyYrZmBZcPf9UUJ7I50rm-vlNedipn-ZTsRwV83nJSS3JHLx9c1O-6XFZMVFiTtpjyvPqCFLrqI8ye7oX0_faAn2emaQRL2KYC6vdsRLH6YMS3TYm6uTzTBSprN6wVG2G8cqKN4wVTyX2wzEoUmGvuHig3FpxLo2yzPar12TFUG8BfRVORjN1yNc2fpSm9fXK1c4BvdhM3Q-YpDGVtNuXYHhXWd_VisDVTwzUNvZW_6g0DTyh9hXVGpeSDU1ZZkfJUYe-jLi6vM8YM2hpuaYilb_hpn6grLQEsSlsU-BxxwuJ2XGc0PM7dugTu-OagWfBp2NZHeJ6NunYtu-YHTcIbHjrhqbXIZ7vu3Bt-3bH8tRb4jqm27ED0wk6HjDy2oYEhWrH4cStTrpLBcqgXMRQIONbpUu3fPL57kZffJhKOc-Put3lcnk4p3IqxuwJJpDDSMy6c2ADdh7o2BwoQd0e_Jyqj5voIPPYQz-ixdPwW3juDAfW7LfTaTi9pdefgpt_jSYHbHKihXVX0o7LY_W8FF3daR8pbYlnkQBSU5YxrnqPDThCXBOB80hgOxic4wY2AmdZYYjh5wSeH2L42YQgYKFjYrxiex7KWttxcNaSMMDws5wQYwVkt4sRaxMPp57nWy4C57okxCSLE5oBBkds4mNwfuihxHpBYKFwYAfKzVBKMPxMxzRR4TAxYonlERtlhh2iogvZ4mGiG7oBJguIE6Lkhn7oY9QLHB8j1oJSb6GSmYQeqqLZpovCWUGAqmi-g6otdhiEKLmeh7GD-BbBVUh0DfJxO4KDkutAPmPSxSVQJDH2mq6NyQMSODYq7UFBH1XUvAC3Y_keyg6LeKjqQgIfY4fjEA-VV5aNCq_p2y5qqwxRRVI1bRh2lr8pW6BrXHc7cAMNou4lVQepLm4FDHbqnXq4utH95ZeELY0cutFoOpKZasf_EGL2TZXPw1DVRdX7XzMqB3RetdcKUM0N1Xs1up8nMGtmeuJZNb4K-E_VawWHnlN-CXysm-iqqVXXI1a2xkXOYEISafyV0blI9WMlrTyVAaAelKrO_45m0GsfGZ9v-58-X7RgOChmrdNCRlOWGb0n1rphdFKwI-OawVzXquaWI8MyW1rxO_bjyPDsVn8250mUyPzIMFvXNAc3G5UjW__OaDphR-ah-5-_W6Z5YLnmP_6mZpmMUZjejNWRtVEOb61vojCmdMEUj34qGefJRHmjzkidnWgacHXyyIzyHMNIcgNEHNhKwFhkxjVoZCwTOTXkFN6VHtFhHoj4TnEzNE_1xwtuOUFaq0TYilh946XHmHKM4GJ11FWKMGqJ-nIgVsZoa3zqYdnEcbSkc6P38JznyuwymTesm02kb8ksHNlPNrxCnQoBzm2m0CZbdih1yrjck-QSJqpHw0apZG1SyW7mXpwTrL-IzGmmpNdMmtfcm2RHgDfl044IXDM-Y3JfQRsyyWsiZ0f6XXGxUKfy-zO2m68i0kSe0ywXSLPMc3aHB-PYfdluSq-GhqPqjttAnwY10N4lJn42yoPePcO32cuN8sttQoRakphANLLTbexWq0HcvWYryW6Wvvb-WeY0L_sNcpo0dr6NSQgHA2qg9p9ofpCRbB4Fr0FWNg_Dn0gXbElWtMhVg4c28Nxdkk5wncDehWKrexuWC3w8m5hjI_xEmofBaewtt4k1mPXSPMl3qNSbFXzD3lZOnDAw6hMJPf_rv84Q6TiZAOK4-_Y_Mf4LVjP17Q=='
         self.assertEqual(expected_base64, result)
 
     def test_import_from_pastebin_404(self):
         with self.assertRaisesRegex(requests.exceptions.HTTPError, '404 Client.*'):
             url = 'https://pastebin.com/pnSQVi92asdfadsfzxcvasdf'
-            _ = pob_import.import_from_pastebin(url)
+            _ = pastebin.fetch_paste(url)
 
     def test_import_from_pastebin_different_site(self):
         with self.assertRaises(PastebinImportException):
             url = 'https://somerandomsite.com/pnSQVi92'
-            _ = pob_import.import_from_pastebin(url)
+            _ = pastebin.fetch_paste(url)
 
     @parameterized.expand([
         ('https://pastebin.com/Hi8wdMN7'),
@@ -80,21 +129,457 @@ class PobImportTests(SimpleTestCase):
     def test_import_build(self, pastebin_url, exception_cls=None):
         if exception_cls:
             with self.assertRaises(exception_cls):
-                base64_build = pob_import.import_from_pastebin(pastebin_url)
+                base64_build = pastebin.fetch_paste(pastebin_url)
                 xml_build = pob_import.base64_to_xml(base64_build)
                 _ = pob_import.parse_pob_details(xml_build)
         else:
-            base64_build = pob_import.import_from_pastebin(pastebin_url)
+            base64_build = pastebin.fetch_paste(pastebin_url)
             xml_build = pob_import.base64_to_xml(base64_build)
             _ = pob_import.parse_pob_details(xml_build)
 
     def test_import_build_single(self):
-        base64_build = pob_import.import_from_pastebin("https://pastebin.com/zC8dxG7Z")
+        base64_build = pastebin.fetch_paste("https://pastebin.com/zC8dxG7Z")
         xml_build = pob_import.base64_to_xml(base64_build)
         _ = pob_import.parse_pob_details(xml_build)
         print(_)
 
 
+class PobDecodingTests(TestCase):
+    def test_iter_xml_chunks_inflates_in_pieces(self):
+        xml = '<PathOfBuilding>' + 'ąę' * 100000 + '</PathOfBuilding>'
+        chunks = list(pob_import.iter_xml_chunks(pob_import.xml_to_base64(xml), chunk_size=1000))
+        self.assertGreater(len(chunks), 100)
+        self.assertEqual(xml, ''.join(chunks))
+
+    def test_iter_xml_chunks_stops_at_max_size(self):
+        bomb = pob_import.xml_to_base64(' ' * 10_000_000)
+        chunks = pob_import.iter_xml_chunks(bomb, max_size=100_000)
+        with self.assertRaises(PobXmlTooLargeException):
+            for _ in chunks:
+                pass
+
+    def test_iter_xml_chunks_rejects_truncated_code(self):
+        compressed = zlib.compress(b'<PathOfBuilding></PathOfBuilding>')[:-6]
+        with self.assertRaises(zlib.error):
+            pob_import.base64_to_xml(base64.urlsafe_b64encode(compressed).decode('utf-8'))
+
+
+class PasteFetcherTests(TestCase):
+    def setUp(self):
+        caches[pastebin.PASTE_CACHE_ALIAS].clear()
+        self.addCleanup(caches[pastebin.PASTE_CACHE_ALIAS].clear)
+
+    def test_paste_is_fetched_once(self):
+        source = pastebin.LocalPasteSource({'pnSQVi92': 'eNrNW'})
+        fetcher = pastebin.PasteFetcher(source)
+        with mock.patch.object(source, 'get', wraps=source.get) as get:
+            self.assertEqual('eNrNW', fetcher.fetch('https://pastebin.com/pnSQVi92'))
+            self.assertEqual('eNrNW', fetcher.fetch('https://pastebin.com/pnSQVi92/'))
+        get.assert_called_once_with('pnSQVi92')
+
+    def test_missing_paste_is_not_cached(self):
+        source = pastebin.LocalPasteSource({})
+        fetcher = pastebin.PasteFetcher(source)
+        with self.assertRaises(PastebinImportException):
+            fetcher.fetch('https://pastebin.com/pnSQVi92')
+        source.pastes['pnSQVi92'] = 'eNrNW'
+        self.assertEqual('eNrNW', fetcher.fetch('https://pastebin.com/pnSQVi92'))
+
+
+class CrawlerTests(TestCase):
+    def make_session(self, host):
+        session = mock.Mock()
+        session.get.return_value.content = f'<html>{host}</html>'.encode('utf-8')
+        return session
+
+    def test_sessions_reused_per_host_and_responses_cached(self):
+        urls = ['https://www.pathofexile.com/forum/view-forum/40', 'https://www.pathofexile.com/forum/view-forum/41',
+                'https://pastebin.com/raw/pnSQVi92']
+        session_factory = mock.Mock(side_effect=self.make_session)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with Crawler(cache_dir, concurrency=2, session_factory=session_factory) as crawler:
+                pages = crawler.fetch_many(urls)
+                self.assertEqual(pages, crawler.fetch_many(urls))
+            self.assertEqual(b'<html>pastebin.com</html>', pages[2])
+            self.assertEqual(2, session_factory.call_count)
+            self.assertEqual({'requests': 3, 'cache_hits': 3}, crawler.stats())
+
+            with Crawler(cache_dir, replay=True, session_factory=session_factory) as replay_crawler:
+                self.assertEqual(pages, replay_crawler.fetch_many(urls))
+                with self.assertRaises(MissingFixtureException):
+                    replay_crawler.fetch('https://pastebin.com/raw/missing')
+            self.assertEqual(2, session_factory.call_count)
+
+
+class PobXmlReaderTests(TestCase):
+    def test_reading_in_chunks_matches_reading_at_once(self):
+        with open('GuideToExile/test_data/test_pob.xml', 'r') as f:
+            xml = f.read()
+        whole_reader = pob_import.PobXmlReader()
+        whole_reader.feed(xml)
+        whole_reader.close()
+        chunked_reader = pob_import.PobXmlReader()
+        for start in range(0, len(xml), 100):
+            chunked_reader.feed(xml[start:start + 100])
+        chunked_reader.close()
+
+        self.assertEqual('Juggernaut', chunked_reader.build_attributes['ascendClassName'])
+        self.assertEqual(6, len(chunked_reader.tree_specs))
+        self.assertEqual(26, len(chunked_reader.item_texts))
+        for attribute in ('build_stats', 'skill_groups', 'tree_specs', 'tree_jewel_ids', 'item_texts',
+                          'item_set_slots', 'active_item_set_id', 'active_tree_spec_index'):
+            self.assertEqual(getattr(whole_reader, attribute), getattr(chunked_reader, attribute))
+
+
+class ParsedBuildCacheTests(TestCase):
+    def test_same_xml_is_parsed_once(self):
+        pob_details = make_pob_details()
+        hits = pob_import.PARSED_BUILD_CACHE.stats()['hits']
+        xml = '<PathOfBuilding><Build/></PathOfBuilding>'
+        with mock.patch.object(pob_import, 'parse_pob_details', return_value=pob_details) as parse, \
+                mock.patch.object(pob_import, 'iter_xml_chunks', wraps=pob_import.iter_xml_chunks) as inflate:
+            first = pob_import.get_or_parse_pob_details(xml)
+            second = pob_import.get_or_parse_pob_string(pob_import.xml_to_base64(xml))
+        parse.assert_called_once()
+        inflate.assert_called_once()
+        self.assertEqual(pob_details, first)
+        # a cached build has the HTML of its items by key, like stored guides
+        item_html_store.load_items_html(item_html_store.iter_gear_items(second.items, second.item_sets,
+                                                                        second.used_jewels))
+        self.assertEqual(pob_details, second)
+        self.assertEqual(hits + 1, pob_import.PARSED_BUILD_CACHE.stats()['hits'])
+
+    def test_key_depends_on_pob_version(self):
+        cache = ParsedBuildCache('2.8.0', 10)
+        key = cache.key_for(['<PathOfBuilding/>'])
+        self.assertNotEqual(key, cache.key_for(['<PathOfBuilding>', '</PathOfBuilding>']))
+        self.assertNotEqual(key, ParsedBuildCache('2.9.0', 10).key_for(['<PathOfBuilding/>']))
+
+
+class PobImportJobTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('author', 'author@example.com', 'password')
+
+    def test_invalid_pob_string_fails_without_retry(self):
+        job = import_jobs.enqueue_import(self.user.userprofile, 'bm90IGEgYnVpbGQ=')
+        import_jobs.run_job(import_jobs.claim_next_job(), SkillTreeService())
+        job.refresh_from_db()
+        self.assertEqual(PobImportJob.JobStatus.FAILED, job.status)
+        self.assertEqual(import_jobs.INVALID_INPUT_MESSAGE, job.error_message)
+        self.assertEqual(1, job.attempts)
+        self.assertIn('parse', job.stage_timings)
+
+    def test_unavailable_pastebin_is_retried_later(self):
+        job = import_jobs.enqueue_import(self.user.userprofile, 'https://pastebin.com/pnSQVi92')
+        with mock.patch.object(pastebin.PASTE_FETCHER.source, 'get', side_effect=requests.ConnectionError):
+            import_jobs.run_job(import_jobs.claim_next_job(), SkillTreeService())
+        job.refresh_from_db()
+        self.assertEqual(PobImportJob.JobStatus.QUEUED, job.status)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIsNone(import_jobs.claim_next_job())
+
+    def test_timed_out_job_is_claimed_again(self):
+        job = import_jobs.enqueue_import(self.user.userprofile, 'https://pastebin.com/pnSQVi92')
+        PobImportJob.objects.filter(job_id=job.job_id).update(status=PobImportJob.JobStatus.RUNNING, attempts=1,
+                                                              started_datetime=timezone.now() - timedelta(hours=1))
+        claimed_job = import_jobs.claim_next_job()
+        self.assertEqual(job.job_id, claimed_job.job_id)
+        self.assertEqual(2, claimed_job.attempts)
+
+    def test_outcome_of_reclaimed_attempt_is_dropped(self):
+        job = import_jobs.enqueue_import(self.user.userprofile, 'bm90IGEgYnVpbGQ=')
+        stale_job = import_jobs.claim_next_job()
+        PobImportJob.objects.filter(job_id=job.job_id).update(attempts=2)
+        import_jobs.run_job(stale_job, SkillTreeService())
+        job.refresh_from_db()
+        self.assertEqual(PobImportJob.JobStatus.RUNNING, job.status)
+        self.assertIsNone(job.error_message)
+
+    def test_guide_of_reclaimed_attempt_is_rolled_back(self):
+        job = import_jobs.enqueue_import(self.user.userprofile, 'bm90IGEgYnVpbGQ=')
+        stale_job = import_jobs.claim_next_job()
+
+        def create_guide_while_job_is_reclaimed(author, *args):
+            PobImportJob.objects.filter(job_id=job.job_id).update(attempts=2)
+            return BuildGuide.objects.create(status=BuildGuide.GuideStatus.DRAFT, author=author)
+
+        with mock.patch.object(pob_import, 'get_or_parse_pob_string'), \
+                mock.patch.object(build_guide, 'create_build_guide', side_effect=create_guide_while_job_is_reclaimed):
+            import_jobs.run_job(stale_job, SkillTreeService())
+        self.assertFalse(BuildGuide.objects.filter(author=self.user.userprofile).exists())
+        job.refresh_from_db()
+        self.assertEqual(PobImportJob.JobStatus.RUNNING, job.status)
+
+    def test_job_over_timeout_is_given_up_after_current_stage(self):
+        job = import_jobs.enqueue_import(self.user.userprofile, 'bm90IGEgYnVpbGQ=')
+        claimed_job = import_jobs.claim_next_job()
+        claimed_job.started_datetime -= timedelta(seconds=IMPORT_JOB_TIMEOUT + 1)
+        with mock.patch.object(pob_import, 'get_or_parse_pob_string') as parse, \
+                mock.patch.object(build_guide, 'create_build_guide') as create_build_guide:
+            import_jobs.run_job(claimed_job, SkillTreeService())
+        parse.assert_called_once()
+        create_build_guide.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(PobImportJob.JobStatus.QUEUED, job.status)
+        self.assertIn('parse', job.stage_timings)
+
+    def test_new_guide_view_returns_job_to_poll(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('new_guide'), {'pob_input': 'https://pastebin.com/pnSQVi92'})
+        self.assertEqual(202, response.status_code)
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual('queued', status['status'])
+
+
+class ItemHtmlCacheTests(TestCase):
+    def test_key_ignores_formatting_and_unique_id(self):
+        cache = ItemHtmlCache('2.8.0', 10)
+        key = cache.key_for('Rarity: UNIQUE\nHeadhunter\nLeather Belt\nUnique ID: abc\n')
+        self.assertEqual(key, cache.key_for('  Rarity: UNIQUE\r\nHeadhunter\n\nLeather Belt'))
+        self.assertNotEqual(key, ItemHtmlCache('2.9.0', 10).key_for('Rarity: UNIQUE\nHeadhunter\nLeather Belt'))
+
+    def test_get_many_counts_hits_and_misses(self):
+        cache = ItemHtmlCache('2.8.0', 10)
+        cache.set_many({'a': '<div>a</div>', 'b': None})
+        self.assertEqual({'a': '<div>a</div>', 'b': None}, cache.get_many(['a', 'b', 'c']))
+        self.assertEqual(2, cache.stats()['hits'])
+        self.assertEqual(1, cache.stats()['misses'])
+
+    def test_evicts_least_recently_used(self):
+        cache = ItemHtmlCache('2.8.0', 2)
+        cache.set_many({'a': 'a'})
+        cache.set_many({'b': 'b'})
+        cache.get_many(['a'])
+        cache.set_many({'c': 'c'})
+        self.assertEqual({'a', 'c'}, set(cache.get_many(['a', 'b', 'c']).keys()))
+
+
+class GemsDataTests(TestCase):
+    def test_compiled_index_matches_gems_file(self):
+        gems_file = finders.find(settings.GEMS_FILE)
+        with tempfile.TemporaryDirectory() as index_dir:
+            index_file = f'{index_dir}/gem_index.pickle'
+            compiled = items_service.compile_gem_index(gems_file, index_file)
+            gems_data = items_service.GemsData(index_file)
+
+            self.assertEqual(compiled, gems_data.index)
+        self.assertEqual(items_service._read_gems_file(gems_file), gems_data.index)
+        self.assertTrue(gems_data.is_gem_active('Absolution'))
+        self.assertFalse(gems_data.is_gem_active('AncestralSlamSupport'))
+        self.assertEqual('Unknown skill Missing', gems_data.get_name('Missing', None))
+
+    def test_falls_back_to_gems_file_without_index(self):
+        with tempfile.TemporaryDirectory() as index_dir:
+            gems_data = items_service.GemsData(f'{index_dir}/gem_index.pickle')
+            self.assertTrue(gems_data.is_gem_active('Absolution'))
+
+
+class AssetsServiceTests(TestCase):
+    def test_magic_item_asset_ignores_affixes(self):
+        self.assertEqual(['seething leather belt of the lynx', 'leather belt of the lynx', 'seething leather belt',
+                          'leather belt'],
+                         items_service._gear_name_variants('MAGIC', '', 'Seething Leather Belt of the Lynx'))
+
+    def test_asset_resolved_for_items_stored_without_path(self):
+        item = Item(item_id_in_itemset=1, name='Headhunter', base_name='Leather Belt', rarity='UNIQUE',
+                    display_html='', support_gems=[])
+        expected_asset = item.asset_path
+        del item.asset_path
+        self.assertTrue(expected_asset)
+        self.assertEqual(expected_asset, item.asset)
+
+    def test_nonvaal_gem_gets_its_own_asset(self):
+        mapping = {'vaal grace': 'Vaal Grace.png', 'grace': 'Grace.png'}
+        with mock.patch.object(data_classes.assetService, 'mapping', mapping):
+            gem = SkillGem(is_enabled=True, name='Vaal Grace', is_active_skill=True, level=20, quality=0)
+            nonvaal_gem = pob_import.get_nonvaal_gem_version(gem)
+        self.assertEqual('Vaal Grace.png', gem.asset_path)
+        self.assertEqual('Grace.png', nonvaal_gem.asset_path)
+
+
+class PobDetailsSerializationTests(TestCase):
+    def test_round_trip(self):
+        pob_details = make_pob_details()
+        encoded = json.dumps(pob_details, cls=json_encoder.BuildDetailsJsonEncoder)
+        self.assertEqual(json_encoder.POB_DETAILS_SCHEMA_VERSION, json.loads(encoded)['schema_version'])
+        self.assertEqual(pob_details, json.loads(encoded, cls=json_encoder.BuildDetailsJsonDecoder))
+
+    def test_reads_jsonpickle_rows(self):
+        pob_details = make_pob_details()
+        legacy = jsonpickle.encode(pob_details, make_refs=False)
+        self.assertEqual(pob_details, json.loads(legacy, cls=json_encoder.BuildDetailsJsonDecoder))
+
+    def test_legacy_rows_get_fields_added_since(self):
+        pob_details = make_pob_details()
+        legacy = json.loads(jsonpickle.encode(pob_details, make_refs=False))
+        # pickled before mastery effects and stored asset paths existed
+        for tree_spec in legacy['tree_specs']:
+            del tree_spec['mastery_effects']
+        for item in legacy['items']:
+            del item['asset_path']
+            del item['display_html_key']
+
+        restored = json.loads(json.dumps(legacy), cls=json_encoder.BuildDetailsJsonDecoder)
+        self.assertEqual([], restored.tree_specs[0].mastery_effects)
+        self.assertIsNone(restored.items[0].display_html_key)
+        reencoded = json.dumps(restored, cls=json_encoder.BuildDetailsJsonEncoder)
+        self.assertEqual(restored.tree_specs, json.loads(reencoded, cls=json_encoder.BuildDetailsJsonDecoder).tree_specs)
+
+    def test_rejects_unknown_schema_version(self):
+        encoded = json_encoder.encode_pob_details(make_pob_details())
+        encoded['schema_version'] = json_encoder.POB_DETAILS_SCHEMA_VERSION + 1
+        with self.assertRaises(UnsupportedSchemaVersionException):
+            json_encoder.decode_pob_details(encoded)
+
+    def test_guide_stores_pob_details_in_sections(self):
+        pob_details = make_pob_details()
+        snapshot = build_snapshots.snapshot_for('pob', pob_details)
+        guide = BuildGuide.objects.create(status=BuildGuide.GuideStatus.DRAFT, snapshot=snapshot)
+        loaded_pob_details = BuildGuide.objects.get(guide_id=guide.guide_id).pob_details
+        item_html_store.load_items_html(item_html_store.iter_gear_items(
+            loaded_pob_details.items, loaded_pob_details.item_sets, loaded_pob_details.used_jewels))
+        self.assertEqual(pob_details, loaded_pob_details)
+
+        response = self.client.get(reverse('guide_tab', args=[guide.guide_id]))
+        loaded_snapshot = response.context['build_guide'].snapshot
+        self.assertEqual({'pob_skill_groups', 'pob_tree', 'pob_gear'}, loaded_snapshot.get_deferred_fields())
+        self.assertEqual({'Life': 4000, 'CritChance': 5.5}, loaded_snapshot.pob_summary['build_stats'])
+
+
+class ItemHtmlStoreTests(TestCase):
+    def test_html_stored_once_and_loaded_by_key(self):
+        pob_details = make_pob_details()
+        snapshot = build_snapshots.snapshot_for('pob', pob_details)
+        other_pob_details = make_pob_details()
+        other_pob_details.class_name = 'Ranger'
+        build_snapshots.snapshot_for('other pob', other_pob_details)
+        self.assertEqual(['<div>Bones of Ullr</div>'], list(ItemHtml.objects.values_list('html', flat=True)))
+        self.assertNotIn('Bones of Ullr</div>', json.dumps(snapshot.pob_gear, cls=json_encoder.BuildDetailsJsonEncoder))
+
+        gear = BuildSnapshot.objects.get(key=snapshot.key).pob_gear
+        gear_items = list(item_html_store.iter_gear_items(gear['items'], gear['item_sets'], gear['used_jewels']))
+        self.assertEqual({None}, {item.display_html for item in gear_items})
+        with self.assertNumQueries(1):
+            item_html_store.load_items_html(gear_items)
+        self.assertEqual({'<div>Bones of Ullr</div>'}, {item.display_html for item in gear_items})
+
+
+class BuildSnapshotTests(TestCase):
+    def test_same_build_shares_snapshot(self):
+        pob_details = make_pob_details()
+        snapshot = build_snapshots.snapshot_for('pob', pob_details)
+        self.assertEqual(snapshot.key, build_snapshots.snapshot_for('pob', pob_details).key)
+        self.assertEqual(1, BuildSnapshot.objects.count())
+
+        edited = build_snapshots.with_summary_changes(snapshot, main_active_skills=['Raise Zombie'])
+        self.assertNotEqual(snapshot.key, edited.key)
+        self.assertEqual(['Raise Spectre'], BuildSnapshot.objects.get(key=snapshot.key).pob_summary['main_active_skills'])
+        self.assertEqual(['Raise Zombie'], BuildSnapshot.objects.get(key=edited.key).pob_summary['main_active_skills'])
+
+    def test_gc_deletes_only_old_unused_snapshots(self):
+        pob_details = make_pob_details()
+        used = build_snapshots.snapshot_for('used', pob_details)
+        BuildGuide.objects.create(status=BuildGuide.GuideStatus.DRAFT, snapshot=used)
+        unused = build_snapshots.snapshot_for('unused', pob_details)
+        recent = build_snapshots.snapshot_for('recent', pob_details)
+        BuildSnapshot.objects.exclude(key=recent.key).update(last_used=timezone.now() - timedelta(days=2))
+
+        out = io.StringIO()
+        call_command('gc_build_snapshots', '--min-age', str(24 * 60 * 60), stdout=out)
+        self.assertIn('Deleted 1 build snapshots', out.getvalue())
+        self.assertEqual({used.key, recent.key}, set(BuildSnapshot.objects.values_list('key', flat=True)))
+        self.assertFalse(BuildSnapshot.objects.filter(key=unused.key).exists())
+
+    def test_gc_keeps_snapshot_that_gets_used_while_collecting(self):
+        snapshot = build_snapshots.snapshot_for('unused', make_pob_details())
+        BuildSnapshot.objects.update(last_used=timezone.now() - timedelta(days=2))
+        collect = Collector.collect
+
+        def point_guide_then_collect(collector, *args, **kwargs):
+            BuildGuide.objects.create(status=BuildGuide.GuideStatus.DRAFT, snapshot=snapshot)
+            return collect(collector, *args, **kwargs)
+
+        with mock.patch.object(Collector, 'collect', point_guide_then_collect):
+            self.assertEqual(0, build_snapshots.collect_garbage(timezone.now() - timedelta(days=1)))
+        self.assertTrue(BuildSnapshot.objects.filter(key=snapshot.key).exists())
+
+        with mock.patch.object(Collector, 'collect', side_effect=ProtectedError('', set())):
+            self.assertEqual(0, build_snapshots.collect_garbage(timezone.now()))
+
+
+class BuildGuideTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('author', 'author@example.com', 'password')
+        self.skill_tree_service = SkillTreeService()
+
+    def test_reference_data_written_in_bulk(self):
+        keystone_ids = ['31961', '41970', '42343', '9403', '57279', '63425']
+        items = [Item(item_id_in_itemset=i, name=f'Unique {i}', base_name='Leather Belt', rarity='UNIQUE',
+                      display_html='', support_gems=[], asset_path='') for i in range(15)]
+        pob_details = make_pob_details(items=items, item_sets=[], used_jewels={},
+                                       tree_specs=[TreeSpec(title='', nodes=keystone_ids, url='', tree_version='3_15')])
+        UniqueItem.objects.create(name='Unique 0')
+        guide = BuildGuide.objects.create(status=BuildGuide.GuideStatus.DRAFT, author=self.user.userprofile)
+        build_guide._get_asc_class_ids.cache_clear()
+        # was 110 with a get_or_create and a save per name
+        with self.assertNumQueries(18):
+            build_guide.assign_pob_details_to_guide(guide, pob_details, 'pob', self.skill_tree_service)
+
+        self.assertEqual(15, guide.unique_items.count())
+        self.assertEqual(15, UniqueItem.objects.count())
+        self.assertEqual(6, guide.keystones.count())
+        self.assertEqual('Raise Spectre', guide.primary_skills.get().name)
+
+        other_guide = BuildGuide.objects.create(status=BuildGuide.GuideStatus.DRAFT, author=self.user.userprofile)
+        build_guide.assign_pob_details_to_guide(other_guide, pob_details, 'pob', self.skill_tree_service)
+        self.assertEqual(15, UniqueItem.objects.count())
+        self.assertEqual(6, Keystone.objects.count())
+
+
+class PublishGuideTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user('author', 'author@example.com', 'password')
+        snapshot = build_snapshots.snapshot_for('pob', make_pob_details())
+        self.draft = BuildGuide.objects.create(status=BuildGuide.GuideStatus.DRAFT, author=user.userprofile,
+                                               title='My build', snapshot=snapshot)
+        self.draft.keystones.set([Keystone.objects.create(name=f'Keystone {i}') for i in range(6)])
+        self.draft.unique_items.set([UniqueItem.objects.create(name=f'Unique {i}') for i in range(15)])
+
+    def assert_same_relations(self, guide, other_guide):
+        for field_name in ('primary_skills', 'keystones', 'unique_items'):
+            self.assertEqual(set(getattr(guide, field_name).values_list('id', flat=True)),
+                             set(getattr(other_guide, field_name).values_list('id', flat=True)))
+
+    def test_publish_and_clear_draft_query_budget(self):
+        with self.assertNumQueries(10):
+            public_guide = build_guide.publish_guide(self.draft)
+        self.assertEqual(BuildGuide.GuideStatus.PUBLIC, public_guide.status)
+        self.assertEqual(self.draft.guide_id, public_guide.draft_id)
+        self.assertEqual(self.draft.snapshot_id, public_guide.snapshot_id)
+        self.assert_same_relations(self.draft, public_guide)
+
+        self.draft.refresh_from_db()
+        self.draft.title = 'My build v2'
+        self.draft.save()
+        self.draft.keystones.set(Keystone.objects.all()[:2])
+        with self.assertNumQueries(12):
+            public_guide = build_guide.publish_guide(self.draft)
+        self.assertEqual('My build v2', BuildGuide.objects.get(guide_id=public_guide.guide_id).title)
+        self.assertEqual(2, public_guide.keystones.count())
+        self.assertEqual(2, BuildGuide.objects.count())
+
+        BuildGuide.objects.filter(guide_id=self.draft.guide_id).update(title='Abandoned changes')
+        self.draft.unique_items.clear()
+        public_guide = BuildGuide.objects.get(guide_id=public_guide.guide_id)
+        with self.assertNumQueries(11):
+            build_guide.clear_draft(public_guide)
+        self.draft.refresh_from_db()
+        self.assertEqual('My build v2', self.draft.title)
+        self.assertEqual(BuildGuide.GuideStatus.DRAFT, self.draft.status)
+        self.assertIsNone(self.draft.draft_id)
+        self.assert_same_relations(public_guide, self.draft)
+
+
 class TreeUtilsTests(TestCase):
     def test_read_tree_data_file(self):
         filepath = 'GuideToExile/trees/3_15/data.json'
@@ -103,6 +588,16 @@ class TreeUtilsTests(TestCase):
         self.assertEqual(2341, len(tree.nodes))
         self.assertEqual(727, len(tree.node_groups))
 
+    def test_read_tree_data_file_builds_indexes(self):
+        tree = skill_tree._read_tree_data_file('GuideToExile/trees/3_15/data.json')
+        for group in tree.node_groups.values():
+            for node_id in group.node_ids:
+                self.assertIs(group, tree.find_group_containing_node(node_id))
+        for node_id, connected_node_ids in tree.adjacent_nodes.items():
+            for connected_node_id in connected_node_ids:
+                self.assertIn(node_id, tree.adjacent_nodes[connected_node_id])
+        self.assertEqual('Ascendant', tree.node_ascendancies['35754'])
+
     def test_read_tree_data_file_raises_exception(self):
         with self.assertRaises(SkillTreeLoadingException):
             filepath = 'GuideToExile/trees/3_15/data2.json'
@@ -115,6 +610,86 @@ class TreeUtilsTests(TestCase):
         self.assertEqual(2341, len(tree_3_15.nodes))
         self.assertEqual(727, len(tree_3_15.node_groups))
 
+    def test_skill_tree_service_loads_compiled_artifact(self):
+        with tempfile.TemporaryDirectory() as artifact_dir:
+            skill_tree.compile_tree_artifact('3_15', 'GuideToExile/trees', artifact_dir)
+            skill_tree_service = SkillTreeService(artifact_dir=artifact_dir)
+            self.assertEqual([], skill_tree_service.tree_graphs.resident_versions())
+            tree_graph = skill_tree_service.tree_graphs['3_15']
+        expected_graph = TreeGraph(skill_tree._read_tree_data_file('GuideToExile/trees/3_15/data.json'))
+        self.assertEqual(expected_graph.skill_tree, skill_tree_service.skill_trees['3_15'])
+        nodes = ['35754', '46910', '50862']
+        self.assertEqual(expected_graph.as_html_with_taken_nodes(nodes), tree_graph.as_html_with_taken_nodes(nodes))
+
+    def test_skill_tree_service_keeps_current_version_and_evicts_least_recently_used(self):
+        skill_tree_service = SkillTreeService(max_resident=2)
+        current_version = settings.CURRENT_TREE_VERSION
+        old_versions = [version for version in skill_tree_service.versions if version != current_version][:2]
+        _ = skill_tree_service.skill_trees[current_version]
+        for version in old_versions:
+            _ = skill_tree_service.skill_trees[version]
+        self.assertEqual([current_version, old_versions[1]], skill_tree_service.tree_graphs.resident_versions())
+
+        _ = skill_tree_service.skill_trees[old_versions[0]]
+        stats = skill_tree_service.stats()
+        self.assertEqual([current_version, old_versions[0]], stats['resident'])
+        self.assertEqual(2, stats['versions'][old_versions[0]]['loads'])
+        self.assertFalse(stats['versions'][old_versions[1]]['resident'])
+
+    def test_tree_version_cache_maps_every_available_version(self):
+        tree_graphs = skill_tree._TreeVersionCache(lambda version: f'graph {version}', ['3_14', '3_15'], 1)
+        self.assertIn('3_14', tree_graphs)
+        self.assertEqual(['3_14', '3_15'], list(tree_graphs))
+        self.assertEqual('graph 3_14', tree_graphs['3_14'])
+        self.assertNotIn('3_16', tree_graphs)
+        with self.assertRaises(KeyError):
+            _ = tree_graphs['3_16']
+
+    def test_tree_version_cache_serves_resident_versions_while_loading(self):
+        loading, finish_loading = threading.Event(), threading.Event()
+
+        def load(version):
+            if version == '3_14':
+                loading.set()
+                finish_loading.wait(5)
+            return f'graph {version}'
+
+        tree_graphs = skill_tree._TreeVersionCache(load, ['3_14', '3_15'], 2, pinned_version='3_15')
+        _ = tree_graphs['3_15']
+        load_thread = threading.Thread(target=lambda: tree_graphs['3_14'])
+        load_thread.start()
+        self.assertTrue(loading.wait(5))
+        self.assertEqual('graph 3_15', tree_graphs['3_15'])
+        finish_loading.set()
+        load_thread.join()
+        self.assertEqual(['3_15', '3_14'], tree_graphs.resident_versions())
+        self.assertEqual(1, tree_graphs.version_stats('3_14')['loads'])
+
+    def test_skill_tree_service_caches_taken_overlay(self):
+        skill_tree_service = SkillTreeService()
+        nodes = ['35754', '46910', '50862']
+        tree_html = skill_tree_service.get_html_with_taken_nodes(nodes, '3_15', [('50862', '123')])
+        cache_key = skill_tree._tree_overlay_cache_key(list(reversed(nodes)), '3_15', [('50862', '123')])
+        tree_graph = skill_tree_service.tree_graphs['3_15']
+        self.assertEqual(tree_graph.get_taken_overlay(nodes), caches[skill_tree.TREE_HTML_CACHE_ALIAS].get(cache_key))
+        self.assertEqual(tree_graph.as_html_with_taken_nodes(nodes), tree_html)
+        self.assertEqual(tree_html, skill_tree_service.get_html_with_taken_nodes(nodes, '3_15', [('50862', '123')]))
+        self.assertNotEqual(cache_key, skill_tree._tree_overlay_cache_key(nodes, '3_15', []))
+
+
+class TreeGeometryTests(TestCase):
+    def test_calculate_node_positions(self):
+        positions = tree_geometry.calculate_node_positions(orbits=[0, 1, 1], orbit_indices=[0, 0, 1],
+                                                           group_xs=[100, 100, 0], group_ys=[50, 50, 0],
+                                                           skills_per_orbit=[1, 4], orbit_radii=[0, 10])
+        self.assertEqual([[100, 50], [100, 40]], positions[:2].round(6).tolist())
+        self.assertEqual([10, 0], positions[2].round(6).tolist())
+
+    def test_are_paths_clockwise(self):
+        clockwise = tree_geometry.are_paths_clockwise(np.array([[0, -10], [10, 0]]), np.array([[10, 0], [0, -10]]),
+                                                      np.array([[0, 0], [0, 0]]))
+        self.assertEqual([False, True], clockwise.tolist())
+
 
 class TreeGraphTests(TestCase):
     def test_tree_graph_to_html(self):
@@ -126,12 +701,186 @@ class TreeGraphTests(TestCase):
         _ = tree_graph.as_html_with_taken_nodes(nodes)
         print('html')
 
+    def test_tree_graph_html_is_base_layer_with_taken_overlay(self):
+        tree = skill_tree._read_tree_data_file('GuideToExile/trees/3_15/data.json')
+        tree_graph = TreeGraph(tree)
+        nodes = ['35754', '46910', '50862']
+        html = tree_graph.as_html_with_taken_nodes(nodes)
+        base_layer = tree_graph.get_base_layer('Ascendant')
+        self.assertTrue(html.startswith(base_layer))
+        self.assertNotIn('#FF0000', base_layer)
+        self.assertEqual(3, html[len(base_layer):].count('<circle'))
+
 
 class TestPobWrapper(TestCase):
     def test_pob_char_import(self):
         pob = PathOfBuilding(POB_PATH, POB_PATH)
         pob.import_build_as_xml('TheFriendly', 'TheFriendlyWidePeepow')
 
+    def test_items_as_html_batch(self):
+        pob = PathOfBuilding(POB_PATH, POB_PATH)
+        item = 'Rarity: UNIQUE\nHeadhunter\nLeather Belt\nImplicits: 1\n+35 to maximum Life'
+        results = pob.items_as_html([item, 'not an item', item])
+        pob.kill()
+        self.assertEqual(3, len(results))
+        self.assertEqual(results[0], results[2])
+        self.assertIsNone(results[1])
+
+    def test_pob_pool_recycles_workers(self):
+        pool = PathOfBuildingPool(POB_PATH, POB_PATH, size=1, max_requests=2)
+        with pool.borrow() as pob:
+            first_pob = pob
+        with pool.borrow() as pob:
+            self.assertIs(first_pob, pob)
+        with pool.borrow() as pob:
+            self.assertIsNot(first_pob, pob)
+        self.assertEqual(2, pool.stats()['started'])
+        pool.close()
+
+    def test_pob_pool_kills_workers_outside_its_lock(self):
+        class SlowToDiePob:
+            def __init__(self, *args, **kwargs):
+                self.killing = threading.Event()
+                self.killed = threading.Event()
+
+            def is_alive(self):
+                return not self.killed.is_set()
+
+            def kill(self):
+                self.killing.set()
+                self.killed.wait(5)
+
+        with mock.patch('apps.pob_wrapper.pool.PathOfBuilding', SlowToDiePob):
+            pool = PathOfBuildingPool(POB_PATH, POB_PATH, size=1)
+            broken_pob = pool.checkout()
+            checkin = threading.Thread(target=pool.checkin, args=(broken_pob,), kwargs={'broken': True})
+            checkin.start()
+            self.assertTrue(broken_pob.killing.wait(5))
+            # the broken worker is still shutting down, the pool already lends out a new one
+            pob = pool.checkout(timeout=1)
+            self.assertIsNot(broken_pob, pob)
+            self.assertEqual({'recycled': 1, 'started': 2}, {key: pool.stats()[key] for key in ('recycled', 'started')})
+            broken_pob.killed.set()
+            checkin.join(5)
+            pob.killed.set()
+            pool.checkin(pob)
+            pool.close()
+
+
+# stands in for PoB: answers `echo <text>` and `slow <text>` with <text>, `hang` never answers, `exit` crashes,
+# `ignore_term` answers and ignores being terminated from then on
+FAKE_CHILD_SCRIPT = f"""
+import json, signal, sys, time
+print('ready', flush=True)
+for line in sys.stdin:
+    command, _, text = line.rstrip('\\n').partition(' ')
+    if command == 'exit':
+        sys.exit(1)
+    if command == 'hang':
+        time.sleep(60)
+    if command == 'slow':
+        time.sleep(0.05)
+    if command == 'ignore_term':
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    print('{process_wrapper.START_MSG}')
+    print('handling ' + command)
+    print('{process_wrapper.START_RESULT}')
+    print(json.dumps(text))
+    print('{process_wrapper.END_RESULT}', flush=True)
+"""
+
+
+class ProcessWrapperTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.script_dir = tempfile.TemporaryDirectory()
+        cls.child_args = [sys.executable, os.path.join(cls.script_dir.name, 'fake_child.py')]
+        with open(cls.child_args[1], 'w') as f:
+            f.write(FAKE_CHILD_SCRIPT)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.script_dir.cleanup()
+        super().tearDownClass()
+
+    def start_wrapper(self, timeout=5):
+        wrapper = ProcessWrapper(timeout=timeout, start_timeout=5)
+        wrapper.receive_msg_fn = lambda msg: None
+        wrapper.start(self.child_args)
+        self.addCleanup(wrapper.kill)
+        return wrapper
+
+    def test_send_returns_result_and_passes_messages_on(self):
+        wrapper = self.start_wrapper()
+        messages = []
+        wrapper.receive_msg_fn = messages.append
+        self.assertEqual('hello world', wrapper.send('echo hello world'))
+        self.assertEqual(['handling echo\n'], messages)
+
+    def test_timeout_restarts_process(self):
+        wrapper = self.start_wrapper(timeout=0.2)
+        first_process = wrapper.process
+        with self.assertRaises(TimeoutError):
+            wrapper.send('hang')
+        self.assertEqual(1, wrapper.restart_count)
+        self.assertIsNot(first_process, wrapper.process)
+        self.assertEqual('again', wrapper.send('echo again'))
+
+    def test_crash_restarts_process(self):
+        wrapper = self.start_wrapper()
+        with self.assertRaises(EOFError):
+            wrapper.send('exit')
+        self.assertEqual(1, wrapper.restart_count)
+        self.assertTrue(wrapper.is_alive())
+        self.assertEqual('again', wrapper.send('echo again'))
+
+    def test_kill_falls_back_to_killing_a_child_that_ignores_terminate(self):
+        wrapper = self.start_wrapper()
+        wrapper.send('ignore_term')
+        with mock.patch.object(process_wrapper, 'KILL_TIMEOUT', 0.2):
+            wrapper.kill()
+        self.assertFalse(wrapper.is_alive())
+
+    def test_concurrent_callers_get_their_own_results(self):
+        wrapper = self.start_wrapper()
+        results = {}
+
+        def call(index):
+            results[index] = wrapper.send(f'slow caller {index}')
+
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({index: f'caller {index}' for index in range(8)}, results)
+
+    def test_start_fails_when_child_exits(self):
+        wrapper = ProcessWrapper(start_timeout=5)
+        with self.assertRaises(EOFError):
+            wrapper.start([sys.executable, '-c', 'pass'])
+
+    def test_async_wrapper(self):
+        async def exercise():
+            wrapper = AsyncProcessWrapper(timeout=0.5, start_timeout=5)
+            wrapper.receive_msg_fn = lambda msg: None
+            await wrapper.start(self.child_args)
+            try:
+                results = await asyncio.gather(*(wrapper.send(f'slow caller {index}') for index in range(4)))
+                with self.assertRaises(TimeoutError):
+                    await wrapper.send('hang')
+                with self.assertRaises(EOFError):
+                    await wrapper.send('exit')
+                return results, wrapper.restart_count, await wrapper.send('echo again')
+            finally:
+                await wrapper.kill()
+
+        results, restart_count, last_result = asyncio.run(exercise())
+        self.assertEqual([f'caller {index}' for index in range(4)], results)
+        self.assertEqual(2, restart_count)
+        self.assertEqual('again', last_result)
+
 
 class TestImportBuildsScript(TestCase):
     def test_get_chars_and_acc_from_ladder_api(self):
@@ -140,6 +889,78 @@ class TestImportBuildsScript(TestCase):
             ladder_json = json.load(f)
             ladder_imports.get_acc_and_chars_from_json(ladder_json)
 
+    def test_iter_ladder_entries_across_chunks(self):
+        entries = [{'public': True, 'account': {'name': f'acc{i}'}, 'character': {'name': f'char]{i}'}}
+                   for i in range(20)]
+        ladder_json = json.dumps({'total': 20, 'entries': entries}, indent=1)
+        for chunk_size in (1, 16, 64 * 1024):
+            self.assertEqual(entries, list(ladder_imports.iter_ladder_entries(io.StringIO(ladder_json), chunk_size)))
+
+    def test_token_bucket_waits_for_tokens(self):
+        clock = [100.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        with mock.patch.object(ladder_imports.time, 'monotonic', lambda: clock[0]), \
+                mock.patch.object(ladder_imports.time, 'sleep', sleep):
+            bucket = ladder_imports.TokenBucket(rate=2, capacity=3)
+            for _ in range(4):
+                bucket.acquire()
+            self.assertEqual([0.5], sleeps)
+            clock[0] += 10
+            for _ in range(3):
+                bucket.acquire()
+            self.assertEqual([0.5], sleeps)
+
+    def test_checkpoint_round_trip(self):
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            checkpoint_path = os.path.join(checkpoint_dir, 'ladder.json.checkpoint')
+            self.assertEqual(0, ladder_imports.read_checkpoint(checkpoint_path))
+            ladder_imports.write_checkpoint(checkpoint_path, 42)
+            self.assertEqual(42, ladder_imports.read_checkpoint(checkpoint_path))
+            self.assertEqual(['ladder.json.checkpoint'], os.listdir(checkpoint_dir))
+
+    def test_run_resumes_after_checkpoint(self):
+        entries = [{'account': {'name': f'acc{i}'}, 'character': {'name': f'char{i}'}} for i in range(8)]
+        for entry in entries[:6]:
+            entry['public'] = True
+        saved_batches = []
+
+        def save_guides(builds, skill_tree_service):
+            saved_batches.append([count for count, _, _ in builds])
+            return len(builds)
+
+        with tempfile.TemporaryDirectory() as ladder_dir:
+            ladder_path = os.path.join(ladder_dir, 'ladder.json')
+            with open(ladder_path, 'w') as f:
+                json.dump({'total': len(entries), 'entries': entries}, f)
+            ladder_imports.write_checkpoint(f'{ladder_path}.checkpoint', 3)
+            with mock.patch.object(ladder_imports, 'ProcessPoolExecutor', ThreadPoolExecutor), \
+                    mock.patch.object(ladder_imports.db.connections, 'close_all'), \
+                    mock.patch.object(ladder_imports, 'fetch_and_parse', return_value=('<xml/>', None)) as fetch, \
+                    mock.patch.object(ladder_imports, 'save_guides', save_guides):
+                ladder_imports.run(ladder_path, '2', '1000')
+            self.assertEqual(8, ladder_imports.read_checkpoint(f'{ladder_path}.checkpoint'))
+        self.assertEqual([mock.call(f'acc{i}', f'char{i}') for i in range(3, 6)], fetch.call_args_list)
+        self.assertEqual([[3, 4, 5]], saved_batches)
+
+    def test_save_guides_skips_build_that_fails(self):
+        def create_build_guide(author, build_details, pob_string, skill_tree_service, text, title):
+            BuildGuide.objects.create(status=BuildGuide.GuideStatus.DRAFT, author=author, title=title)
+            if title.endswith(' 1'):
+                raise ValueError('broken build')
+
+        get_user_model().objects.create_user('Importer')
+        builds = [(count, '<PathOfBuilding/>', None) for count in range(3)]
+        with mock.patch.object(ladder_imports, 'create_build_guide', create_build_guide):
+            saved = ladder_imports.save_guides(builds, None)
+        self.assertEqual(2, saved)
+        self.assertEqual(['Auto-imported build 0', 'Auto-imported build 2'],
+                         sorted(BuildGuide.objects.values_list('title', flat=True)))
+
     def test_get_pob_xml(self):
         ladder_imports.get_pob_xml(acc_name='kamilrogoz', char_name='Riteld')
 
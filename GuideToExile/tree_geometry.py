@@ -0,0 +1,36 @@
+from typing import List, Sequence
+
+import numpy as np
+
+
+def calculate_node_positions(orbits: Sequence[int], orbit_indices: Sequence[int], group_xs: Sequence[float],
+                             group_ys: Sequence[float], skills_per_orbit: List[int],
+                             orbit_radii: List[int]) -> np.ndarray:
+    """Positions of nodes placed on the orbits of their groups, one (x, y) row per node."""
+    orbits = np.asarray(orbits, dtype=np.intp)
+    nodes_per_orbit = np.asarray(skills_per_orbit, dtype=np.float64)[orbits]
+    orbit_radius = np.asarray(orbit_radii, dtype=np.float64)[orbits]
+    angle_degrees = (360.0 / nodes_per_orbit) * np.asarray(orbit_indices, dtype=np.float64) - 90.0
+    angle_radians = np.radians(angle_degrees)
+    positions = np.empty((len(orbits), 2), dtype=np.float64)
+    positions[:, 0] = np.cos(angle_radians) * orbit_radius + np.asarray(group_xs, dtype=np.float64)
+    positions[:, 1] = np.sin(angle_radians) * orbit_radius + np.asarray(group_ys, dtype=np.float64)
+    return positions
+
+
+def are_paths_clockwise(start_positions: np.ndarray, end_positions: np.ndarray,
+                        centres: np.ndarray) -> np.ndarray:
+    """Whether going from start to end around the centre is clockwise, one flag per path."""
+    start = start_positions - centres
+    end = end_positions - centres
+    det = start[:, 0] * end[:, 1] - end[:, 0] * start[:, 1]
+    return det <= 0
+
+
+def calculate_group_offsets(group_positions: np.ndarray, centre_indices: Sequence[int],
+                            targets: np.ndarray) -> np.ndarray:
+    """Offsets moving every group together with its centre group, so that the centre lands on its target.
+
+    centre_indices[i] is the row of the centre group of group i, targets holds one (x, y) row per group.
+    """
+    return targets - group_positions[np.asarray(centre_indices, dtype=np.intp)]
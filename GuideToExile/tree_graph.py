@@ -1,11 +1,20 @@
-import math
+import logging
+import os
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, field
-from typing import Tuple, List, Dict
+from dataclasses import dataclass, field, replace
+from typing import Tuple, List, Dict, Optional, FrozenSet, Iterable
 
-from GuideToExile.data_classes import NodeGroup, TreeNode, SkillTree
+import numpy as np
+
+from GuideToExile import tree_geometry
+from GuideToExile.data_classes import SkillTree
 from GuideToExile.settings.common import ASC_TREE_OFFSET_X, ASC_TREE_OFFSET_Y
 
+logger = logging.getLogger('guidetoexile')
+
+# bump when the SVG output changes, so base layers cached on disk are regenerated
+BASE_LAYER_FORMAT_VERSION = 1
+
 
 @dataclass(frozen=True)
 class GraphElement(ABC):
@@ -75,55 +84,82 @@ class TreeGraphPath(GraphElement):
 class TreeGraph:
     nodes: Dict[str, TreeGraphNode]
     paths: List[TreeGraphPath]
+    paths_by_nodes: Dict[FrozenSet[str], TreeGraphPath]
     skill_tree: SkillTree
 
-    def __init__(self, skill_tree):
+    def __init__(self, skill_tree, cache_dir: Optional[str] = None):
         self.nodes = {}
         self.paths = []
+        self.paths_by_nodes = {}
         self.skill_tree = skill_tree
+        self.cache_dir = cache_dir
+        self._base_layers: Dict[str, str] = {}
         self._init_nodes()
         self._init_paths()
 
     def _init_nodes(self):
-        groups = self.skill_tree.node_groups.values()
         tree_nodes = self.skill_tree.nodes
-        for group in groups:
+        graph_node_ids, groups = [], []
+        for group in self.skill_tree.node_groups.values():
             for node_id in group.node_ids:
                 node = tree_nodes[node_id]
                 if node.is_class_start_node or (not node.connected_out_nodes and not node.connected_in_nodes):
                     continue
-                pos_x, pos_y = self._calculate_node_position(group, node)
-                is_hoverable = node.is_mastery or node.is_keystone
-                self.nodes[node_id] = TreeGraphNode(node_id=node_id,
-                                                    pos_x=pos_x,
-                                                    pos_y=pos_y,
-                                                    size=node.size,
-                                                    is_taken=False,
-                                                    is_hidden=False,
-                                                    is_hoverable=is_hoverable)
+                graph_node_ids.append(node_id)
+                groups.append(group)
+        positions = tree_geometry.calculate_node_positions(
+            orbits=[tree_nodes[node_id].orbit_radii for node_id in graph_node_ids],
+            orbit_indices=[tree_nodes[node_id].orbit_index for node_id in graph_node_ids],
+            group_xs=[group.x for group in groups],
+            group_ys=[group.y for group in groups],
+            skills_per_orbit=self.skill_tree.skills_per_orbit,
+            orbit_radii=self.skill_tree.orbit_radii)
+        for node_id, (pos_x, pos_y) in zip(graph_node_ids, positions.tolist()):
+            node = tree_nodes[node_id]
+            self.nodes[node_id] = TreeGraphNode(node_id=node_id,
+                                                pos_x=pos_x,
+                                                pos_y=pos_y,
+                                                size=node.size,
+                                                is_taken=False,
+                                                is_hidden=False,
+                                                is_hoverable=node.is_mastery or node.is_keystone)
 
     def _init_paths(self):
-        paths_list = []
-        for node_id, node in self.skill_tree.nodes.items():
+        tree_nodes = self.skill_tree.nodes
+        edges = {}
+        for node_id, node in tree_nodes.items():
             if node.is_mastery or node.is_class_start_node:
                 continue
             for connected_node_id in node.connected_out_nodes:
-                connected_node = self.skill_tree.nodes[connected_node_id]
-                if not node.is_connected_to(connected_node):
-                    continue
-                start_pos = self.nodes[node_id].pos
-                end_position = self.nodes[connected_node_id].pos
-                start_node_group = self.skill_tree.find_group_containing_node(node_id)
-                end_node_group = self.skill_tree.find_group_containing_node(connected_node_id)
-                is_curved = (start_node_group == end_node_group) and node.orbit_radii == connected_node.orbit_radii
-                radius = self.skill_tree.orbit_radii[node.orbit_radii]
-                is_path_clockwise = _are_nodes_clockwise(start_pos, end_position, start_node_group)
-
-                new_path = TreeGraphPath(start_node_id=node_id, end_node_id=connected_node_id, start_pos=start_pos,
-                                         end_pos=end_position, is_curved=is_curved, radius=radius, is_taken=False,
-                                         is_clockwise=is_path_clockwise, is_hidden=False)
-                paths_list.append(new_path)
-        self.paths = list(set(paths_list))
+                if node.is_connected_to(tree_nodes[connected_node_id]):
+                    edges.setdefault(frozenset((node_id, connected_node_id)), (node_id, connected_node_id))
+        if not edges:
+            return
+
+        start_positions = np.array([self.nodes[start_id].pos for start_id, _ in edges.values()])
+        end_positions = np.array([self.nodes[end_id].pos for _, end_id in edges.values()])
+        start_groups = [self.skill_tree.find_group_containing_node(start_id) for start_id, _ in edges.values()]
+        centres = np.array([(group.x, group.y) for group in start_groups], dtype=np.float64)
+        clockwise = tree_geometry.are_paths_clockwise(start_positions, end_positions, centres).tolist()
+
+        for (start_id, end_id), start_group, is_path_clockwise in zip(edges.values(), start_groups, clockwise):
+            start_node = tree_nodes[start_id]
+            end_node = tree_nodes[end_id]
+            is_curved = (start_group == self.skill_tree.find_group_containing_node(end_id)
+                         and start_node.orbit_radii == end_node.orbit_radii)
+            self.paths_by_nodes[frozenset((start_id, end_id))] = TreeGraphPath(
+                start_node_id=start_id, end_node_id=end_id, start_pos=self.nodes[start_id].pos,
+                end_pos=self.nodes[end_id].pos, is_curved=is_curved,
+                radius=self.skill_tree.orbit_radii[start_node.orbit_radii], is_taken=False,
+                is_clockwise=is_path_clockwise, is_hidden=False)
+        self.paths = list(self.paths_by_nodes.values())
+
+    def __getstate__(self):
+        # rendered base layers are rebuilt on demand, only the geometry goes into compiled artifacts
+        state = self.__dict__.copy()
+        state['cache_dir'] = None
+        state['_base_layers'] = {}
+        return state
 
     @property
     def tree_dimensions(self):
@@ -133,32 +169,98 @@ class TreeGraph:
         size_y = self.skill_tree.max_y - min_y
         return min_x, min_y, size_x, size_y
 
-    def as_html_with_taken_nodes(self, taken_node_ids: List[str]) -> str:
+    def as_html_with_taken_nodes(self, taken_node_ids: Iterable[str]) -> str:
+        """Static base layer of the whole tree with the taken nodes and paths drawn on top of it."""
+        return self.with_base_layer(*self.get_taken_overlay(taken_node_ids))
+
+    def get_taken_overlay(self, taken_node_ids: Iterable[str]) -> Tuple[str, str]:
+        """Ascendancy of the build and the SVG of its taken nodes and paths, drawn on top of that base layer."""
+        taken_node_ids = frozenset(taken_node_ids)
+        asc_name = self._find_asc_name(taken_node_ids)
+        taken_elements = self._get_taken_graph_elements(taken_node_ids, asc_name)
+        return asc_name, ''.join(el.svg_string for el in taken_elements)
+
+    def with_base_layer(self, asc_name: str, taken_overlay: str) -> str:
+        return f'{self.get_base_layer(asc_name)}{taken_overlay}</svg>\n'
+
+    def get_base_layer(self, asc_name: str) -> str:
+        """Opening of the SVG with every node and path drawn as not taken, the same for all builds of an ascendancy.
+
+        Generated once per ascendancy and kept in memory and in cache_dir, if given.
+        """
+        if asc_name in self._base_layers:
+            return self._base_layers[asc_name]
+        base_layer = self._read_cached_base_layer(asc_name)
+        if base_layer is None:
+            base_layer = self._render_base_layer(asc_name)
+            self._write_cached_base_layer(asc_name, base_layer)
+        self._base_layers[asc_name] = base_layer
+        return base_layer
+
+    def _render_base_layer(self, asc_name: str) -> str:
         min_x, min_y, size_x, size_y = self.tree_dimensions
         html = f'<svg style="background-color: transparent;" viewBox="{min_x} {min_y} {size_x} {size_y}">\n'
-        asc_name = self._find_asc_name(taken_node_ids)
         if asc_name:
             asc_tree_x = min_x + size_x + ASC_TREE_OFFSET_X
             asc_tree_y = min_y + ASC_TREE_OFFSET_Y
             html += f'<circle cx="{asc_tree_x}" cy="{asc_tree_y}" r="700" fill="#35383B"/>\n'
-        graph_elements = self._get_all_graph_elements_including_taken_nodes(taken_node_ids)
-        graph_elements.sort(key=lambda v: v.is_taken)
+        graph_elements = (self._get_nodes_including_taken_nodes(frozenset(), asc_name)
+                          + self._get_paths_including_taken_nodes(frozenset(), asc_name))
         html += ''.join(el.svg_string for el in graph_elements)
-        html += '</svg>\n'
         return html
 
-    def _get_all_graph_elements_including_taken_nodes(self, taken_node_ids: List[str]) -> List[GraphElement]:
-        asc_name = self._find_asc_name(taken_node_ids)
-        nodes = self._get_nodes_including_taken_nodes(taken_node_ids, asc_name)
-        paths = self._get_paths_including_taken_nodes(taken_node_ids, asc_name)
+    def _base_layer_cache_path(self, asc_name: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f'base_v{BASE_LAYER_FORMAT_VERSION}_{asc_name or "none"}.svg')
+
+    def _read_cached_base_layer(self, asc_name: str) -> Optional[str]:
+        path = self._base_layer_cache_path(asc_name)
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _write_cached_base_layer(self, asc_name: str, base_layer: str) -> None:
+        path = self._base_layer_cache_path(asc_name)
+        if not path:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(base_layer)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.warning('Unable to cache tree base layer in %s', path, exc_info=True)
 
+    def _get_taken_graph_elements(self, taken_node_ids: FrozenSet[str], asc_name: str) -> List[GraphElement]:
+        taken_graph_node_ids = sorted(node_id for node_id in taken_node_ids if node_id in self.nodes)
+        nodes = [replace(self.nodes[node_id], is_taken=True, is_hidden=self._is_node_hidden(node_id, asc_name))
+                 for node_id in taken_graph_node_ids]
+        paths = []
+        adjacent_nodes = self.skill_tree.adjacent_nodes
+        for node_id in taken_graph_node_ids:
+            for connected_node_id in sorted(adjacent_nodes[node_id] & taken_node_ids):
+                if connected_node_id < node_id:
+                    continue
+                path = self.paths_by_nodes.get(frozenset((node_id, connected_node_id)))
+                if path:
+                    paths.append(replace(path, is_taken=True, is_hidden=self._is_path_hidden(path, asc_name)))
         return nodes + paths
 
-    def _get_nodes_including_taken_nodes(self, taken_node_ids: List[str], asc_name: str) -> List[GraphElement]:
+    def _is_node_hidden(self, node_id: str, asc_name: str) -> bool:
+        node_ascendancy = self.skill_tree.node_ascendancies[node_id]
+        return node_ascendancy != '' and node_ascendancy != asc_name
+
+    def _is_path_hidden(self, path: TreeGraphPath, asc_name: str) -> bool:
+        return (self._is_node_hidden(path.start_node_id, asc_name)
+                and self._is_node_hidden(path.end_node_id, asc_name))
+
+    def _get_nodes_including_taken_nodes(self, taken_node_ids: FrozenSet[str], asc_name: str) -> List[GraphElement]:
         nodes = []
         for node_id, node in self.nodes.items():
-            is_hidden = (self.skill_tree.nodes[node_id].ascendancy_name != ''
-                         and self.skill_tree.nodes[node_id].ascendancy_name != asc_name)
+            is_hidden = self._is_node_hidden(node_id, asc_name)
             new_node = TreeGraphNode(node_id=node_id,
                                      pos_x=node.pos_x,
                                      pos_y=node.pos_y,
@@ -169,14 +271,11 @@ class TreeGraph:
             nodes.append(new_node)
         return nodes
 
-    def _get_paths_including_taken_nodes(self, taken_node_ids: List[str], asc_name: str) -> List[GraphElement]:
+    def _get_paths_including_taken_nodes(self, taken_node_ids: FrozenSet[str], asc_name: str) -> List[GraphElement]:
         paths = []
         for path in self.paths:
             is_taken = path.start_node_id in taken_node_ids and path.end_node_id in taken_node_ids
-            is_hidden = (self.skill_tree.nodes[path.start_node_id].ascendancy_name != ''
-                         and self.skill_tree.nodes[path.start_node_id].ascendancy_name != asc_name
-                         and self.skill_tree.nodes[path.end_node_id].ascendancy_name != ''
-                         and self.skill_tree.nodes[path.end_node_id].ascendancy_name != asc_name)
+            is_hidden = self._is_path_hidden(path, asc_name)
             paths.append(TreeGraphPath(start_node_id=path.start_node_id,
                                        end_node_id=path.end_node_id,
                                        start_pos=path.start_pos,
@@ -188,25 +287,9 @@ class TreeGraph:
                                        is_hidden=is_hidden))
         return paths
 
-    def _calculate_node_position(self, group: NodeGroup, node: TreeNode) -> Tuple[float, float]:
-        nodes_per_orbit = self.skill_tree.skills_per_orbit[node.orbit_radii]
-        orbit_radius = self.skill_tree.orbit_radii[node.orbit_radii]
-        angle_degrees = (360.0 / nodes_per_orbit) * node.orbit_index - 90.0
-        angle_radians = math.radians(angle_degrees)
-        pos_x = math.cos(angle_radians) * orbit_radius + group.x
-        pos_y = math.sin(angle_radians) * orbit_radius + group.y
-        return pos_x, pos_y
-
-    def _find_asc_name(self, taken_node_ids: List[str]) -> str:
+    def _find_asc_name(self, taken_node_ids: FrozenSet[str]) -> str:
         for name, node_id in self.skill_tree.asc_start_nodes.items():
             if node_id in taken_node_ids:
                 return name
         return ''
 
-
-def _are_nodes_clockwise(start_pos: Tuple[float, float], end_position: Tuple[float, float], node_group: NodeGroup):
-    center_x = node_group.x
-    center_y = node_group.y
-    det = (start_pos[0] - center_x) * (end_position[1] - center_y) - (end_position[0] - center_x) * (
-        start_pos[1] - center_y)
-    return det <= 0
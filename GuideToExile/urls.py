@@ -34,6 +34,8 @@ urlpatterns = [
     path('guide/clear-draft/<int:pk>/', login_required(views.clear_draft_view), name='clear_draft'),
     path('guide/edit/<int:pk>/', login_required(views.edit_guide_view), name='edit_guide'),
     path('guide/edit-pob/<int:pk>/', login_required(views.edit_pob_view), name='edit_pob'),
+    path('guide/import-status/<int:job_id>/', login_required(views.import_job_status_view),
+         name='import_job_status'),
     path('guide/cancel-edit/<int:pk>/', login_required(views.cancel_edit_view), name='cancel_edit'),
     path('guide/publish/<int:pk>/', login_required(views.publish_guide_view), name='publish_guide'),
     path('guide/archive/<int:pk>/', login_required(views.archive_guide_view), name='archive_guide'),
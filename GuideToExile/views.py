@@ -10,13 +10,15 @@ from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 # Create your views here.
 from django.template.loader import render_to_string
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.encoding import force_bytes, force_text
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.views import generic
 
-from GuideToExile.models import BuildGuide, UserProfile, GuideComment, GuideLike, ActiveSkill
-from . import skill_tree, build_guide, items_service, guide_search
+from GuideToExile.models import BuildGuide, UserProfile, GuideComment, GuideLike, ActiveSkill, PobImportJob, \
+    BuildSnapshot
+from . import skill_tree, build_guide, items_service, guide_search, import_jobs, item_html_store, build_snapshots
 from .forms import SignUpForm, PobStringForm, EditGuideForm, ProfileForm, GuideListFilterForm, URL_REGEX, \
     UserDeleteForm
 from .settings import LIKES_RECENTLY_OFFSET
@@ -35,7 +37,7 @@ class LikedGuidesView(generic.ListView):
     paginate_by = 50
 
     def get_queryset(self):
-        return BuildGuide.objects.defer('pob_details', 'pob_string', 'text').filter(guidelike__is_active=True,
+        return BuildGuide.objects.defer('text').filter(guidelike__is_active=True,
                                                                                     guidelike__user=self.request.user.userprofile).all()
 
 
@@ -64,14 +66,14 @@ def guide_list_view(request):
 
 def show_guide_view(request, pk, slug):
     logger.info('Show guide pk=%s', pk)
-    guide = get_object_or_404(BuildGuide, guide_id=pk)
+    guide = _get_guide_with_snapshot_fields(pk, 'pob_summary')
 
     return render(request, 'show_guide.html',
                   {'pk': pk, 'build_guide': guide})
 
 
 def show_draft_view(request, pk):
-    guide = get_object_or_404(BuildGuide, guide_id=pk)
+    guide = _get_guide_with_snapshot_fields(pk, 'pob_summary')
     if request.user.userprofile != guide.author:
         return HttpResponseForbidden
     draft = guide if guide.status == BuildGuide.GuideStatus.DRAFT else guide.draft
@@ -81,37 +83,43 @@ def show_draft_view(request, pk):
 
 
 def guide_tab_view(request, pk):
-    guide = get_object_or_404(BuildGuide, guide_id=pk)
+    guide = _get_guide_with_snapshot_fields(pk, 'pob_string', 'pob_summary')
     return render(request, 'guide_tab.html', {'pk': pk, 'build_guide': guide})
 
 
 def gear_gems_tab_view(request, pk):
-    guide = get_object_or_404(BuildGuide, guide_id=pk)
-    item_sets_with_skills = items_service.assign_skills_to_items(guide.pob_details.item_sets,
-                                                                 guide.pob_details.skill_groups)
+    guide = _get_guide_with_snapshot_fields(pk, 'pob_gear', 'pob_skill_groups')
+    gear = guide.snapshot.pob_gear
+    item_html_store.load_items_html(item_html_store.iter_gear_items(gear['items'], gear['item_sets'],
+                                                                    gear['used_jewels']))
+    item_sets_with_skills = items_service.assign_skills_to_items(gear['item_sets'],
+                                                                 guide.snapshot.pob_skill_groups['skill_groups'])
     return render(request, 'gear_gems_tab.html', {'pk': pk, 'build_guide': guide, 'item_sets': item_sets_with_skills,
                                                   'gear_slots': GEAR_SLOTS})
 
 
 def skill_tree_tab_view(request, pk):
-    guide = get_object_or_404(BuildGuide, guide_id=pk)
-    tree_specs = guide.pob_details.tree_specs
+    guide = _get_guide_with_snapshot_fields(pk, 'pob_tree')
+    tree_specs = guide.snapshot.pob_tree['tree_specs']
     trees = {}
     for tree_spec in tree_specs:
         tree_version = tree_spec.tree_version
-        tree_html = skill_tree_service.get_html_with_taken_nodes(tree_spec.nodes, tree_version)
+        mastery_effects = getattr(tree_spec, 'mastery_effects', [])
+        tree_html = skill_tree_service.get_html_with_taken_nodes(tree_spec.nodes, tree_version, mastery_effects)
         keystones = skill_tree_service.get_keystones(tree_spec.nodes, tree_version)
-
-        if hasattr(tree_spec, 'mastery_effects'):
-            mastery_effects_descriptions = skill_tree_service.get_mastery_effects_descriptions(
-                tree_spec.mastery_effects,
-                tree_version)
-        else:
-            mastery_effects_descriptions = []
+        mastery_effects_descriptions = skill_tree_service.get_mastery_effects_descriptions(mastery_effects,
+                                                                                         tree_version)
         trees[tree_spec.title] = (tree_html, keystones, mastery_effects_descriptions, tree_spec.url)
     return render(request, 'skill_tree_tab.html', {'pk': pk, 'build_guide': guide, 'trees': trees})
 
 
+def _get_guide_with_snapshot_fields(pk, *field_names):
+    """The guide with its snapshot, of which only the given fields are loaded from the DB."""
+    deferred = [f'snapshot__{field_name}' for field_name in ('pob_string', *BuildSnapshot.POB_DETAILS_FIELDS)
+                if field_name not in field_names]
+    return get_object_or_404(BuildGuide.objects.select_related('snapshot').defer(*deferred), guide_id=pk)
+
+
 class MyGuidesListView(generic.ListView):
     template_name = 'guide_list.html'
     paginate_by = 50
@@ -145,13 +153,13 @@ def authors_list_view(request):
     authors_page = paginator.get_page(page)
     for author in authors_page:
         top3_guides = (BuildGuide.objects
-                           .defer('pob_details', 'pob_string', 'text')
+                           .defer('text')
                            .filter(author=author.pk)
                            .filter(status=BuildGuide.GuideStatus.PUBLIC)
                            .annotate(likes=Count('guidelike', filter=Q(guidelike__is_active=True)))
                            .order_by('-likes')[:3])
         top3_guides_recently = (BuildGuide.objects
-                                    .defer('pob_details', 'pob_string', 'text')
+                                    .defer('text')
                                     .filter(author=author.pk)
                                     .filter(status=BuildGuide.GuideStatus.PUBLIC)
                                     .annotate(likes_recently=
@@ -168,34 +176,47 @@ def authors_list_view(request):
 def new_guide_pob_view(request):
     if request.method == 'POST':
         logger.info('Creating new guide')
-        form = PobStringForm(request.POST)
-        if form.is_valid():
-            build_details, pob_string = form.cleaned_data['pob_input']
-            author = request.user.userprofile
-            new_build_guide = build_guide.create_build_guide(author, build_details, pob_string, skill_tree_service)
-            new_build_guide.save()
-            return redirect('edit_guide', pk=new_build_guide.guide_id)
-
-    else:
-        form = PobStringForm()
+        return _enqueue_pob_import(request, guide=None)
 
+    form = PobStringForm()
     return render(request, 'pob_string_form.html', {'form': form})
 
 
 def edit_pob_view(request, pk):
     if request.method == 'POST':
-        form = PobStringForm(request.POST)
-        if form.is_valid():
-            build_details, pob_string = form.cleaned_data['pob_input']
-            guide = BuildGuide.objects.get(guide_id=pk)
-            build_guide.assign_pob_details_to_guide(guide, build_details, pob_string, skill_tree_service)
-            return redirect('edit_guide', pk=guide.guide_id)
+        guide = BuildGuide.objects.get(guide_id=pk)
+        if request.user.userprofile != guide.author:
+            return HttpResponseForbidden()
+        return _enqueue_pob_import(request, guide=guide)
 
-    else:
-        form = PobStringForm()
+    form = PobStringForm()
     return render(request, 'pob_string_form.html', {'pk': pk, 'form': form})
 
 
+def _enqueue_pob_import(request, guide):
+    form = PobStringForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': [error for errors in form.errors.values() for error in errors]}, status=400)
+    job = import_jobs.enqueue_import(request.user.userprofile, form.cleaned_data['pob_input'], guide)
+    return JsonResponse({'job_id': job.job_id, 'status_url': reverse('import_job_status', args=[job.job_id])},
+                        status=202)
+
+
+def import_job_status_view(request, job_id):
+    job = get_object_or_404(PobImportJob, job_id=job_id, author=request.user.userprofile)
+    response = {
+        'job_id': job.job_id,
+        'status': job.get_status_display(),
+        'attempts': job.attempts,
+        'stage_timings': job.stage_timings,
+    }
+    if job.status == PobImportJob.JobStatus.DONE:
+        response['redirect_url'] = reverse('edit_guide', args=[job.guide_id])
+    elif job.status == PobImportJob.JobStatus.FAILED:
+        response['error'] = job.error_message
+    return JsonResponse(response)
+
+
 def publish_guide_view(request, pk):
     draft = BuildGuide.objects.get(guide_id=pk)
 
@@ -252,11 +273,13 @@ def edit_guide_view(request, pk):
         return HttpResponseForbidden
     draft_guide = guide if guide.status == BuildGuide.GuideStatus.DRAFT else guide.draft
     # Form field requires (value, label) tuples for options, list of those is created here
-    active_skills = set((gem.name, gem.name) for skill_group in draft_guide.pob_details.skill_groups
+    snapshot = draft_guide.snapshot
+    active_skills = set((gem.name, gem.name) for skill_group in snapshot.pob_skill_groups['skill_groups']
                         for gem in skill_group.gems
                         if gem.is_active_skill and not skill_group.is_ignored)
     active_skills = list(active_skills)
-    imported_primary_skill = draft_guide.pob_details.imported_primary_skill
+    imported_primary_skill = snapshot.pob_summary['imported_primary_skill']
+    item_html_store.load_items_html(snapshot.pob_gear['items'])
     active_skills.sort(key=lambda v: v[0] == imported_primary_skill, reverse=True)
 
     if request.method == 'POST':
@@ -273,7 +296,8 @@ def edit_guide_view(request, pk):
             draft_guide.video_url = form.cleaned_data['video_url']
             if imported_primary_skill not in primary_skills_names:
                 primary_skills_names.insert(0, imported_primary_skill)
-            draft_guide.pob_details.main_active_skills = primary_skills_names
+            draft_guide.snapshot = build_snapshots.with_summary_changes(snapshot,
+                                                                        main_active_skills=primary_skills_names)
             draft_guide.primary_skills.clear()
             draft_guide.primary_skills.add(*ActiveSkill.objects.filter(name__in=primary_skills_names).all())
 
@@ -290,7 +314,7 @@ def edit_guide_view(request, pk):
         form = EditGuideForm(active_skills, initial={'title': draft_guide.title,
                                                      'text': draft_guide.text,
                                                      'video_url': draft_guide.video_url,
-                                                     'primary_skills': draft_guide.pob_details.main_active_skills})
+                                                     'primary_skills': snapshot.pob_summary['main_active_skills']})
     return render(request, 'edit_guide.html', {'form': form, 'pk': pk, 'guide': draft_guide})
 
 
@@ -1,3 +1,5 @@
 __version__ = '0.1.0'
 
-from .pob import ExternalError, PathOfBuilding
+from .pob import ExternalError, PathOfBuilding, read_pob_version
+from .pool import PathOfBuildingPool, PoolTimeoutError
+from .process_wrapper import AsyncProcessWrapper, ProcessWrapper
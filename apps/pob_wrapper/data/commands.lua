@@ -92,6 +92,19 @@ function commands.testItemForDisplay(itemText)
     return results
 end
 
+function commands.testItemsForDisplay(itemTexts)
+    local results = {}
+    for i, itemText in ipairs(itemTexts) do
+        local success, lines = pcall(pobinterface.testItemForDisplay, itemText)
+        if success then
+            results[i] = {status='success', result=lines}
+        else
+            results[i] = {status='run_fail', error=tostring(lines)}
+        end
+    end
+    return results
+end
+
 function commands.importBuild(accountName, charName)
     local results = pobinterface.importBuild(accountName, charName)
     return results
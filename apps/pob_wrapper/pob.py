@@ -2,6 +2,7 @@ import atexit
 import os
 import platform
 import re
+import xml.etree.ElementTree as ET
 from typing import *
 
 import pkg_resources
@@ -39,6 +40,15 @@ class ExternalError(Exception):
         super().__init__()
 
 
+def read_pob_version(pob_path) -> str:
+    '''Version of the PoB installation, as declared in its manifest.xml.'''
+    try:
+        version_xml = ET.parse(os.path.join(pob_path, 'manifest.xml')).getroot().find('Version')
+        return version_xml.get('number', 'unknown')
+    except (OSError, ET.ParseError, AttributeError):
+        return 'unknown'
+
+
 def _num_string(value):
     return f'{value:.10g}'
 
@@ -66,6 +76,23 @@ def _mark_item_groups(output):
     return output
 
 
+def _item_lines_to_html(lines):
+    if not lines:
+        return None
+    # Convert the output to HTML
+    lines = [_pob_line_to_html(line) for line in lines]
+    output = '\n'.join(lines)
+    output = _mark_item_groups(output)
+    regex = r'\n<hr/>\n</div>\n<hr/>\n<div class="results">.*$'
+    result = re.sub(regex, '', output, flags=re.S)
+    regex = r'\n<hr/>\n<div class="results">.*$'
+    result = re.sub(regex, '', result, flags=re.S)
+    regex = r'(<hr/>|\n)+$'
+    result = re.sub(regex, '', result, flags=re.S)
+
+    return result + '</div>'
+
+
 def _calculate_diff(base_values, new_values):
     fields = set(base_values.keys()) | set(new_values.keys())
     changes = dict()
@@ -83,7 +110,7 @@ def _calculate_diff(base_values, new_values):
 
 
 class PathOfBuilding:
-    def __init__(self, pob_path, pob_install, verbose=False):
+    def __init__(self, pob_path, pob_install, verbose=False, timeout=None, start_timeout=None):
         self.verbose = verbose and True
         data_dir = pkg_resources.resource_filename('pob_wrapper', 'data')
 
@@ -94,7 +121,7 @@ class PathOfBuilding:
         os.environ['POB_SCRIPTPATH'] = pob_path
         os.environ['POB_RUNTIMEPATH'] = pob_install
 
-        self.pob = ProcessWrapper(debug=self.verbose)
+        self.pob = ProcessWrapper(debug=self.verbose, timeout=timeout, start_timeout=start_timeout)
         if platform.system() == 'Windows':
             self.pob.start([f'{data_dir}/luajit.exe', f'{data_dir}/cli.lua'], cwd=pob_path)
         else:
@@ -124,21 +151,28 @@ class PathOfBuilding:
         '''Run the item through the tester, returning an HTML representation of the effects.'''
         item_text = safe_string(item_text)
         lines = self._send(f'testItemForDisplay("{item_text}")')
-
-        if not lines:
-            return None
-        # Convert the output to HTML
-        lines = [_pob_line_to_html(line) for line in lines]
-        output = '\n'.join(lines)
-        output = _mark_item_groups(output)
-        regex = r'\n<hr/>\n</div>\n<hr/>\n<div class="results">.*$'
-        result = re.sub(regex, '', output, flags=re.S)
-        regex = r'\n<hr/>\n<div class="results">.*$'
-        result = re.sub(regex, '', result, flags=re.S)
-        regex = r'(<hr/>|\n)+$'
-        result = re.sub(regex, '', result, flags=re.S)
-
-        return result + '</div>'
+        return _item_lines_to_html(lines)
+
+    def items_as_html(self, item_texts: List[str]) -> List[Union[str, None, ExternalError]]:
+        '''Run all the items through the tester in a single round trip.
+
+        Results keep the order of `item_texts`. An item that failed in Lua is reported as an ExternalError
+        in its place instead of failing the whole batch, an item PoB can't display is reported as None.
+        '''
+        if not item_texts:
+            return []
+        items_table = ', '.join(f'"{safe_string(item_text)}"' for item_text in item_texts)
+        results = self._send(f'testItemsForDisplay({{{items_table}}})')
+        if len(results) != len(item_texts):
+            raise ExternalError({'status': 'batch_size_mismatch', 'result': results})
+
+        items_html = []
+        for result in results:
+            if result['status'] != 'success':
+                items_html.append(ExternalError(result))
+            else:
+                items_html.append(_item_lines_to_html(result.get('result', None)))
+        return items_html
 
     def import_build_as_xml(self, account_name, char_name):
         lines = self._send(f'importBuild("{account_name}", "{char_name}")')
@@ -182,6 +216,9 @@ class PathOfBuilding:
 
     direct_send = _send
 
+    def is_alive(self):
+        return self.pob is not None and self.pob.is_alive()
+
     def kill(self):
         if self.pob:
             self.pob.kill()
@@ -0,0 +1,160 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import *
+
+from .pob import ExternalError, PathOfBuilding
+
+__all__ = [
+    'PathOfBuildingPool',
+    'PoolTimeoutError',
+]
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class _Worker:
+    def __init__(self, pob: PathOfBuilding):
+        self.pob = pob
+        self.uses = 0
+
+
+class PathOfBuildingPool:
+    '''Keeps up to `size` warm PathOfBuilding processes and lends them out one caller at a time.
+
+    Workers are started lazily on first demand and recycled after `max_requests` checkouts,
+    or as soon as they are returned broken (crashed process, broken pipe, garbled output).
+    '''
+
+    def __init__(self, pob_path, pob_install, size=2, max_requests=200, verbose=False, timeout=None,
+                 start_timeout=None):
+        self.pob_path = pob_path
+        self.pob_install = pob_install
+        self.size = size
+        self.max_requests = max_requests
+        self.verbose = verbose
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+
+        self._condition = threading.Condition()
+        self._idle: List[_Worker] = []
+        self._busy: Dict[int, _Worker] = {}
+        self._starting = 0
+        self._waiting = 0
+        self._started_count = 0
+        self._recycled_count = 0
+        self._checkout_count = 0
+        self._closed = False
+
+    def checkout(self, timeout=None) -> PathOfBuilding:
+        '''Borrow a worker, starting a new one if the pool is not full yet.'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        dead_workers = []
+        try:
+            with self._condition:
+                self._waiting += 1
+                try:
+                    while True:
+                        if self._closed:
+                            raise RuntimeError('PathOfBuilding pool is closed')
+                        while self._idle:
+                            worker = self._idle.pop()
+                            if worker.pob.is_alive():
+                                return self._lend(worker)
+                            dead_workers.append(self._retire(worker))
+                        if self._worker_count() < self.size:
+                            self._starting += 1
+                            break
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise PoolTimeoutError(f'No PathOfBuilding worker available within {timeout}s')
+                        self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+        finally:
+            _kill(dead_workers)
+
+        # starting Lua takes a while, don't hold the lock meanwhile
+        try:
+            worker = _Worker(PathOfBuilding(self.pob_path, self.pob_install, verbose=self.verbose,
+                                            timeout=self.timeout, start_timeout=self.start_timeout))
+        except BaseException:
+            with self._condition:
+                self._starting -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._starting -= 1
+            self._started_count += 1
+            return self._lend(worker)
+
+    def checkin(self, pob: PathOfBuilding, broken=False):
+        '''Return a borrowed worker. Broken or worn out workers are killed instead of reused.'''
+        retired_workers = []
+        with self._condition:
+            worker = self._busy.pop(id(pob))
+            if broken or self._closed or worker.uses >= self.max_requests or not pob.is_alive():
+                retired_workers.append(self._retire(worker))
+            else:
+                self._idle.append(worker)
+            self._condition.notify()
+        _kill(retired_workers)
+
+    @contextmanager
+    def borrow(self, timeout=None) -> Iterator[PathOfBuilding]:
+        pob = self.checkout(timeout)
+        broken = False
+        try:
+            yield pob
+        except (ExternalError, TimeoutError, EOFError):
+            # either reported by Lua itself or already handled by restarting the process,
+            # if the restart failed as well the dead worker is dropped on checkin
+            raise
+        except BaseException:
+            broken = True
+            raise
+        finally:
+            self.checkin(pob, broken=broken)
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                'size': self.size,
+                'workers': self._worker_count(),
+                'idle': len(self._idle),
+                'busy': len(self._busy),
+                'queue_depth': self._waiting,
+                'started': self._started_count,
+                'recycled': self._recycled_count,
+                'checkouts': self._checkout_count,
+            }
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            retired_workers = [self._retire(worker) for worker in self._idle]
+            self._idle = []
+            self._condition.notify_all()
+        _kill(retired_workers)
+
+    def _lend(self, worker: _Worker) -> PathOfBuilding:
+        worker.uses += 1
+        self._checkout_count += 1
+        self._busy[id(worker.pob)] = worker
+        return worker.pob
+
+    def _retire(self, worker: _Worker) -> _Worker:
+        '''Counts a worker that was taken out of the pool, it's killed by the caller once the lock is released.'''
+        self._recycled_count += 1
+        return worker
+
+    def _worker_count(self):
+        return len(self._idle) + len(self._busy) + self._starting
+
+
+def _kill(workers: List[_Worker]):
+    # shutting LuaJIT down can take a while, never done while holding the pool's lock
+    for worker in workers:
+        worker.pob.kill()
@@ -1,11 +1,16 @@
+import asyncio
 import json
 import os
+import queue
 import sys
+import threading
 from subprocess import PIPE
 from subprocess import Popen
+from subprocess import TimeoutExpired
 from typing import *
 
 __all__ = [
+    'AsyncProcessWrapper',
     'ProcessWrapper',
     'safe_string',
 ]
@@ -14,6 +19,12 @@ START_MSG = '!*>>>>>>>>>>>>*!'
 START_RESULT = '!*------------*!'
 END_RESULT = '!*<<<<<<<<<<<<*!'
 
+# a batch of rendered items comes back as a single JSON line
+STREAM_LINE_LIMIT = 64 * 1024 * 1024
+
+# seconds a sub-process gets to exit after being terminated, before it is killed outright
+KILL_TIMEOUT = 5
+
 
 def safe_string(txt):
     txt = txt.replace('\\', '\\\\')
@@ -22,39 +33,170 @@ def safe_string(txt):
     return txt
 
 
+def _escape_line(line):
+    return line.replace('\n', '\\n')
+
+
+def _pump_lines(stream, lines: queue.Queue):
+    for line in iter(stream.readline, ''):
+        lines.put(line)
+    lines.put(None)
+
+
 class ProcessWrapper:
-    '''Starts a sub-process that can be used in a simple question/response pattern.'''
+    '''Starts a sub-process that can be used in a simple question/response pattern.
+
+    Calls to `send` are serialised with a lock, so one wrapper can be shared between threads.
+    When a response doesn't arrive within `timeout` seconds, the stream ends or the framing is broken,
+    the sub-process is restarted before the error is raised, so the next call starts from a clean state.
+    '''
     process: Popen
 
     receive_msg_fn = lambda self, msg: print("Lua: " + msg if msg else '', end='')
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, timeout=None, start_timeout=None):
         self.debug = debug and True
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.restart_count = 0
+        self._lock = threading.RLock()
+        self._args = None
+        self._cwd = None
+        self._lines: queue.Queue = queue.Queue()
 
     def start(self, args: List[str], cwd=None):
-        cwd = cwd or os.getcwd()
-        self.process = Popen(args, stdin=PIPE, stdout=PIPE, stderr=sys.stderr, universal_newlines=True, cwd=cwd,
-                             bufsize=1, encoding='utf-8')
-        firstline = self.process.stdout.readline()
-        if firstline == '':
-            err = self.process.stderr.readline()
-            raise EOFError(f"Unable to start subprocess: {err}")
-        if self.debug:
-            print('===', firstline)
+        with self._lock:
+            self._args = args
+            self._cwd = cwd or os.getcwd()
+            self.process = Popen(args, stdin=PIPE, stdout=PIPE, stderr=sys.stderr, universal_newlines=True,
+                                 cwd=self._cwd, bufsize=1, encoding='utf-8')
+            self._lines = queue.Queue()
+            threading.Thread(target=_pump_lines, args=(self.process.stdout, self._lines), daemon=True).start()
+            try:
+                firstline = self.get(self.start_timeout)
+            except (EOFError, TimeoutError) as err:
+                self.kill()
+                raise EOFError(f"Unable to start subprocess: {err}")
+            if self.debug:
+                print('===', firstline)
+
+    def restart(self):
+        with self._lock:
+            self.restart_count += 1
+            self.kill()
+            self.start(self._args, self._cwd)
+
+    def send(self, txt, ignore_result=False, timeout=None):
+        timeout = timeout if timeout is not None else self.timeout
+        with self._lock:
+            try:
+                result_txt = self._exchange(txt, timeout)
+            except (EOFError, TimeoutError, ValueError):
+                self.restart()
+                raise
 
-    def send(self, txt, ignore_result=False):
-        '''Not yet thread-safe!'''
+        if ignore_result:
+            return True
+
+        result = json.loads(result_txt)
+        return result
+
+    def _exchange(self, txt, timeout):
         self.put(txt)
 
-        self.expect(START_MSG)
+        self.expect(START_MSG, timeout)
         while True:
-            msg = self.get()
+            msg = self.get(timeout)
             if msg.startswith(START_RESULT):
                 break
             self.receive_msg_fn(msg)
 
-        result_txt = self.get()
-        self.expect(END_RESULT)
+        result_txt = self.get(timeout)
+        self.expect(END_RESULT, timeout)
+        return result_txt
+
+    def kill(self):
+        with self._lock:
+            self.process.terminate()
+            try:
+                self.process.wait(KILL_TIMEOUT)
+            except TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def get(self, timeout=None):
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No response from subprocess within {timeout}s")
+        if line is None: raise EOFError("Subprocess stream ended")
+        if self.debug: print('>>>', line)
+        return line
+
+    def put(self, line):
+        line = _escape_line(line)
+        if self.debug: print('<<<', line)
+        try:
+            self.process.stdin.write(line)
+            self.process.stdin.write('\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError) as err:
+            raise EOFError(f"Subprocess stream closed: {err}")
+
+    def expect(self, pattern, timeout=None):
+        line = self.get(timeout)
+        if not line.startswith(pattern):
+            raise ValueError(f"Received {line} instead of pattern {pattern}")
+        return line
+
+
+class AsyncProcessWrapper:
+    '''asyncio counterpart of ProcessWrapper, built on asyncio.create_subprocess_exec.
+
+    Calls are serialised with an asyncio.Lock, timeouts and a closed stream restart the sub-process.
+    '''
+    process: asyncio.subprocess.Process
+
+    receive_msg_fn = lambda self, msg: print("Lua: " + msg if msg else '', end='')
+
+    def __init__(self, debug=False, timeout=None, start_timeout=None):
+        self.debug = debug and True
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.restart_count = 0
+        self._lock = asyncio.Lock()
+        self._args = None
+        self._cwd = None
+
+    async def start(self, args: List[str], cwd=None):
+        self._args = args
+        self._cwd = cwd or os.getcwd()
+        self.process = await asyncio.create_subprocess_exec(*args, stdin=PIPE, stdout=PIPE, stderr=sys.stderr,
+                                                            cwd=self._cwd, limit=STREAM_LINE_LIMIT)
+        try:
+            firstline = await self.get(self.start_timeout)
+        except (EOFError, TimeoutError) as err:
+            await self.kill()
+            raise EOFError(f"Unable to start subprocess: {err}")
+        if self.debug:
+            print('===', firstline)
+
+    async def restart(self):
+        self.restart_count += 1
+        await self.kill()
+        await self.start(self._args, self._cwd)
+
+    async def send(self, txt, ignore_result=False, timeout=None):
+        timeout = timeout if timeout is not None else self.timeout
+        async with self._lock:
+            try:
+                result_txt = await self._exchange(txt, timeout)
+            except (EOFError, TimeoutError, ValueError):
+                await self.restart()
+                raise
 
         if ignore_result:
             return True
@@ -62,25 +204,49 @@ class ProcessWrapper:
         result = json.loads(result_txt)
         return result
 
-    def kill(self):
-        self.process.terminate()
-        self.process.wait()
+    async def _exchange(self, txt, timeout):
+        await self.put(txt)
 
-    def get(self):
-        line = self.process.stdout.readline()
-        if line == '': raise EOFError("Subprocess stream ended")
+        await self.expect(START_MSG, timeout)
+        while True:
+            msg = await self.get(timeout)
+            if msg.startswith(START_RESULT):
+                break
+            self.receive_msg_fn(msg)
+
+        result_txt = await self.get(timeout)
+        await self.expect(END_RESULT, timeout)
+        return result_txt
+
+    async def kill(self):
+        if self.process.returncode is None:
+            self.process.terminate()
+        await self.process.wait()
+
+    def is_alive(self):
+        return self.process.returncode is None
+
+    async def get(self, timeout=None):
+        try:
+            line = await asyncio.wait_for(self.process.stdout.readline(), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No response from subprocess within {timeout}s")
+        if line == b'': raise EOFError("Subprocess stream ended")
+        line = line.decode('utf-8')
         if self.debug: print('>>>', line)
         return line
 
-    def put(self, line):
-        line = line.replace('\n', '\\n')
+    async def put(self, line):
+        line = _escape_line(line)
         if self.debug: print('<<<', line)
-        self.process.stdin.write(line)
-        self.process.stdin.write('\n')
-        self.process.stdin.flush()
-
-    def expect(self, pattern):
-        line = self.get()
+        try:
+            self.process.stdin.write(line.encode('utf-8') + b'\n')
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as err:
+            raise EOFError(f"Subprocess stream closed: {err}")
+
+    async def expect(self, pattern, timeout=None):
+        line = await self.get(timeout)
         if not line.startswith(pattern):
             raise ValueError(f"Received {line} instead of pattern {pattern}")
         return line